@@ -0,0 +1,307 @@
+from __future__ import annotations
+import copy
+import config
+import utils
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional
+
+METRICS = ("request_count", "error_count", "avg_response_time_ms")
+
+
+class _MetricBaseline:
+    """
+    EWMA mean and EWMA absolute deviation for one metric of one endpoint.
+
+    The robust z-score divides by the scaled absolute deviation, floored at
+    min_deviation so a flat baseline does not turn every blip into a spike.
+    Anomalous values are clipped before they update the baseline so a long
+    spike does not teach the detector that the spike is normal.
+    """
+
+    __slots__ = ("mean", "abs_dev", "observations")
+
+    def __init__(self):
+        self.mean = 0.0
+        self.abs_dev = 0.0
+        self.observations = 0
+
+    def score(self, value: float, min_deviation: float) -> float:
+        scale = max(1.2533 * self.abs_dev, min_deviation)
+        return (value - self.mean) / scale
+
+    def update(self, value: float, alpha: float, clip_z: float, min_deviation: float) -> None:
+        if self.observations == 0:
+            self.mean = value
+        else:
+            scale = max(1.2533 * self.abs_dev, min_deviation)
+            value = min(value, self.mean + clip_z * scale)
+            deviation = abs(value - self.mean)
+            self.mean += alpha * (value - self.mean)
+            self.abs_dev += alpha * (deviation - self.abs_dev)
+        self.observations += 1
+
+
+class _EndpointState:
+    """Open bucket, baselines and anomalies of one endpoint, plus the head kept for merges."""
+
+    __slots__ = (
+        "bucket", "requests", "errors", "response_time_sum", "baselines", "open", "anomalies",
+        "first_bucket", "head", "handoff_bucket", "head_open", "head_closed"
+    )
+
+    def __init__(self, bucket: int):
+        self.bucket = bucket
+        self.requests = 0
+        self.errors = 0
+        self.response_time_sum = 0.0
+        self.baselines = {metric: _MetricBaseline() for metric in METRICS}
+        self.open: Dict[str, Dict[str, Any]] = {}
+        self.anomalies: List[Dict[str, Any]] = []
+        self.first_bucket = bucket
+        # [bucket, requests, errors, response_time_sum] of the buckets before the handoff
+        self.head: List[List[float]] = []
+        self.handoff_bucket: Optional[int] = None
+        self.head_open: Dict[str, Dict[str, Any]] = {}
+        self.head_closed = 0
+
+
+class AnomalyDetector:
+    """
+    Single-pass detector for latency spikes, traffic spikes and error surges.
+
+    Records are grouped into fixed time buckets per endpoint. When a bucket
+    closes, each metric is scored against its EWMA baseline; consecutive
+    anomalous buckets are merged into one anomaly record. State per endpoint
+    is constant: one open bucket, one baseline and at most one open anomaly
+    per metric, plus the totals of the first merge_replay_buckets buckets
+    with traffic.
+
+    Records are expected in time order. A record that belongs to an already
+    closed bucket is counted in the current one.
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or config.ANOMALY_DETECTION
+        self.bucket_seconds = settings["bucket_seconds"]
+        self.alpha = settings["ewma_alpha"]
+        self.warmup_buckets = settings["warmup_buckets"]
+        self.max_gap_buckets = settings["max_gap_buckets"]
+        self.replay_buckets = settings["merge_replay_buckets"]
+        self.thresholds = settings["z_score_thresholds"]
+        self.min_deviation = settings["min_deviation"]
+        self._endpoints: Dict[str, _EndpointState] = {}
+
+    def add(self, endpoint: str, ts: float, response_time_ms: float, is_error: bool) -> None:
+        self.add_bucket(endpoint, int(ts // self.bucket_seconds), 1, 1 if is_error else 0, response_time_ms)
+
+    def add_record(self, log: Dict[str, Any], epoch_seconds: float, is_error: bool, execution_cost: float, memory_cost: float) -> None:
+        self.add_bucket(log["endpoint"], int(epoch_seconds // self.bucket_seconds), 1, 1 if is_error else 0, log["response_time_ms"])
+
+    def add_bucket(self, endpoint: str, bucket: int, requests: int, errors: int, response_time_sum: float) -> None:
+        """Fold in the totals of several records of one bucket at once."""
+        state = self._endpoints.get(endpoint)
+        if state is None:
+            state = self._endpoints[endpoint] = _EndpointState(bucket)
+        self._feed(endpoint, state, bucket, requests, errors, response_time_sum)
+
+    def _feed(self, endpoint: str, state: _EndpointState, bucket: int, requests: int, errors: int, response_time_sum: float) -> None:
+        if bucket > state.bucket:
+            self._advance(endpoint, state, bucket)
+        state.requests += requests
+        state.errors += errors
+        state.response_time_sum += response_time_sum
+
+    def _advance(self, endpoint: str, state: _EndpointState, bucket: int) -> None:
+        if state.handoff_bucket is None:
+            state.head.append([state.bucket, state.requests, state.errors, state.response_time_sum])
+        self._close_bucket(endpoint, state)
+        # Idle buckets count as zero traffic
+        gap = min(bucket - state.bucket - 1, self.max_gap_buckets)
+        for offset in range(gap, 0, -1):
+            state.bucket = bucket - offset
+            self._close_bucket(endpoint, state)
+        state.bucket = bucket
+
+        # Latency is only scored in buckets with traffic, so it is the slowest baseline to settle
+        if state.handoff_bucket is None and state.baselines["avg_response_time_ms"].observations >= self.replay_buckets:
+            # From here on the baselines have forgotten how this shard started,
+            # so a merge only has to replay the head (see merge())
+            state.handoff_bucket = bucket
+            state.head_open = state.open
+            state.open = {}
+            state.head_closed = len(state.anomalies)
+
+    def merge(self, other: "AnomalyDetector") -> "AnomalyDetector":
+        """
+        Fold in a detector built over another time range, in either order.
+
+        The later range's head is replayed on top of the earlier range; past
+        the head the later range's own state is used. That matches a single
+        pass once the EWMA has settled, which it has to within
+        (1 - ewma_alpha) ** merge_replay_buckets. Ranges are expected not to
+        overlap per endpoint: replayed buckets the earlier range has already
+        passed are counted in its open bucket.
+        """
+        if other.bucket_seconds != self.bucket_seconds or other.replay_buckets != self.replay_buckets:
+            raise ValueError("Cannot merge anomaly detectors with different bucket settings")
+        for endpoint, theirs in other._endpoints.items():
+            theirs = copy.deepcopy(theirs)
+            mine = self._endpoints.get(endpoint)
+            if mine is None:
+                self._endpoints[endpoint] = theirs
+            elif (theirs.first_bucket, theirs.bucket) < (mine.first_bucket, mine.bucket):
+                self._endpoints[endpoint] = self._stitch(endpoint, theirs, mine)
+            else:
+                self._stitch(endpoint, mine, theirs)
+        return self
+
+    def _stitch(self, endpoint: str, earlier: _EndpointState, later: _EndpointState) -> _EndpointState:
+        for bucket, requests, errors, response_time_sum in later.head:
+            self._feed(endpoint, earlier, bucket, requests, errors, response_time_sum)
+        if later.handoff_bucket is None:
+            self._feed(endpoint, earlier, later.bucket, later.requests, later.errors, later.response_time_sum)
+            return earlier
+
+        if later.handoff_bucket > earlier.bucket:
+            self._advance(endpoint, earlier, later.handoff_bucket)
+        else:
+            # Overlapping ranges: still score what the earlier range has open
+            self._close_bucket(endpoint, earlier)
+        if later.bucket > later.handoff_bucket:
+            anomalies = later.anomalies[later.head_closed:]
+            self._rejoin(earlier.open, anomalies, later.open, later.handoff_bucket)
+            earlier.anomalies.extend(anomalies)
+            earlier.open = later.open
+        earlier.baselines = later.baselines
+        earlier.bucket = later.bucket
+        earlier.requests = later.requests
+        earlier.errors = later.errors
+        earlier.response_time_sum = later.response_time_sum
+        return earlier
+
+    def _rejoin(
+        self,
+        before: Dict[str, Dict[str, Any]],
+        anomalies: List[Dict[str, Any]],
+        open_anomalies: Dict[str, Dict[str, Any]],
+        bucket: int
+    ) -> None:
+        """Join the anomalies still open before `bucket` with the ones that start at it."""
+        start = utils.format_timestamp(bucket * self.bucket_seconds)
+        for metric, first in before.items():
+            after = open_anomalies.get(metric)
+            if after is not None and after["start"] == start:
+                open_anomalies[metric] = self._join(first, after)
+                continue
+            for i, after in enumerate(anomalies):
+                if after["metric"] == metric and after["start"] == start:
+                    anomalies[i] = self._join(first, after)
+                    break
+            else:
+                anomalies.append(first)
+
+    def _join(self, first: Dict[str, Any], second: Dict[str, Any]) -> Dict[str, Any]:
+        joined = dict(first)
+        joined["end"] = second["end"]
+        if second["magnitude"] > first["magnitude"]:
+            for key in ("peak_value", "expected_value", "magnitude"):
+                joined[key] = second[key]
+        if config.SEVERITY_ORDER[second["severity"]] < config.SEVERITY_ORDER[first["severity"]]:
+            joined["severity"] = second["severity"]
+        return joined
+
+    def _close_bucket(self, endpoint: str, state: _EndpointState) -> None:
+        values = {
+            "request_count": state.requests,
+            "error_count": state.errors
+        }
+        if state.requests:
+            values["avg_response_time_ms"] = state.response_time_sum / state.requests
+
+        for metric, value in values.items():
+            baseline = state.baselines[metric]
+            min_deviation = self.min_deviation[metric]
+            severity = "low"
+            z_score = 0.0
+            if baseline.observations >= self.warmup_buckets:
+                z_score = baseline.score(value, min_deviation)
+                severity = utils.calculate_severity(z_score, self.thresholds)
+
+            if severity != "low":
+                self._extend_anomaly(endpoint, state, metric, value, baseline.mean, z_score, severity)
+            elif metric in state.open:
+                state.anomalies.append(state.open.pop(metric))
+
+            baseline.update(value, self.alpha, self.thresholds["medium"], min_deviation)
+
+        state.requests = 0
+        state.errors = 0
+        state.response_time_sum = 0.0
+
+    def _extend_anomaly(
+        self,
+        endpoint: str,
+        state: _EndpointState,
+        metric: str,
+        value: float,
+        expected: float,
+        z_score: float,
+        severity: str
+    ) -> None:
+        bucket_start = state.bucket * self.bucket_seconds
+        bucket_end = bucket_start + self.bucket_seconds
+
+        anomaly = state.open.get(metric)
+        if anomaly is None:
+            state.open[metric] = {
+                "endpoint": endpoint,
+                "metric": metric,
+                "start": utils.format_timestamp(bucket_start),
+                "end": utils.format_timestamp(bucket_end),
+                "peak_value": round(value, 1),
+                "expected_value": round(expected, 1),
+                "magnitude": round(z_score, 1),
+                "severity": severity
+            }
+            return
+
+        anomaly["end"] = utils.format_timestamp(bucket_end)
+        # Compared as rounded, so an anomaly split at a merge joins back the same way
+        if round(z_score, 1) > anomaly["magnitude"]:
+            anomaly["peak_value"] = round(value, 1)
+            anomaly["expected_value"] = round(expected, 1)
+            anomaly["magnitude"] = round(z_score, 1)
+        if config.SEVERITY_ORDER[severity] < config.SEVERITY_ORDER[anomaly["severity"]]:
+            anomaly["severity"] = severity
+
+    def finalize(self) -> List[Dict[str, Any]]:
+        """All anomalies so far, counting the open buckets as closed, most severe first; the detector can keep going."""
+        anomalies = []
+        for endpoint, state in self._endpoints.items():
+            closing = copy.copy(state)
+            closing.baselines = {metric: copy.copy(baseline) for metric, baseline in state.baselines.items()}
+            closing.open = {metric: dict(anomaly) for metric, anomaly in state.open.items()}
+            closing.anomalies = state.anomalies[state.head_closed:]
+            self._close_bucket(endpoint, closing)
+            if state.handoff_bucket is not None:
+                self._rejoin(state.head_open, closing.anomalies, closing.open, state.handoff_bucket)
+            anomalies.extend(state.anomalies[:state.head_closed])
+            anomalies.extend(closing.anomalies)
+            anomalies.extend(closing.open.values())
+        # Ties in a fixed order, however the shards were merged
+        anomalies.sort(key=lambda x: (config.SEVERITY_ORDER.get(x["severity"], 999), x["start"], x["endpoint"], x["metric"]))
+        return anomalies
+
+
+def _detect_anomalies(logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+
+    detector = AnomalyDetector()
+    for log in logs:
+        detector.add(
+            log["endpoint"],
+            utils.as_utc(log["timestamp"]).timestamp(),
+            log["response_time_ms"],
+            utils.is_error_status(log["status_code"])
+        )
+    return detector.finalize()
@@ -0,0 +1,203 @@
+from __future__ import annotations
+from collections import deque
+import config
+import utils
+from advanced_features.caching import InterArrivalHistogram
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+
+class _Window:
+
+    __slots__ = ("seconds", "recent", "ingress", "egress", "peak_ingress", "peak_ingress_end", "peak_egress", "peak_egress_end")
+
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+        # (second, ingress, egress) for the seconds inside the window, oldest first
+        self.recent: Deque[Tuple[int, float, float]] = deque()
+        self.ingress = 0.0
+        self.egress = 0.0
+        self.peak_ingress = 0.0
+        self.peak_ingress_end: Optional[int] = None
+        self.peak_egress = 0.0
+        self.peak_egress_end: Optional[int] = None
+
+    def push(self, second: int, ingress: float, egress: float) -> None:
+        recent = self.recent
+        recent.append((second, ingress, egress))
+        self.ingress += ingress
+        self.egress += egress
+        oldest = second - self.seconds
+        while recent[0][0] <= oldest:
+            _, old_ingress, old_egress = recent.popleft()
+            self.ingress -= old_ingress
+            self.egress -= old_egress
+        self.peak(second, self.ingress, self.egress)
+
+    def peak(self, second: int, ingress: float, egress: float) -> None:
+        if ingress > self.peak_ingress:
+            self.peak_ingress, self.peak_ingress_end = ingress, second
+        if egress > self.peak_egress:
+            self.peak_egress, self.peak_egress_end = egress, second
+
+
+class ThroughputTracker:
+    """
+    Peak ingress and egress throughput over sliding windows, in one time-ordered pass.
+
+    Bytes are summed per whole second; when a second completes it is pushed
+    into every window, each of which keeps only the seconds it spans and a
+    running total. So the work is per active second, not per record, and a
+    window holds at most its length in entries. A record older than the
+    current second is counted in the current second.
+
+    Merged shards keep the higher peak; a burst that straddles the boundary
+    between two shards may be underestimated.
+    """
+
+    def __init__(self, windows_seconds: Optional[Sequence[int]] = None):
+        if windows_seconds is None:
+            windows_seconds = config.BANDWIDTH["throughput_windows_seconds"]
+        if any(int(seconds) != seconds or seconds < 1 for seconds in windows_seconds):
+            raise ValueError("Throughput windows must be whole numbers of seconds")
+        self.windows = [_Window(int(seconds)) for seconds in windows_seconds]
+        self.second: Optional[int] = None
+        self.ingress = 0.0
+        self.egress = 0.0
+
+    def add(self, epoch_seconds: float, request_bytes: float, response_bytes: float) -> None:
+        second = int(epoch_seconds)
+        if self.second is None or second > self.second:
+            if self.second is not None:
+                for window in self.windows:
+                    window.push(self.second, self.ingress, self.egress)
+            self.second = second
+            self.ingress = 0.0
+            self.egress = 0.0
+        self.ingress += request_bytes
+        self.egress += response_bytes
+
+    def add_record(self, log: Dict[str, Any], epoch_seconds: float, is_error: bool, execution_cost: float, memory_cost: float) -> None:
+        self.add(epoch_seconds, log["request_size_bytes"], log["response_size_bytes"])
+
+    def merge(self, other: "ThroughputTracker") -> "ThroughputTracker":
+        if [w.seconds for w in other.windows] != [w.seconds for w in self.windows]:
+            raise ValueError("Cannot merge throughput tracked over different windows")
+        for mine, theirs in zip(self.windows, other.peaks()):
+            mine.peak(theirs.peak_ingress_end, theirs.peak_ingress, 0.0)
+            mine.peak(theirs.peak_egress_end, 0.0, theirs.peak_egress)
+        return self
+
+    def peaks(self) -> List[_Window]:
+        """Peaks with the second in progress counted; this tracker is untouched."""
+        done = []
+        for window in self.windows:
+            copy = _Window(window.seconds)
+            copy.peak(window.peak_ingress_end, window.peak_ingress, 0.0)
+            copy.peak(window.peak_egress_end, 0.0, window.peak_egress)
+            if self.second is not None:
+                oldest = self.second - window.seconds
+                ingress, egress = self.ingress, self.egress
+                for second, second_ingress, second_egress in window.recent:
+                    if second > oldest:
+                        ingress += second_ingress
+                        egress += second_egress
+                copy.peak(self.second, ingress, egress)
+            done.append(copy)
+        return done
+
+
+def _rate(window: _Window, total: float, end: Optional[int]) -> Dict[str, Any]:
+    return {
+        "bytes_per_second": round(total / window.seconds, 1),
+        # The window covers the whole seconds up to and including end
+        "window_start": None if end is None else utils.format_timestamp(end - window.seconds + 1)
+    }
+
+
+def _cache_servable(state: Any, endpoint: str, cacheable_bytes: float) -> float:
+    # Cacheable bytes times the hit rate the endpoint would get at its recommended TTL
+    ttl = state.inter_arrival.get(endpoint, InterArrivalHistogram()).recommend_ttl()
+    return cacheable_bytes * ttl["expected_hit_rate_at_ttl"] / 100
+
+
+def _bucket_rows(state: Any, group_by: List[str]) -> Optional[List[Dict[str, Any]]]:
+    try:
+        return state.rollups.query(group_by)
+    except ValueError:
+        # No configured rollup carries time_bucket
+        return None
+
+
+def _calculate_bandwidth(state: Any) -> Dict[str, Any]:
+
+    totals = state.rollups.totals()
+    peak_buckets: Dict[str, Dict[str, Any]] = {}
+    for row in _bucket_rows(state, ["endpoint", "time_bucket"]) or ():
+        best = peak_buckets.get(row["endpoint"])
+        if best is None or row["response_bytes"] > best["response_bytes"]:
+            peak_buckets[row["endpoint"]] = row
+
+    by_endpoint = []
+    servable_total = 0.0
+    for (endpoint,), measures in state.rollups.rows(("endpoint",)):
+        egress = measures["response_bytes"]
+        servable = _cache_servable(state, endpoint, measures["cacheable_bytes"])
+        servable_total += servable
+        peak = peak_buckets.get(endpoint)
+        by_endpoint.append({
+            "endpoint": endpoint,
+            "request_count": measures["request_count"],
+            "ingress_bytes": round(measures["request_bytes"]),
+            "egress_bytes": round(egress),
+            "avg_response_bytes": round(utils.safe_divide(egress, measures["request_count"]), 1),
+            "max_response_bytes": measures["max_response_bytes"],
+            "peak_bucket_egress_bytes": None if peak is None else round(peak["response_bytes"]),
+            "peak_bucket_start": None if peak is None else peak["time_bucket"],
+            "cacheable_egress_bytes": round(measures["cacheable_bytes"]),
+            "cache_servable_egress_bytes": round(servable),
+            "cache_servable_percentage": round(utils.safe_divide(servable * 100, egress), 1)
+        })
+    by_endpoint.sort(key=lambda x: x["egress_bytes"], reverse=True)
+
+    buckets = _bucket_rows(state, ["time_bucket"])
+    if buckets is not None:
+        buckets = [
+            {"bucket_start": row["time_bucket"], "ingress_bytes": round(row["request_bytes"]), "egress_bytes": round(row["response_bytes"])}
+            for row in sorted(buckets, key=lambda row: row["time_bucket"])
+        ]
+
+    top_users = [
+        {
+            "user_id": user_id,
+            "request_count": measures["request_count"],
+            "ingress_bytes": round(measures["request_bytes"]),
+            "egress_bytes": round(measures["response_bytes"]),
+            "max_response_bytes": measures["max_response_bytes"]
+        }
+        for (user_id,), measures in state.rollups.top(("user_id",), config.BANDWIDTH["top_users"], "response_bytes")
+    ]
+
+    throughput = []
+    if state.throughput is not None:
+        for window in state.throughput.peaks():
+            throughput.append({
+                "window_seconds": window.seconds,
+                "peak_ingress": _rate(window, window.peak_ingress, window.peak_ingress_end),
+                "peak_egress": _rate(window, window.peak_egress, window.peak_egress_end)
+            })
+
+    egress = totals["response_bytes"]
+    return {
+        "ingress_bytes": round(totals["request_bytes"]),
+        "egress_bytes": round(egress),
+        "cacheable_egress_bytes": round(totals["cacheable_bytes"]),
+        "cache_servable_egress_bytes": round(servable_total),
+        "cache_servable_percentage": round(utils.safe_divide(servable_total * 100, egress), 1),
+        "bucket_seconds": state.rollups.time_bucket_seconds,
+        "throughput_peaks": throughput,
+        "by_endpoint": by_endpoint,
+        "by_time_bucket": buckets,
+        "top_users_by_egress": top_users
+    }
@@ -1,7 +1,147 @@
+from __future__ import annotations
 import config
 import utils
-from typing import Any, Dict, List
-def _analyze_caching_opportunities(logs: List[Dict[str, Any]], endpoint_stats: List[Dict[str, Any]]) -> Dict[str, Any]:
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional
+
+
+class InterArrivalHistogram:
+    """
+    Bounded histogram of gaps between consecutive GET requests to one endpoint.
+
+    Bin edges are the TTL candidates from config, so memory is fixed per
+    endpoint and the hit rate at each candidate is read straight off the
+    cumulative counts. Records are expected in time order; out-of-order
+    records are counted with a zero gap, i.e. as hits.
+
+    The hit rate models sliding expiry: every request, hit or miss, keeps
+    the entry for another TTL. A cache whose entries expire a fixed TTL
+    after the fill that stored them hits less often, so for such a cache
+    the rate is an upper bound. Simulating it would need the time of the
+    last fill per TTL candidate, which neither merges nor comes out of a
+    GROUP BY.
+
+    Two histograms over time-disjoint shards merge into exactly the
+    histogram of the combined stream: the gap across the shard boundary is
+    recovered from the stored first/last timestamps. Shards that overlap in
+    time are stitched with a zero gap, and the gaps between their
+    interleaved requests are not recovered.
+    """
+
+    def __init__(self, ttl_candidates_minutes: Optional[List[float]] = None):
+        if ttl_candidates_minutes is None:
+            ttl_candidates_minutes = config.CACHING_CRITERIA["ttl_candidates_minutes"]
+        self.edges_seconds = [minutes * 60 for minutes in sorted(ttl_candidates_minutes)]
+        # One bin per candidate plus an overflow bin for gaps above the largest TTL
+        self.counts = [0] * (len(self.edges_seconds) + 1)
+        self.request_count = 0
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+
+    def _record_gap(self, gap_seconds: float, count: int = 1) -> None:
+        for i, edge in enumerate(self.edges_seconds):
+            if gap_seconds <= edge:
+                self.counts[i] += count
+                return
+        self.counts[-1] += count
+
+    def add(self, ts: float) -> None:
+        if self.last_ts is not None:
+            self._record_gap(max(0.0, ts - self.last_ts))
+            self.last_ts = max(self.last_ts, ts)
+        else:
+            self.first_ts = ts
+            self.last_ts = ts
+        self.request_count += 1
+
+    def merge(self, other: "InterArrivalHistogram") -> "InterArrivalHistogram":
+        if other.edges_seconds != self.edges_seconds:
+            raise ValueError("cannot merge histograms with different TTL candidates")
+        if other.request_count == 0:
+            return self
+        if self.request_count == 0:
+            self.counts = list(other.counts)
+            self.request_count = other.request_count
+            self.first_ts = other.first_ts
+            self.last_ts = other.last_ts
+            return self
+
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        # Stitch the gap across the shard boundary
+        if other.first_ts >= self.last_ts:
+            self._record_gap(other.first_ts - self.last_ts)
+        elif self.first_ts >= other.last_ts:
+            self._record_gap(self.first_ts - other.last_ts)
+        else:
+            self._record_gap(0.0)
+        self.request_count += other.request_count
+        self.first_ts = min(self.first_ts, other.first_ts)
+        self.last_ts = max(self.last_ts, other.last_ts)
+        return self
+
+    def hit_rate_at(self, ttl_seconds: float) -> float:
+        """Fraction of requests (0-1) arriving within ttl_seconds of the previous one (sliding expiry)."""
+        hits = 0
+        for edge, count in zip(self.edges_seconds, self.counts):
+            if edge > ttl_seconds:
+                break
+            hits += count
+        return utils.safe_divide(hits, self.request_count)
+
+    def recommend_ttl(self, staleness_cost_per_minute: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Pick the TTL where extra hit rate stops paying for extra staleness.
+
+        Each candidate is scored as hit rate (percentage points) minus
+        staleness_cost_per_minute * TTL minutes and the best score wins.
+
+        Returns:
+            Dictionary with recommended_ttl_minutes and expected_hit_rate_at_ttl
+        """
+        if staleness_cost_per_minute is None:
+            staleness_cost_per_minute = config.CACHING_CRITERIA["staleness_cost_per_minute"]
+
+        if self.request_count < 2:
+            return {
+                "recommended_ttl_minutes": config.CACHING_CRITERIA["recommended_ttl_minutes"],
+                "expected_hit_rate_at_ttl": 0.0
+            }
+
+        best_ttl = self.edges_seconds[0]
+        best_score = float("-inf")
+        best_hit_rate = 0.0
+        for edge in self.edges_seconds:
+            hit_rate = self.hit_rate_at(edge) * 100
+            score = hit_rate - staleness_cost_per_minute * (edge / 60)
+            if score > best_score:
+                best_ttl, best_score, best_hit_rate = edge, score, hit_rate
+
+        return {
+            "recommended_ttl_minutes": int(best_ttl / 60) if best_ttl % 60 == 0 else round(best_ttl / 60, 2),
+            "expected_hit_rate_at_ttl": round(best_hit_rate, 1)
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "edges_seconds": list(self.edges_seconds),
+            "counts": list(self.counts),
+            "request_count": self.request_count,
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "InterArrivalHistogram":
+        hist = cls([edge / 60 for edge in data["edges_seconds"]])
+        hist.counts = list(data["counts"])
+        hist.request_count = data["request_count"]
+        hist.first_ts = data["first_ts"]
+        hist.last_ts = data["last_ts"]
+        return hist
+
+
+def _analyze_caching_opportunities(state: Any, endpoint_stats: List[Dict[str, Any]]) -> Dict[str, Any]:
    
     caching_opportunities = []
     total_requests_eliminated = 0
@@ -9,9 +149,8 @@ def _analyze_caching_opportunities(logs: List[Dict[str, Any]], endpoint_stats: L
     total_performance_improvement_ms = 0.0
     
     for stats in endpoint_stats:
-        endpoint_logs = [log for log in logs if log["endpoint"] == stats["endpoint"]]
-        get_count = sum(1 for log in endpoint_logs if log["method"] == "GET")
-        get_pct = utils.safe_divide(get_count * 100, len(endpoint_logs))
+        measures = state.rollups.lookup(("endpoint",), (stats["endpoint"],))
+        get_pct = utils.safe_divide(measures["get_count"] * 100, measures["request_count"])
         error_rate = utils.safe_divide(stats["error_count"] * 100, stats["request_count"])
         
         # Check caching criteria
@@ -38,13 +177,17 @@ def _analyze_caching_opportunities(logs: List[Dict[str, Any]], endpoint_stats: L
             else:
                 recommendation_confidence = "low"
             
+            # Data-driven TTL from the endpoint's GET inter-arrival distribution
+            ttl = state.inter_arrival.get(stats["endpoint"], InterArrivalHistogram()).recommend_ttl()
+            
             caching_opportunities.append({
                 "endpoint": stats["endpoint"],
                 "potential_cache_hit_rate": int(round(potential_cache_hit_rate, 0)),
                 "current_requests": stats["request_count"],
                 "potential_requests_saved": potential_requests_saved,
                 "estimated_cost_savings_usd": round(estimated_cost_savings_usd, 2),
-                "recommended_ttl_minutes": config.CACHING_CRITERIA["recommended_ttl_minutes"],
+                "recommended_ttl_minutes": ttl["recommended_ttl_minutes"],
+                "expected_hit_rate_at_ttl": ttl["expected_hit_rate_at_ttl"],
                 "recommendation_confidence": recommendation_confidence
             })
             
@@ -0,0 +1,170 @@
+from __future__ import annotations
+import heapq
+import config
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional, Tuple
+
+# Per-user and per-user x endpoint accumulators: [request_count, execution_cost, memory_cost]
+_COUNT, _EXECUTION, _MEMORY = range(3)
+
+
+class _UserCost:
+
+    __slots__ = ("cost", "error", "totals", "by_endpoint")
+
+    def __init__(self, error: float):
+        self.cost = error            # estimated total cost, an upper bound when error > 0
+        self.error = error           # cost inherited from evicted users
+        self.totals = [0, 0.0, 0.0]
+        self.by_endpoint: Dict[str, List[float]] = {}
+
+
+class UserCostTracker:
+    """
+    Cost per user_id and per user x endpoint, with bounded memory.
+
+    A weighted Space-Saving summary over cost: at most max_tracked_users
+    users are kept. When a new user arrives at capacity, the cheapest
+    tracked user is evicted and the newcomer inherits its cost as a
+    possible overestimate (error). Every user whose true cost exceeds
+    total_cost / max_tracked_users is guaranteed to be tracked, and each
+    tracked user's cost is overestimated by at most its error. With fewer
+    distinct users than the capacity (or max_tracked_users=0, unbounded)
+    every figure is exact.
+    """
+
+    def __init__(self, max_tracked_users: Optional[int] = None):
+        if max_tracked_users is None:
+            max_tracked_users = config.COST_ATTRIBUTION["max_tracked_users"]
+        if max_tracked_users < 0:
+            raise ValueError("max_tracked_users must be positive, or 0 for unbounded")
+        self.max_tracked_users = max_tracked_users or None
+        self.per_request = config.COST_STRUCTURE["per_request"]
+        self.users: Dict[str, _UserCost] = {}
+        # Upper bound on the cost of any user not tracked
+        self.floor = 0.0
+        # Lazy min-heap of (cost, user_id); entries go stale as costs grow and are refreshed on eviction
+        self._heap: List[Tuple[float, str]] = []
+
+    @property
+    def exact(self) -> bool:
+        return self.floor == 0.0
+
+    def _evict_cheapest(self) -> float:
+        heap = self._heap
+        while True:
+            cost, user_id = heap[0]
+            entry = self.users.get(user_id)
+            if entry is None:
+                heapq.heappop(heap)
+            elif entry.cost != cost:
+                heapq.heapreplace(heap, (entry.cost, user_id))
+            else:
+                heapq.heappop(heap)
+                del self.users[user_id]
+                return cost
+
+    def add(self, user_id: str, endpoint: str, execution_cost: float, memory_cost: float, count: int = 1) -> None:
+        entry = self.users.get(user_id)
+        if entry is None:
+            if self.max_tracked_users is not None and len(self.users) >= self.max_tracked_users:
+                self.floor = max(self.floor, self._evict_cheapest())
+            entry = self.users[user_id] = _UserCost(self.floor)
+            if self.max_tracked_users is not None:
+                heapq.heappush(self._heap, (entry.cost, user_id))
+
+        entry.cost += count * self.per_request + execution_cost + memory_cost
+        totals = entry.totals
+        totals[_COUNT] += count
+        totals[_EXECUTION] += execution_cost
+        totals[_MEMORY] += memory_cost
+        sums = entry.by_endpoint.get(endpoint)
+        if sums is None:
+            sums = entry.by_endpoint[endpoint] = [0, 0.0, 0.0]
+        sums[_COUNT] += count
+        sums[_EXECUTION] += execution_cost
+        sums[_MEMORY] += memory_cost
+
+    def add_record(self, log: Dict[str, Any], epoch_seconds: float, is_error: bool, execution_cost: float, memory_cost: float) -> None:
+        self.add(log["user_id"], log["endpoint"], execution_cost, memory_cost)
+
+    def merge(self, other: "UserCostTracker") -> "UserCostTracker":
+        """
+        Combine two summaries (mergeable Space-Saving): a user missing from one
+        side may have cost up to that side's floor there, which is added as error.
+        """
+        merged: Dict[str, _UserCost] = {}
+        for user_id in list(self.users) + [u for u in other.users if u not in self.users]:
+            mine = self.users.get(user_id)
+            theirs = other.users.get(user_id)
+            entry = _UserCost(
+                (mine.error if mine else self.floor) + (theirs.error if theirs else other.floor)
+            )
+            entry.cost = (mine.cost if mine else self.floor) + (theirs.cost if theirs else other.floor)
+            for part in (mine, theirs):
+                if part is None:
+                    continue
+                for i in range(3):
+                    entry.totals[i] += part.totals[i]
+                for endpoint, sums in part.by_endpoint.items():
+                    target = entry.by_endpoint.setdefault(endpoint, [0, 0.0, 0.0])
+                    for i in range(3):
+                        target[i] += sums[i]
+            merged[user_id] = entry
+
+        floor = self.floor + other.floor
+        if self.max_tracked_users is not None and len(merged) > self.max_tracked_users:
+            ranked = sorted(merged.items(), key=lambda x: x[1].cost, reverse=True)
+            floor = max(floor, ranked[self.max_tracked_users][1].cost)
+            merged = dict(ranked[:self.max_tracked_users])
+        self.users = merged
+        self.floor = floor
+        self._heap = []
+        if self.max_tracked_users is not None:
+            self._heap = [(entry.cost, user_id) for user_id, entry in merged.items()]
+            heapq.heapify(self._heap)
+        return self
+
+    def top(self, n: int) -> List[Tuple[str, _UserCost]]:
+        return heapq.nlargest(n, self.users.items(), key=lambda x: x[1].cost)
+
+
+def _breakdown(sums: List[float], per_request: float) -> Dict[str, float]:
+    return {
+        "request_costs": round(sums[_COUNT] * per_request, 4),
+        "execution_costs": round(sums[_EXECUTION], 4),
+        "memory_costs": round(sums[_MEMORY], 4)
+    }
+
+
+def _calculate_cost_by_user(state: Any) -> Dict[str, Any]:
+
+    tracker = state.user_costs
+    per_request = tracker.per_request
+    top_users = []
+    for user_id, entry in tracker.top(config.COST_ATTRIBUTION["top_n"]):
+        by_endpoint = [
+            {
+                "endpoint": endpoint,
+                "request_count": sums[_COUNT],
+                "total_cost": round(sums[_COUNT] * per_request + sums[_EXECUTION] + sums[_MEMORY], 4)
+            }
+            for endpoint, sums in entry.by_endpoint.items()
+        ]
+        by_endpoint.sort(key=lambda x: x["total_cost"], reverse=True)
+        top_users.append({
+            "user_id": user_id,
+            "request_count": entry.totals[_COUNT],
+            "total_cost": round(entry.cost, 4),
+            "max_overestimate_usd": round(entry.error, 4),
+            "cost_breakdown": _breakdown(entry.totals, per_request),
+            "cost_by_endpoint": by_endpoint
+        })
+
+    return {
+        "exact": tracker.exact,
+        "tracked_users": len(tracker.users),
+        "untracked_user_max_cost_usd": round(tracker.floor, 4),
+        "top_users": top_users
+    }
@@ -1,44 +1,40 @@
-
-from typing import Any, Dict, List
-from collections import defaultdict
-from datetime import timedelta
+from __future__ import annotations
 import config
 import utils
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, List
 
-def _calculate_cost_analysis(logs: List[Dict[str, Any]], endpoint_stats: List[Dict[str, Any]]) -> Dict[str, Any]:
-   
-    total_request_cost = len(logs) * config.COST_STRUCTURE["per_request"]
-    total_execution_cost = sum(log["response_time_ms"] * config.COST_STRUCTURE["per_ms_execution"] for log in logs)
+def _memory_cost(response_size_bytes: float) -> float:
     
-    total_memory_cost = 0.0
-    for log in logs:
-        size_kb = log["response_size_bytes"] / 1024
-        if size_kb <= 1:
-            total_memory_cost += config.COST_STRUCTURE["memory_costs"]["small"]
-        elif size_kb <= 10:
-            total_memory_cost += config.COST_STRUCTURE["memory_costs"]["medium"]
-        else:
-            total_memory_cost += config.COST_STRUCTURE["memory_costs"]["large"]
+    # Memory tier is picked from the response size
+    size_kb = response_size_bytes / 1024
+    if size_kb <= 1:
+        return config.COST_STRUCTURE["memory_costs"]["small"]
+    elif size_kb <= 10:
+        return config.COST_STRUCTURE["memory_costs"]["medium"]
+    else:
+        return config.COST_STRUCTURE["memory_costs"]["large"]
+
+
+def _calculate_cost_analysis(state: Any, endpoint_stats: List[Dict[str, Any]]) -> Dict[str, Any]:
+   
+    # Execution and memory costs are accumulated per record in the rollups
+    totals = state.rollups.totals()
+    total_request_cost = totals["request_count"] * config.COST_STRUCTURE["per_request"]
+    total_execution_cost = totals["execution_cost"]
+    total_memory_cost = totals["memory_cost"]
     
     total_cost = total_request_cost + total_execution_cost + total_memory_cost
     
     # Calculate per-endpoint costs
     cost_by_endpoint = []
     for stats in endpoint_stats:
-        endpoint_logs = [log for log in logs if log["endpoint"] == stats["endpoint"]]
-        
-        ep_request_cost = len(endpoint_logs) * config.COST_STRUCTURE["per_request"]
-        ep_exec_cost = sum(log["response_time_ms"] * config.COST_STRUCTURE["per_ms_execution"] for log in endpoint_logs)
+        measures = state.rollups.lookup(("endpoint",), (stats["endpoint"],))
         
-        ep_memory_cost = 0.0
-        for log in endpoint_logs:
-            size_kb = log["response_size_bytes"] / 1024
-            if size_kb <= 1:
-                ep_memory_cost += config.COST_STRUCTURE["memory_costs"]["small"]
-            elif size_kb <= 10:
-                ep_memory_cost += config.COST_STRUCTURE["memory_costs"]["medium"]
-            else:
-                ep_memory_cost += config.COST_STRUCTURE["memory_costs"]["large"]
+        ep_request_cost = measures["request_count"] * config.COST_STRUCTURE["per_request"]
+        ep_exec_cost = measures["execution_cost"]
+        ep_memory_cost = measures["memory_cost"]
         
         ep_total = ep_request_cost + ep_exec_cost + ep_memory_cost
         
@@ -53,11 +49,10 @@ def _calculate_cost_analysis(logs: List[Dict[str, Any]], endpoint_stats: List[Di
     # Calculate optimization potential (70% savings on cacheable endpoints)
     optimization_potential_usd = 0.0
     for stats in endpoint_stats:
-        endpoint_logs = [log for log in logs if log["endpoint"] == stats["endpoint"]]
-        get_count = sum(1 for log in endpoint_logs if log["method"] == "GET")
-        get_pct = utils.safe_divide(get_count * 100, len(endpoint_logs))
+        measures = state.rollups.lookup(("endpoint",), (stats["endpoint"],))
+        get_pct = utils.safe_divide(measures["get_count"] * 100, measures["request_count"])
         
-        if get_pct >= 80 and len(endpoint_logs) >= 50:
+        if get_pct >= 80 and measures["request_count"] >= 50:
             ep_cost = next((e["total_cost"] for e in cost_by_endpoint if e["endpoint"] == stats["endpoint"]), 0)
             optimization_potential_usd += ep_cost * 0.7
     
@@ -0,0 +1,269 @@
+from __future__ import annotations
+from array import array
+import binascii
+import math
+import zlib
+import config
+import utils
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+def _slot(units: int, sub_bucket_bits: int) -> int:
+    # Values below 2**bits get a slot each; above that, every power of two is split into 2**(bits-1) slots
+    if units < 1 << sub_bucket_bits:
+        return units
+    shift = units.bit_length() - sub_bucket_bits
+    return (shift << (sub_bucket_bits - 1)) + (units >> shift)
+
+
+def _slot_bounds(slot: int, sub_bucket_bits: int) -> Tuple[int, int]:
+    """Lowest value and width (in units) of the values that share a slot."""
+    if slot < 1 << sub_bucket_bits:
+        return slot, 1
+    shift = (slot >> (sub_bucket_bits - 1)) - 1
+    return (slot - (shift << (sub_bucket_bits - 1))) << shift, 1 << shift
+
+
+def _encode_varints(values: Iterator[int]) -> bytes:
+    out = bytearray()
+    for value in values:
+        while value > 0x7F:
+            out.append(value & 0x7F | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def _decode_varints(data: bytes) -> List[int]:
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+class LatencyHistogram:
+    """
+    Log-linear (HDR-style) histogram of response times with fixed memory.
+
+    Response times are counted in units of unit_ms. Below 2**sub_bucket_bits
+    units every value has its own slot; above that each power of two is split
+    into 2**(sub_bucket_bits - 1) equal slots, so a slot is never wider than
+    2**(1 - sub_bucket_bits) of the values in it (3.1% at the default 6 bits)
+    and a value read back as its slot midpoint is off by at most half that.
+    Values above max_ms share the top slot. Recording is one array increment;
+    histograms with the same layout merge by adding their counts.
+    """
+
+    __slots__ = ("sub_bucket_bits", "unit_ms", "max_ms", "_max_units", "counts", "total", "min", "max")
+
+    def __init__(self, sub_bucket_bits: Optional[int] = None, unit_ms: Optional[float] = None, max_ms: Optional[float] = None):
+        settings = config.LATENCY_HISTOGRAM
+        self.sub_bucket_bits = settings["sub_bucket_bits"] if sub_bucket_bits is None else sub_bucket_bits
+        self.unit_ms = settings["unit_ms"] if unit_ms is None else unit_ms
+        self.max_ms = settings["max_ms"] if max_ms is None else max_ms
+        if not 2 <= self.sub_bucket_bits <= 16:
+            raise ValueError("Latency histogram sub_bucket_bits must be between 2 and 16")
+        if not 0 < self.unit_ms <= self.max_ms:
+            raise ValueError("Latency histogram needs 0 < unit_ms <= max_ms")
+        self._max_units = int(self.max_ms / self.unit_ms)
+        self.counts = array("q", bytes(8 * (_slot(self._max_units, self.sub_bucket_bits) + 1)))
+        self.total = 0
+        self.min: Any = None
+        self.max: Any = None
+
+    @property
+    def relative_error(self) -> float:
+        """Worst-case relative error of a value read back as its slot midpoint."""
+        return 2.0 ** -self.sub_bucket_bits
+
+    def layout(self) -> Tuple[int, float, float]:
+        return self.sub_bucket_bits, self.unit_ms, self.max_ms
+
+    def add(self, response_time_ms: float, count: int = 1) -> None:
+        units = response_time_ms / self.unit_ms
+        # "not <" also sends NaN and infinity to the top slot
+        if not units < self._max_units:
+            slot = len(self.counts) - 1
+        else:
+            slot = _slot(int(units), self.sub_bucket_bits)
+        self.counts[slot] += count
+        self.total += count
+        if self.min is None or response_time_ms < self.min:
+            self.min = response_time_ms
+        if self.max is None or response_time_ms > self.max:
+            self.max = response_time_ms
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        if other.layout() != self.layout():
+            raise ValueError("Cannot merge latency histograms with different layouts")
+        counts = self.counts
+        for slot, count in enumerate(other.counts):
+            if count:
+                counts[slot] += count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    def buckets(self) -> Iterator[Tuple[float, float, int]]:
+        """Yield (lower_ms, upper_ms, count) for every non-empty slot, lowest first."""
+        for slot, count in enumerate(self.counts):
+            if count:
+                lower, width = _slot_bounds(slot, self.sub_bucket_bits)
+                yield lower * self.unit_ms, (lower + width) * self.unit_ms, count
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Nearest-rank percentile, read as the midpoint of its slot and clamped to the observed min/max."""
+        if not self.total:
+            return None
+        rank = max(1, math.ceil(percent / 100 * self.total))
+        # The extreme ranks are known exactly
+        if rank == 1:
+            return self.min
+        if rank >= self.total:
+            return self.max
+        seen = 0
+        for lower, upper, count in self.buckets():
+            seen += count
+            if seen >= rank:
+                return min(max((lower + upper) / 2, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Non-empty slots as (gap from previous slot, count) varints, compressed
+        pairs = []
+        previous = -1
+        for slot, count in enumerate(self.counts):
+            if count:
+                pairs.append(slot - previous - 1)
+                pairs.append(count)
+                previous = slot
+        return {
+            "sub_bucket_bits": self.sub_bucket_bits,
+            "unit_ms": self.unit_ms,
+            "max_ms": self.max_ms,
+            "min": self.min,
+            "max": self.max,
+            "counts": binascii.b2a_base64(zlib.compress(_encode_varints(pairs)), newline=False).decode("ascii")
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        histogram = cls(data["sub_bucket_bits"], data["unit_ms"], data["max_ms"])
+        values = _decode_varints(zlib.decompress(binascii.a2b_base64(data["counts"])))
+        slot = -1
+        for gap, count in zip(values[::2], values[1::2]):
+            slot += gap + 1
+            if slot >= len(histogram.counts):
+                raise ValueError("Latency histogram counts do not match the layout")
+            histogram.counts[slot] = count
+            histogram.total += count
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
+
+
+class LatencyRecorder:
+    """
+    Latency histograms per endpoint and time bucket, the cells of a latency heatmap.
+
+    Per-endpoint distributions are merged from the cells on demand, so each
+    record is counted once.
+    """
+
+    def __init__(self, bucket_seconds: Optional[int] = None):
+        if bucket_seconds is None:
+            bucket_seconds = config.LATENCY_HISTOGRAM["bucket_seconds"]
+        self.bucket_seconds = bucket_seconds
+        self.cells: Dict[Tuple[str, int], LatencyHistogram] = {}
+
+    def add(self, endpoint: str, epoch_seconds: float, response_time_ms: float, count: int = 1) -> None:
+        key = (endpoint, int(epoch_seconds // self.bucket_seconds) * self.bucket_seconds)
+        histogram = self.cells.get(key)
+        if histogram is None:
+            histogram = self.cells[key] = LatencyHistogram()
+        histogram.add(response_time_ms, count)
+
+    def add_record(self, log: Dict[str, Any], epoch_seconds: float, is_error: bool, execution_cost: float, memory_cost: float) -> None:
+        self.add(log["endpoint"], epoch_seconds, log["response_time_ms"])
+
+    def merge(self, other: "LatencyRecorder") -> "LatencyRecorder":
+        if other.bucket_seconds != self.bucket_seconds:
+            raise ValueError("Cannot merge latency histograms with different bucket sizes")
+        for key, histogram in other.cells.items():
+            if key in self.cells:
+                self.cells[key].merge(histogram)
+            else:
+                self.cells[key] = LatencyHistogram(*histogram.layout()).merge(histogram)
+        return self
+
+    def by_endpoint(self) -> Dict[str, LatencyHistogram]:
+        merged: Dict[str, LatencyHistogram] = {}
+        for (endpoint, _), histogram in self.cells.items():
+            if endpoint not in merged:
+                merged[endpoint] = LatencyHistogram(*histogram.layout())
+            merged[endpoint].merge(histogram)
+        return merged
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "bucket_seconds": self.bucket_seconds,
+            "cells": [
+                {"endpoint": endpoint, "bucket": bucket, "histogram": histogram.to_dict()}
+                for (endpoint, bucket), histogram in self.cells.items()
+            ]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyRecorder":
+        recorder = cls(data["bucket_seconds"])
+        for cell in data["cells"]:
+            recorder.cells[(cell["endpoint"], cell["bucket"])] = LatencyHistogram.from_dict(cell["histogram"])
+        return recorder
+
+
+def _percentile_key(percent: float) -> str:
+    return "p" + f"{percent:g}".replace(".", "_")
+
+
+def _calculate_latency_histograms(state: Any) -> Dict[str, Any]:
+
+    recorder = state.latency
+    percentiles = config.LATENCY_HISTOGRAM["percentiles"]
+    by_endpoint = []
+    for endpoint, histogram in recorder.by_endpoint().items():
+        by_endpoint.append({
+            "endpoint": endpoint,
+            "request_count": histogram.total,
+            "percentiles_ms": {_percentile_key(p): round(histogram.percentile(p), 1) for p in percentiles},
+            "histogram": histogram.to_dict()
+        })
+    by_endpoint.sort(key=lambda x: x["request_count"], reverse=True)
+
+    # Heatmap cells, by endpoint then time
+    heatmap = [
+        {
+            "endpoint": endpoint,
+            "bucket_start": utils.format_timestamp(bucket),
+            "request_count": histogram.total,
+            "histogram": histogram.to_dict()
+        }
+        for (endpoint, bucket), histogram in sorted(recorder.cells.items(), key=lambda x: x[0])
+    ]
+
+    return {
+        "bucket_seconds": recorder.bucket_seconds,
+        "relative_error_percentage": round(LatencyHistogram().relative_error * 100, 1),
+        "by_endpoint": by_endpoint,
+        "heatmap": heatmap
+    }
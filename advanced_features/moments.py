@@ -0,0 +1,152 @@
+from __future__ import annotations
+import math
+import config
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, Optional
+
+
+class Moments:
+    """
+    Running mean, variance and covariance of response time against request and response size.
+
+    Welford's update, extended to co-moments, for each record; Chan et
+    al.'s pairwise formulas for merge(). Both work on deviations from the
+    running means, so large or nearly constant values keep their precision
+    where sum and sum-of-squares arithmetic would cancel. Nine floats,
+    whatever the number of records.
+    """
+
+    __slots__ = ("n", "mean_t", "mean_q", "mean_p", "m2_t", "m2_q", "m2_p", "c_tq", "c_tp")
+
+    def __init__(self):
+        self.n = 0
+        # t: response_time_ms, q: request_size_bytes, p: response_size_bytes
+        self.mean_t = self.mean_q = self.mean_p = 0.0
+        # Sums of squared deviations and of co-deviations from the means
+        self.m2_t = self.m2_q = self.m2_p = 0.0
+        self.c_tq = self.c_tp = 0.0
+
+    def add(self, response_time: float, request_size: float, response_size: float) -> None:
+        n = self.n = self.n + 1
+        dt = response_time - self.mean_t
+        dq = request_size - self.mean_q
+        dp = response_size - self.mean_p
+        self.mean_t += dt / n
+        self.mean_q += dq / n
+        self.mean_p += dp / n
+        # One deviation from the old mean times one from the new
+        dt_new = response_time - self.mean_t
+        self.m2_t += dt * dt_new
+        self.m2_q += dq * (request_size - self.mean_q)
+        self.m2_p += dp * (response_size - self.mean_p)
+        self.c_tq += dq * dt_new
+        self.c_tp += dp * dt_new
+
+    def merge(self, other: "Moments") -> "Moments":
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            for name in Moments.__slots__:
+                setattr(self, name, getattr(other, name))
+            return self
+        n = self.n + other.n
+        weight = self.n * other.n / n
+        dt = other.mean_t - self.mean_t
+        dq = other.mean_q - self.mean_q
+        dp = other.mean_p - self.mean_p
+        self.m2_t += other.m2_t + dt * dt * weight
+        self.m2_q += other.m2_q + dq * dq * weight
+        self.m2_p += other.m2_p + dp * dp * weight
+        self.c_tq += other.c_tq + dt * dq * weight
+        self.c_tp += other.c_tp + dt * dp * weight
+        share = other.n / n
+        self.mean_t += dt * share
+        self.mean_q += dq * share
+        self.mean_p += dp * share
+        self.n = n
+        return self
+
+    def variance(self) -> float:
+        """Sample variance of response time (n - 1 in the denominator)."""
+        return self.m2_t / (self.n - 1) if self.n > 1 else 0.0
+
+    def regression(self, size: str) -> Dict[str, Optional[float]]:
+        """
+        Response time against "request" or "response" size: sample covariance,
+        Pearson correlation and the least-squares line (None when the size never varies).
+        """
+        if size == "request":
+            m2_x, c_xt, mean_x = self.m2_q, self.c_tq, self.mean_q
+        else:
+            m2_x, c_xt, mean_x = self.m2_p, self.c_tp, self.mean_p
+        covariance = c_xt / (self.n - 1) if self.n > 1 else 0.0
+        correlation = slope = intercept = None
+        if m2_x > 0:
+            slope = c_xt / m2_x
+            intercept = self.mean_t - slope * mean_x
+            if self.m2_t > 0:
+                # Clamped: rounding can push a perfect correlation just past 1
+                correlation = max(-1.0, min(1.0, c_xt / math.sqrt(m2_x * self.m2_t)))
+        return {"covariance": covariance, "correlation": correlation, "slope": slope, "intercept": intercept}
+
+
+class EndpointMoments:
+    """One Moments accumulator per endpoint."""
+
+    def __init__(self):
+        self.by_endpoint: Dict[str, Moments] = {}
+
+    def add(self, endpoint: str, response_time: float, request_size: float, response_size: float) -> None:
+        moments = self.by_endpoint.get(endpoint)
+        if moments is None:
+            moments = self.by_endpoint[endpoint] = Moments()
+        moments.add(response_time, request_size, response_size)
+
+    def add_record(self, log: Dict[str, Any], epoch_seconds: float, is_error: bool, execution_cost: float, memory_cost: float) -> None:
+        self.add(log["endpoint"], log["response_time_ms"], log["request_size_bytes"], log["response_size_bytes"])
+
+    def merge(self, other: "EndpointMoments") -> "EndpointMoments":
+        for endpoint, moments in other.by_endpoint.items():
+            if endpoint not in self.by_endpoint:
+                self.by_endpoint[endpoint] = Moments()
+            self.by_endpoint[endpoint].merge(moments)
+        return self
+
+
+def _round(value: Optional[float], digits: int) -> Optional[float]:
+    return None if value is None else round(value, digits)
+
+
+def _size_regression(moments: Moments, size: str) -> Dict[str, Optional[float]]:
+    fit = moments.regression(size)
+    per_kb = None if fit["slope"] is None else fit["slope"] * 1024
+    return {
+        "covariance": round(fit["covariance"], 2),
+        "correlation": _round(fit["correlation"], 4),
+        "slope_ms_per_kb": _round(per_kb, 4),
+        "intercept_ms": _round(fit["intercept"], 2)
+    }
+
+
+def _calculate_latency_moments(state: Any) -> Dict[str, Any]:
+
+    by_endpoint = []
+    min_requests = config.LATENCY_MOMENTS["min_requests"]
+    for endpoint, moments in state.moments.by_endpoint.items():
+        variance = moments.variance()
+        entry = {
+            "endpoint": endpoint,
+            "request_count": moments.n,
+            "mean_response_time_ms": round(moments.mean_t, 2),
+            "variance_ms2": round(variance, 2),
+            "stddev_ms": round(math.sqrt(variance), 2),
+            "coefficient_of_variation": round(math.sqrt(variance) / moments.mean_t, 4) if moments.mean_t else None
+        }
+        # Fewer points than this make a fitted line noise
+        if moments.n >= min_requests:
+            entry["vs_request_size"] = _size_regression(moments, "request")
+            entry["vs_response_size"] = _size_regression(moments, "response")
+        by_endpoint.append(entry)
+    by_endpoint.sort(key=lambda x: x["request_count"], reverse=True)
+    return {"by_endpoint": by_endpoint}
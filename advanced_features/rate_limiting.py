@@ -0,0 +1,341 @@
+from __future__ import annotations
+from collections import OrderedDict, deque
+import copy
+import math
+import zlib
+import config
+import utils
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+
+class CountMinSketch:
+    """
+    Fixed-size frequency sketch. Estimates never undercount, so a user whose
+    estimate is below a threshold is guaranteed to be below it.
+    """
+
+    def __init__(self, width: int, depth: int):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, key: str) -> List[int]:
+        data = key.encode()
+        # Double hashing from crc32 and adler32: stable across processes, unlike hash(). Seeding crc32
+        # per row would not do: it is affine, so keys of one length that collide in a row collide in all
+        first = zlib.crc32(data)
+        step = zlib.adler32(data) | 1
+        return [(first + row * step) % self.width for row in range(self.depth)]
+
+    def add(self, key: str, count: int = 1) -> int:
+        """Add count to key and return the new estimate."""
+        estimate = None
+        for row, index in zip(self.rows, self._indexes(key)):
+            row[index] += count
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+    def add_indexes(self, indexes: List[int], count: int = 1) -> int:
+        """add() for a key whose _indexes() are already known."""
+        estimate = None
+        for row, index in zip(self.rows, indexes):
+            row[index] += count
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        return estimate
+
+
+class _Violation:
+    """One violation episode: its peak window, and when the user first and last went over the limit."""
+
+    __slots__ = ("user_id", "since", "last_ts", "start_slot", "end_ts", "peak")
+
+    def __init__(self, user_id: str, since: float):
+        self.user_id = user_id
+        self.since = since
+        self.last_ts = since
+        self.start_slot = 0
+        self.end_ts = since
+        self.peak = 0
+
+
+class _UserWindow:
+    """Sliding-window counter for one tracked user, kept as per-slot counts."""
+
+    __slots__ = ("slots", "total", "last_ts", "violation")
+
+    def __init__(self):
+        self.slots: List[List[int]] = []   # [slot_index, count], oldest first
+        self.total = 0
+        self.last_ts = 0.0
+        self.violation: Optional[_Violation] = None
+
+
+class RateLimitDetector:
+    """
+    Per-user sliding-window rate-limit violation detector.
+
+    Every request updates a count-min sketch of the sliding window. Only
+    users whose sketch estimate reaches prefilter_fraction * max_requests are
+    promoted to an exact sliding-window counter, so light users never cost
+    more than a few sketch increments. Each slot also keeps the sketch cells
+    it touched, which are taken back out of the window sketch when the slot
+    slides out, and which seed a newly promoted user's slots: the requests
+    made before promotion still count. Seeded counts can only err high, when
+    another user shares all of this user's sketch cells in a slot.
+
+    Tracked users are held in LRU order and evicted once idle for a full
+    window, or when max_tracked_users is reached. Records are expected in time
+    order.
+
+    Per-slot counts of the first window are kept as well, for up to
+    max_tracked_users users, so that merge() can replay them on top of the
+    shard before: windows across the boundary count both shards, and an
+    episode that straddles it is reported once. Shards that overlap by more
+    than a slot are only concatenated.
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or config.RATE_LIMIT
+        self.window_seconds = settings["window_seconds"]
+        self.max_requests = settings["max_requests"]
+        self.slots_per_window = settings["slots_per_window"]
+        self.slot_seconds = self.window_seconds / self.slots_per_window
+        self.promote_at = max(1, math.ceil(self.max_requests * settings["prefilter_fraction"]))
+        self.max_tracked_users = settings["max_tracked_users"]
+        self.sketch_width = settings["sketch_width"]
+        self.sketch_depth = settings["sketch_depth"]
+
+        self._window = CountMinSketch(self.sketch_width, self.sketch_depth)
+        # (slot_index, {row * width + index: count}) for the slots in the window, oldest first
+        self._slots: Deque[Tuple[int, Dict[int, int]]] = deque()
+        self._tracked: "OrderedDict[str, _UserWindow]" = OrderedDict()
+        self.violations: List[_Violation] = []
+        # slot_index -> {user_id: [count, first_ts, last_ts]} for the first window
+        self._head: Dict[int, Dict[str, List[float]]] = {}
+        self._head_users: Set[str] = set()
+        # user_id -> first request after the first window, for those users
+        self._head_next: Dict[str, float] = {}
+        self._head_end: Optional[int] = None
+
+    def _advance_slot(self, slot: int) -> Dict[int, int]:
+        """Cells of the current slot, after taking the slots that slid out off the window sketch."""
+        slots = self._slots
+        if slots and slot <= slots[-1][0]:
+            # An out-of-order record counts in the current slot
+            return slots[-1][1]
+        oldest_kept = slot - self.slots_per_window + 1
+        rows = self._window.rows
+        width = self.sketch_width
+        while slots and slots[0][0] < oldest_kept:
+            for cell, count in slots.popleft()[1].items():
+                rows[cell // width][cell % width] -= count
+        cells: Dict[int, int] = {}
+        slots.append((slot, cells))
+        return cells
+
+    def _seed(self, window: _UserWindow, indexes: List[int], count: int) -> None:
+        """Fill a newly promoted user's slots with the sketch counts, minus the requests being added."""
+        width = self.sketch_width
+        keys = [row * width + index for row, index in enumerate(indexes)]
+        last = len(self._slots) - 1
+        for position, (slot, cells) in enumerate(self._slots):
+            seeded = min(cells.get(key, 0) for key in keys) - (count if position == last else 0)
+            if seeded > 0:
+                window.slots.append([slot, seeded])
+                window.total += seeded
+
+    def _evict_idle(self, ts: float) -> None:
+        while self._tracked:
+            user_id, window = next(iter(self._tracked.items()))
+            if ts - window.last_ts < self.window_seconds and len(self._tracked) <= self.max_tracked_users:
+                break
+            self._tracked.popitem(last=False)
+            self._close_violation(window)
+
+    def _close_violation(self, window: _UserWindow) -> None:
+        if window.violation is not None:
+            self.violations.append(window.violation)
+            window.violation = None
+
+    def add(self, user_id: str, ts: float, count: int = 1) -> None:
+        cells = self._advance_slot(int(ts // self.slot_seconds))
+        slot = self._slots[-1][0]
+        if self._head_end is None:
+            self._head_end = slot + self.slots_per_window
+        if slot < self._head_end:
+            users = self._head.setdefault(slot, {})
+            counted = users.get(user_id)
+            if counted is not None:
+                counted[0] += count
+                counted[2] = max(counted[2], ts)
+            elif user_id in self._head_users or len(self._head_users) < self.max_tracked_users:
+                self._head_users.add(user_id)
+                users[user_id] = [count, ts, ts]
+        elif slot < self._head_end + self.slots_per_window and user_id in self._head_users and user_id not in self._head_next:
+            self._head_next[user_id] = ts
+
+        indexes = self._window._indexes(user_id)
+        estimate = self._window.add_indexes(indexes, count)
+        width = self.sketch_width
+        for row, index in enumerate(indexes):
+            cell = row * width + index
+            cells[cell] = cells.get(cell, 0) + count
+
+        window = self._tracked.get(user_id)
+        if window is None:
+            if estimate < self.promote_at:
+                self._evict_idle(ts)
+                return
+            window = self._tracked[user_id] = _UserWindow()
+            self._seed(window, indexes, count)
+        else:
+            self._tracked.move_to_end(user_id)
+        window.last_ts = ts
+        self._evict_idle(ts)
+
+        # Drop slots that slid out of the window, then count this request in the sketch's current slot
+        oldest_kept = slot - self.slots_per_window + 1
+        while window.slots and window.slots[0][0] < oldest_kept:
+            window.total -= window.slots.pop(0)[1]
+        if window.slots and window.slots[-1][0] == slot:
+            window.slots[-1][1] += count
+        else:
+            window.slots.append([slot, count])
+        window.total += count
+
+        if window.total > self.max_requests:
+            violation = window.violation
+            if violation is None:
+                violation = window.violation = _Violation(user_id, ts)
+            violation.last_ts = ts
+            if window.total > violation.peak:
+                violation.start_slot = window.slots[0][0]
+                violation.end_ts = ts
+                violation.peak = window.total
+        else:
+            self._close_violation(window)
+
+    def add_record(self, log: Dict[str, Any], epoch_seconds: float, is_error: bool, execution_cost: float, memory_cost: float) -> None:
+        self.add(log["user_id"], epoch_seconds)
+
+    def merge(self, other: "RateLimitDetector") -> "RateLimitDetector":
+        """
+        Fold in a detector built over another shard.
+
+        The later shard's first window is replayed on top of the earlier
+        shard; past that window the later shard's own state is what a single
+        pass would have had. Each user's slot is replayed as its first
+        request and then the rest at once, which is where an episode can
+        end or start, so per-user peaks and episodes match a single pass.
+        They can still differ when users are evicted in a different order,
+        and users beyond the max_tracked_users kept for the replay keep
+        the later shard's own episodes in that window.
+        """
+        settings = ("window_seconds", "max_requests", "slots_per_window", "sketch_width", "sketch_depth")
+        if any(getattr(self, name) != getattr(other, name) for name in settings):
+            raise ValueError("Cannot merge rate-limit detectors with different settings")
+        if other._head_end is None:
+            return self
+        if self._head_end is None or other._head_end < self._head_end:
+            later = copy.copy(self)
+            self.__dict__.update(copy.deepcopy(other.__dict__))
+            if later._head_end is not None:
+                self._stitch(later)
+        else:
+            self._stitch(other)
+        return self
+
+    def _open(self) -> List[_Violation]:
+        return [window.violation for window in self._tracked.values() if window.violation is not None]
+
+    def _stitch(self, later: "RateLimitDetector") -> None:
+        later_first = later._head_end - self.slots_per_window
+        if later_first < self._slots[-1][0]:
+            # Interleaved shards: keep both sides' violations, the later shard's live state carries on
+            self.violations.extend(self._open())
+            self.violations.extend(later.violations)
+            self._take_live_state(later, {})
+            return
+
+        for slot in sorted(later._head):
+            # Within a slot a user's window only grows, so the first request is the only one that can close an episode
+            requests = []
+            for user_id, (count, first_ts, last_ts) in later._head[slot].items():
+                requests.append((first_ts, user_id, 1))
+                if count > 1:
+                    requests.append((last_ts, user_id, count - 1))
+            requests.sort()
+            for ts, user_id, count in requests:
+                self.add(user_id, ts, count)
+
+        boundary = later._head_end * self.slot_seconds
+        carried = {violation.user_id: violation for violation in self._open()}
+        for violation in later.violations:
+            if violation.user_id in later._head_users and violation.last_ts < boundary:
+                # Lies inside the replayed window, which the replay has reported
+                continue
+            if self._continues(later, violation, boundary):
+                # One episode with the one the replay left open
+                violation = _stronger(carried.pop(violation.user_id, None), violation)
+            self.violations.append(violation)
+        self._take_live_state(later, carried)
+
+    def _continues(self, later: "RateLimitDetector", violation: _Violation, boundary: float) -> bool:
+        """Whether an episode of the later shard goes on from before the boundary, or starts at the user's first request after it."""
+        if violation.user_id not in later._head_users:
+            return False
+        return violation.since < boundary or later._head_next.get(violation.user_id) == violation.since
+
+    def _take_live_state(self, later: "RateLimitDetector", carried: Dict[str, _Violation]) -> None:
+        boundary = later._head_end * self.slot_seconds
+        for window in later._tracked.values():
+            violation = window.violation
+            if violation is not None and carried and self._continues(later, violation, boundary):
+                window.violation = _stronger(carried.pop(violation.user_id, None), violation)
+        self.violations.extend(carried.values())
+        self._window = later._window
+        self._slots = later._slots
+        self._tracked = later._tracked
+
+    def _report(self, violation: _Violation) -> Dict[str, Any]:
+        return {
+            "user_id": violation.user_id,
+            "window_start": utils.format_timestamp(violation.start_slot * self.slot_seconds),
+            "window_end": utils.format_timestamp(violation.end_ts),
+            "peak_requests": violation.peak,
+            "peak_rate_per_second": round(violation.peak / self.window_seconds, 2),
+            "limit": self.max_requests,
+            "window_seconds": self.window_seconds
+        }
+
+    def finalize(self) -> List[Dict[str, Any]]:
+        """All violations so far, open ones included, highest peak first; the detector can keep going."""
+        violations = [self._report(violation) for violation in self.violations + self._open()]
+        violations.sort(key=lambda x: x["peak_requests"], reverse=True)
+        return violations
+
+
+def _stronger(first: Optional[_Violation], second: _Violation) -> _Violation:
+    """One episode out of two parts of it: the higher peak, from the earlier start."""
+    if first is None:
+        return second
+    best = second if second.peak > first.peak else first
+    joined = copy.copy(best)
+    joined.since = min(first.since, second.since)
+    joined.last_ts = max(first.last_ts, second.last_ts)
+    return joined
+
+
+def _detect_rate_limit_violations(logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+
+    detector = RateLimitDetector()
+    for log in logs:
+        detector.add(log["user_id"], utils.as_utc(log["timestamp"]).timestamp())
+    return detector.finalize()
@@ -0,0 +1,255 @@
+from __future__ import annotations
+from collections import OrderedDict
+import config
+from advanced_features.latency_histograms import LatencyHistogram
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, Optional, Set
+
+
+class _Session:
+
+    __slots__ = ("start", "last", "requests", "endpoints")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.last = start
+        self.requests = 0
+        self.endpoints: Set[str] = set()
+
+
+class SessionTracker:
+    """
+    Per-user sessions, cut by an inactivity gap, in one time-ordered pass.
+
+    Only open sessions are kept, one per user, in least-recently-active
+    order. A record at time t first closes every session idle for more than
+    gap_seconds, so for time-ordered input the open table holds just the
+    users active in the last gap. Closed sessions are folded into
+    log-linear histograms of duration, requests and distinct endpoints, and
+    forgotten.
+
+    The exception are sessions that began within the gap of the first
+    record: they may continue a session from an earlier time shard, so they
+    are held back (as leading sessions) until merge() or a report.
+
+    Open and leading sessions together are capped at max_open_sessions.
+    Past it, the oldest leading session is folded into the totals first:
+    it is complete, and only a join with an earlier shard is given up.
+    Without leading sessions, the least recently active open session is
+    closed early (evicted); if that user comes back within the gap, the
+    rest of the visit counts as a new session. Evictions are reported, and
+    with max_open_sessions=0 there are none.
+    """
+
+    def __init__(self, gap_seconds: Optional[float] = None, max_open_sessions: Optional[int] = None):
+        settings = config.SESSIONS
+        self.gap_seconds = settings["gap_seconds"] if gap_seconds is None else gap_seconds
+        if max_open_sessions is None:
+            max_open_sessions = settings["max_open_sessions"]
+        if self.gap_seconds <= 0:
+            raise ValueError("Session gap_seconds must be positive")
+        if max_open_sessions < 0:
+            raise ValueError("max_open_sessions must be positive, or 0 for unbounded")
+        self.max_open_sessions = max_open_sessions or None
+        self.first_seen: Optional[float] = None
+        self.last_seen: Optional[float] = None
+        self.open: OrderedDict[str, _Session] = OrderedDict()
+        self.leading: Dict[str, _Session] = {}
+        self._oldest_last = float("-inf")
+        self.closed = 0
+        self.evicted = 0
+        self.duration = self._histogram("max_duration_seconds")
+        self.requests = self._histogram("max_requests")
+        self.endpoints = self._histogram("max_endpoints")
+        # Exact sums behind the averages
+        self.duration_sum = 0.0
+        self.requests_sum = 0
+        self.endpoints_sum = 0
+
+    @staticmethod
+    def _histogram(bound: str) -> LatencyHistogram:
+        # Same log-linear layout as latency, counted in whole seconds / requests / endpoints
+        return LatencyHistogram(config.SESSIONS["sub_bucket_bits"], 1, config.SESSIONS[bound])
+
+    def _close(self, session: _Session) -> None:
+        duration = session.last - session.start
+        endpoints = len(session.endpoints)
+        self.closed += 1
+        self.duration.add(duration)
+        self.requests.add(session.requests)
+        self.endpoints.add(endpoints)
+        self.duration_sum += duration
+        self.requests_sum += session.requests
+        self.endpoints_sum += endpoints
+
+    def _end(self, user_id: str, session: _Session) -> None:
+        # Only a user's first session can start this close to the first record
+        if session.start - self.first_seen <= self.gap_seconds:
+            self.leading[user_id] = session
+            self._make_room(0)
+        else:
+            self._close(session)
+
+    def _make_room(self, adding: int) -> None:
+        """Keep open and leading sessions, plus the ones about to be added, within max_open_sessions."""
+        if self.max_open_sessions is None:
+            return
+        leading = self.leading
+        while leading and len(self.open) + len(leading) + adding > self.max_open_sessions:
+            self._close(leading.pop(next(iter(leading))))
+
+    def add(self, user_id: str, endpoint: str, epoch_seconds: float) -> None:
+        if self.first_seen is None:
+            self.first_seen = self.last_seen = epoch_seconds
+        elif epoch_seconds > self.last_seen:
+            self.last_seen = epoch_seconds
+        open_sessions = self.open
+        # The oldest activity is at the front: close whatever has gone idle.
+        # _oldest_last only trails the front's real last activity, so it is safe to skip the scan until it expires
+        horizon = epoch_seconds - self.gap_seconds
+        if self._oldest_last < horizon:
+            while open_sessions:
+                oldest = next(iter(open_sessions.values()))
+                if oldest.last >= horizon:
+                    self._oldest_last = oldest.last
+                    break
+                self._end(*open_sessions.popitem(last=False))
+            else:
+                self._oldest_last = epoch_seconds
+
+        session = open_sessions.get(user_id)
+        if session is None:
+            if self.max_open_sessions is not None and len(open_sessions) >= self.max_open_sessions:
+                self._end(*open_sessions.popitem(last=False))
+                self.evicted += 1
+            self._make_room(1)
+            session = open_sessions[user_id] = _Session(epoch_seconds)
+        else:
+            open_sessions.move_to_end(user_id)
+            if epoch_seconds > session.last:
+                session.last = epoch_seconds
+            elif epoch_seconds < session.start:
+                session.start = epoch_seconds
+        session.requests += 1
+        session.endpoints.add(endpoint)
+
+    def add_record(self, log: Dict[str, Any], epoch_seconds: float, is_error: bool, execution_cost: float, memory_cost: float) -> None:
+        self.add(log["user_id"], log["endpoint"], epoch_seconds)
+
+    def merge(self, other: "SessionTracker") -> "SessionTracker":
+        """
+        Fold in a tracker over the next time shard.
+
+        A session still open here is joined with the same user's first
+        session there when it starts within the gap, so a session cut by the
+        shard boundary counts once. Shards merged out of time order, or
+        overlapping in time, give approximate session counts.
+        """
+        if other.gap_seconds != self.gap_seconds:
+            raise ValueError("Cannot merge sessions cut with different gaps")
+        if other.first_seen is None:
+            return self
+        self._merge_closed(other)
+        if self.first_seen is None:
+            self.first_seen, self.last_seen = other.first_seen, other.last_seen
+            self.leading = {user_id: _copy(session) for user_id, session in other.leading.items()}
+            self.open = OrderedDict((user_id, _copy(session)) for user_id, session in other.open.items())
+            self._oldest_last = float("-inf")
+            return self
+
+        gap = self.gap_seconds
+        self.first_seen = min(self.first_seen, other.first_seen)
+        mine_open = self.open
+        merged: Dict[str, _Session] = {}
+        for user_id, session in other.open.items():
+            merged[user_id] = _copy(session)
+        for user_id, theirs in other.leading.items():
+            mine = mine_open.pop(user_id, None)
+            if mine is not None and theirs.start - mine.last <= gap:
+                self._end(user_id, _joined(mine, theirs))
+            else:
+                if mine is not None:
+                    self._end(user_id, mine)
+                self._close(_copy(theirs))
+        for user_id, theirs in list(merged.items()):
+            mine = mine_open.pop(user_id, None)
+            if mine is None:
+                continue
+            if user_id not in other.leading and theirs.start - mine.last <= gap:
+                merged[user_id] = _joined(mine, theirs)
+            else:
+                self._end(user_id, mine)
+        newest = max(self.last_seen, other.last_seen)
+        for user_id, mine in mine_open.items():
+            if newest - mine.last <= gap:
+                merged[user_id] = mine
+            else:
+                self._end(user_id, mine)
+        self.last_seen = newest
+
+        self.open = OrderedDict(sorted(merged.items(), key=lambda item: item[1].last))
+        self._oldest_last = float("-inf")
+        self._make_room(0)
+        while self.max_open_sessions is not None and len(self.open) > self.max_open_sessions:
+            self._end(*self.open.popitem(last=False))
+            self.evicted += 1
+        return self
+
+    def snapshot(self) -> "SessionTracker":
+        """A closed copy: open sessions counted as ended at their last request; this tracker is untouched."""
+        done = SessionTracker(self.gap_seconds, 0)
+        done._merge_closed(self)
+        for session in list(self.leading.values()) + list(self.open.values()):
+            done._close(session)
+        return done
+
+    def _merge_closed(self, other: "SessionTracker") -> None:
+        for name in ("duration", "requests", "endpoints"):
+            getattr(self, name).merge(getattr(other, name))
+        self.closed += other.closed
+        self.evicted += other.evicted
+        self.duration_sum += other.duration_sum
+        self.requests_sum += other.requests_sum
+        self.endpoints_sum += other.endpoints_sum
+
+
+def _joined(earlier: _Session, later: _Session) -> _Session:
+    joined = _copy(earlier)
+    joined.start = min(earlier.start, later.start)
+    joined.last = max(earlier.last, later.last)
+    joined.requests += later.requests
+    joined.endpoints |= later.endpoints
+    return joined
+
+
+def _copy(session: _Session) -> _Session:
+    copy = _Session(session.start)
+    copy.last = session.last
+    copy.requests = session.requests
+    copy.endpoints = set(session.endpoints)
+    return copy
+
+
+def _distribution(histogram: LatencyHistogram, total: float, count: int, digits: int) -> Dict[str, Any]:
+    distribution = {"avg": round(total / count, digits) if count else 0.0}
+    for percent in config.SESSIONS["percentiles"]:
+        value = histogram.percentile(percent)
+        distribution["p" + f"{percent:g}".replace(".", "_")] = round(value, digits) if value is not None else None
+    distribution["max"] = histogram.max
+    return distribution
+
+
+def _calculate_sessions(state: Any) -> Dict[str, Any]:
+
+    tracker = state.sessions
+    done = tracker.snapshot()
+    return {
+        "gap_seconds": tracker.gap_seconds,
+        "session_count": done.closed,
+        "open_sessions": len(tracker.open),
+        "evicted_sessions": tracker.evicted,
+        "duration_seconds": _distribution(done.duration, done.duration_sum, done.closed, 1),
+        "requests_per_session": _distribution(done.requests, done.requests_sum, done.closed, 2),
+        "endpoints_per_session": _distribution(done.endpoints, done.endpoints_sum, done.closed, 2)
+    }
@@ -0,0 +1,201 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+import config
+import utils
+from advanced_features.caching import InterArrivalHistogram
+from advanced_features.cost_estimation import _memory_cost
+from rollups import RollupEngine, StatusCodeHistogram
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# Optional per-record trackers, keyed by the report section that reads them:
+# section -> (attribute, module, class). An aggregator builds only the ones
+# for its sections; each has add_record() and merge().
+TRACKERS = {
+    "anomalies": ("anomaly_detector", "advanced_features.anomaly_detection", "AnomalyDetector"),
+    "rate_limit_violations": ("rate_limit_detector", "advanced_features.rate_limiting", "RateLimitDetector"),
+    "unique_users": ("unique_users", "advanced_features.unique_users", "UniqueUserCounter"),
+    "latency_histograms": ("latency", "advanced_features.latency_histograms", "LatencyRecorder"),
+    "cost_by_user": ("user_costs", "advanced_features.cost_attribution", "UserCostTracker"),
+    "sessions": ("sessions", "advanced_features.sessions", "SessionTracker"),
+    "latency_moments": ("moments", "advanced_features.moments", "EndpointMoments"),
+    "bandwidth": ("throughput", "advanced_features.bandwidth", "ThroughputTracker")
+}
+# Sections of main.DEFAULT_SECTIONS that need a tracker, built when no sections are passed
+DEFAULT_TRACKED_SECTIONS = ("anomalies",)
+
+
+class LogAggregator:
+    """
+    Incremental, single-pass aggregation state behind analyze_api_logs.
+
+    Records are validated and window-filtered in add(); counts, sums and
+    min/max go into the rollup engine, whose rollups the report sections are
+    projected from. Memory grows with the number of groups rather than the
+    number of records. Aggregators built over separate shards can be combined
+    with merge(). dimension_sets adds rollups for query() on top of the
+    report's (default: config.ROLLUPS["extra_dimension_sets"], empty).
+
+    Trackers that only some report sections read are built only when one of
+    those sections is passed in sections (without sections, the ones the
+    default report reads); see TRACKERS.
+
+    The detectors merge their raw state too and are finalized once, when
+    the report asks: both replay the start of the later shard on top of
+    the earlier one.
+    """
+
+    def __init__(self, starttime: Any = None, endtime: Any = None, sections: Optional[Iterable[str]] = None, max_groups: Optional[int] = None, dimension_sets: Optional[Iterable[Sequence[str]]] = None):
+        # Either bound may be omitted; naive bounds and timestamps are taken as UTC
+        self.starttime = None if starttime is None else utils.as_utc(starttime)
+        self.endtime = None if endtime is None else utils.as_utc(endtime)
+        self._windowed = self.starttime is not None or self.endtime is not None
+
+        self.records_seen = 0
+        self.records_rejected = 0
+        self.records_outside_window = 0
+
+        self.start_time: Optional[datetime] = None
+        self.end_time: Optional[datetime] = None
+        sections = set(sections or DEFAULT_TRACKED_SECTIONS)
+        # Only the bandwidth section reads payload bytes
+        self.rollups = RollupEngine(dimension_sets, max_groups=max_groups, payload_bytes="bandwidth" in sections)
+        self.status_codes: Dict[str, StatusCodeHistogram] = {}
+        self.inter_arrival: Dict[str, InterArrivalHistogram] = {}
+
+        self._trackers: List[Any] = []
+        for attribute, _, _ in TRACKERS.values():
+            setattr(self, attribute, None)
+        for section in sections:
+            if section in TRACKERS:
+                self._attach(section)
+
+    def _attach(self, section: str, tracker: Any = None) -> None:
+        attribute, module, name = TRACKERS[section]
+        if getattr(self, attribute) is not None:
+            return
+        if tracker is None:
+            # Imported on demand so reports without the section never load it
+            tracker = getattr(__import__(module, fromlist=[name]), name)()
+        setattr(self, attribute, tracker)
+        self._trackers.append(tracker)
+
+    @property
+    def total_requests(self) -> int:
+        return self.rollups.totals()["request_count"]
+
+    def _in_window(self, log_time: datetime) -> bool:
+        if log_time.tzinfo is None:
+            log_time = log_time.replace(tzinfo=timezone.utc)
+        if self.starttime is not None and log_time < self.starttime:
+            return False
+        return self.endtime is None or log_time <= self.endtime
+
+    def add(self, log: Dict[str, Any], validated: bool = False) -> bool:
+        """
+        Validate one log entry and fold it into the running totals.
+
+        Args:
+            log: Log entry
+            validated: Skip validation for records already checked upstream
+
+        Returns:
+            True if the record was accepted, False if invalid or outside the window
+        """
+        self.records_seen += 1
+        if not validated and not utils.validate_log_entry(log):
+            self.records_rejected += 1
+            return False
+
+        log_time = utils.parse_timestamp(log["timestamp"])
+        if self._windowed and not self._in_window(log_time):
+            self.records_outside_window += 1
+            return False
+
+        self.add_parsed(log, log_time)
+        return True
+
+    def add_parsed(self, log: Dict[str, Any], log_time: datetime) -> None:
+        """Fold in a record that is already validated, parsed and known to be in the window."""
+        endpoint = log["endpoint"]
+        response_time = log["response_time_ms"]
+        status_code = log["status_code"]
+        is_error = utils.is_error_status(status_code)
+        execution_cost = response_time * config.COST_STRUCTURE["per_ms_execution"]
+        memory_cost = _memory_cost(log["response_size_bytes"])
+        # Naive timestamps are UTC, as for the window bounds, not local time
+        epoch_seconds = utils.as_utc(log_time).timestamp()
+
+        if self.start_time is None or log_time < self.start_time:
+            self.start_time = log_time
+        if self.end_time is None or log_time > self.end_time:
+            self.end_time = log_time
+
+        self.rollups.add(log, log_time, epoch_seconds, is_error, execution_cost, memory_cost)
+
+        histogram = self.status_codes.get(endpoint)
+        if histogram is None:
+            histogram = self.status_codes[endpoint] = StatusCodeHistogram()
+        histogram.add(status_code)
+
+        if log["method"] == "GET":
+            hist = self.inter_arrival.get(endpoint)
+            if hist is None:
+                hist = self.inter_arrival[endpoint] = InterArrivalHistogram()
+            hist.add(epoch_seconds)
+
+        for tracker in self._trackers:
+            tracker.add_record(log, epoch_seconds, is_error, execution_cost, memory_cost)
+
+    def add_many(self, logs: Iterable[Dict[str, Any]]) -> "LogAggregator":
+        for log in logs:
+            self.add(log)
+        return self
+
+    def merge(self, other: "LogAggregator") -> "LogAggregator":
+        """Fold another shard's aggregator into this one; both must agree on the bandwidth section."""
+        # First, so a mismatch is raised before anything is merged
+        self.rollups.merge(other.rollups)
+        self.records_seen += other.records_seen
+        self.records_rejected += other.records_rejected
+        self.records_outside_window += other.records_outside_window
+
+        if other.start_time is not None:
+            self.start_time = other.start_time if self.start_time is None else min(self.start_time, other.start_time)
+            self.end_time = other.end_time if self.end_time is None else max(self.end_time, other.end_time)
+        for endpoint, histogram in other.status_codes.items():
+            if endpoint not in self.status_codes:
+                self.status_codes[endpoint] = StatusCodeHistogram()
+            self.status_codes[endpoint].merge(histogram)
+        for endpoint, hist in other.inter_arrival.items():
+            if endpoint not in self.inter_arrival:
+                self.inter_arrival[endpoint] = InterArrivalHistogram()
+            self.inter_arrival[endpoint].merge(hist)
+
+        for section, (attribute, _, _) in TRACKERS.items():
+            theirs = getattr(other, attribute)
+            if theirs is None:
+                continue
+            mine = getattr(self, attribute)
+            if mine is None:
+                import copy
+                self._attach(section, copy.deepcopy(theirs))
+            else:
+                mine.merge(theirs)
+
+        return self
+
+    def query(self, group_by: List[str], where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Ad-hoc slice over the configured rollups; see RollupEngine.query."""
+        return self.rollups.query(group_by, where)
+
+    def anomalies(self) -> List[Dict[str, Any]]:
+        if self.anomaly_detector is None:
+            return []
+        return self.anomaly_detector.finalize()
+
+    def rate_limit_violations(self) -> List[Dict[str, Any]]:
+        if self.rate_limit_detector is None:
+            return []
+        return self.rate_limit_detector.finalize()
@@ -1,25 +1,26 @@
-from typing import Any, Dict, List, Tuple
-from collections import defaultdict
+from __future__ import annotations
 from datetime import datetime
 import config
 import utils
+from rollups import StatusCodeHistogram
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Tuple
 
-def _calculate_summary(logs: List[Dict[str, Any]]) -> Dict[str, Any]:
+def _calculate_summary(state: Any) -> Dict[str, Any]:
     
-    total_requests = len(logs)
+    totals = state.rollups.totals()
+    total_requests = totals["request_count"]
     
-    # Find time range
-    timestamps = [utils.parse_timestamp(log["timestamp"]) for log in logs]
-    start_time = min(timestamps)
-    end_time = max(timestamps)
+    # Time range tracked as min/max while aggregating
+    start_time = state.start_time
+    end_time = state.end_time
     
     # Calculate average response time
-    total_response_time = sum(log["response_time_ms"] for log in logs)
-    avg_response_time = utils.safe_divide(total_response_time, total_requests)
+    avg_response_time = utils.safe_divide(totals["response_time_sum"], total_requests)
     
     # Calculate error rate
-    error_count = sum(1 for log in logs if utils.is_error_status(log["status_code"]))
-    error_rate = utils.safe_divide(error_count * 100, total_requests)
+    error_rate = utils.safe_divide(totals["error_count"] * 100, total_requests)
     
     return {
         "total_requests": total_requests,
@@ -35,18 +36,12 @@ def analyse_logs_between(logs: List[Dict[str, Any]], start: datetime, end: datet
     logs = [log for log in logs if start <= utils.parse_timestamp(log["timestamp"]) <= end]
     
     
-def _calculate_endpoint_stats(logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def _calculate_endpoint_stats(state: Any) -> List[Dict[str, Any]]:
     
-    
-    # Group logs by endpoint
-    endpoint_logs = defaultdict(list)
-    for log in logs:
-        endpoint_logs[log["endpoint"]].append(log)
-    
-    # Calculate stats for each endpoint
+    # Calculate stats for each endpoint from the endpoint rollup
     endpoint_stats = []
-    for endpoint, endpoint_log_list in endpoint_logs.items():
-        stats = _calculate_single_endpoint_stats(endpoint, endpoint_log_list)
+    for (endpoint,), measures in state.rollups.rows(("endpoint",)):
+        stats = _calculate_single_endpoint_stats(endpoint, measures, state.status_codes[endpoint])
         endpoint_stats.append(stats)
     
     # Sort by request count (descending)
@@ -90,15 +85,14 @@ def _detect_performance_issues(
             })
     
     # Sort by severity (critical first)
-    severity_order = {"critical": 0, "high": 1, "medium": 2, "low": 3}
-    issues.sort(key=lambda x: severity_order.get(x["severity"], 999))
+    issues.sort(key=lambda x: config.SEVERITY_ORDER.get(x["severity"], 999))
     
     return issues
 
 def _generate_recommendations(
     endpoint_stats: List[Dict[str, Any]], 
     summary: Dict[str, Any],
-    logs: List[Dict[str, Any]]
+    state: Any
 ) -> List[str]:
    
     recommendations = []
@@ -124,9 +118,8 @@ def _generate_recommendations(
             )
         
         # Recommendation for caching potential
-        endpoint_logs = [log for log in logs if log["endpoint"] == endpoint]
-        get_count = sum(1 for log in endpoint_logs if log["method"] == "GET")
-        get_percentage = utils.safe_divide(get_count * 100, len(endpoint_logs))
+        get_count = state.rollups.lookup(("endpoint",), (endpoint,))["get_count"]
+        get_percentage = utils.safe_divide(get_count * 100, request_count)
         
         if (request_count >= config.CACHING_CRITERIA["min_request_count"] and 
             get_percentage >= config.CACHING_CRITERIA["min_get_percentage"] and
@@ -141,50 +134,59 @@ def _generate_recommendations(
     
     return recommendations
 
-def _calculate_hourly_distribution(logs: List[Dict[str, Any]]) -> Dict[str, int]:
+def _calculate_hourly_distribution(state: Any) -> Dict[str, int]:
   
-    hourly_counts = defaultdict(int)
-    
-    for log in logs:
-        hour_key = utils.get_hour_key(log["timestamp"])
-        hourly_counts[hour_key] += 1
-    
     # Sort by hour
+    hourly_counts = {hour: measures["request_count"] for (hour,), measures in state.rollups.rows(("hour",))}
     return dict(sorted(hourly_counts.items()))
 
-def _calculate_top_users(logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def _calculate_top_users(state: Any) -> List[Dict[str, Any]]:
    
-    user_counts = defaultdict(int)
-    
-    for log in logs:
-        user_counts[log["user_id"]] += 1
-    
-    # Sort by count and get top N
-    top_users = [
-        {"user_id": user_id, "request_count": count}
-        for user_id, count in sorted(user_counts.items(), key=lambda x: x[1], reverse=True)
+    # Top N straight from the rollup, which never holds every spilled user at once
+    return [
+        {"user_id": user_id, "request_count": measures["request_count"]}
+        for (user_id,), measures in state.rollups.top(("user_id",), config.TOP_USERS_LIMIT, "request_count")
     ]
+
+def _calculate_status_codes(state: Any) -> Dict[str, Any]:
+    
+    # Overall distribution is the sum of the per-endpoint arrays
+    overall = StatusCodeHistogram()
+    by_endpoint = []
+    for endpoint, histogram in state.status_codes.items():
+        overall.merge(histogram)
+        by_endpoint.append({
+            "endpoint": endpoint,
+            "request_count": histogram.total(),
+            "by_class": histogram.classes(),
+            "by_code": histogram.codes()
+        })
+    by_endpoint.sort(key=lambda x: x["request_count"], reverse=True)
     
-    return top_users[:config.TOP_USERS_LIMIT]
+    return {
+        "by_class": overall.classes(),
+        "by_code": overall.codes(),
+        "by_endpoint": by_endpoint
+    }
 
-def _calculate_single_endpoint_stats(endpoint: str, logs: List[Dict[str, Any]]) -> Dict[str, Any]:
+def _calculate_single_endpoint_stats(
+    endpoint: str,
+    measures: Dict[str, Any],
+    status_codes: Any
+) -> Dict[str, Any]:
     
-    request_count = len(logs)
+    request_count = measures["request_count"]
     
     # Response time statistics
-    response_times = [log["response_time_ms"] for log in logs]
-    avg_response_time = utils.safe_divide(sum(response_times), request_count)
-    slowest_request = max(response_times)
-    fastest_request = min(response_times)
+    avg_response_time = utils.safe_divide(measures["response_time_sum"], request_count)
+    slowest_request = measures["max_response_time"]
+    fastest_request = measures["min_response_time"]
     
     # Error statistics
-    error_count = sum(1 for log in logs if utils.is_error_status(log["status_code"]))
+    error_count = measures["error_count"]
     
     # Most common status code
-    status_counts = defaultdict(int)
-    for log in logs:
-        status_counts[log["status_code"]] += 1
-    most_common_status = max(status_counts.items(), key=lambda x: x[1])[0]
+    most_common_status = status_codes.most_common()
     
     return {
         "endpoint": endpoint,
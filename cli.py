@@ -0,0 +1,345 @@
+"""
+Command-line batch analysis of API log files.
+
+Run: python -m cli "logs/*.jsonl.gz" --start 2025-01-15T10:00:00Z --end 2025-01-15T14:00:00Z
+"""
+from typing import Any, Dict, List, Optional, Sequence, TextIO, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+import sys
+import time
+import aggregator
+import ingestion
+import main
+import filters
+import metrics
+import pipeline
+import report_writer
+
+def _aggregate_file(
+    path: str,
+    starttime: Optional[str],
+    endtime: Optional[str],
+    sections: Optional[Sequence[str]],
+    max_groups: Optional[int] = None,
+    record_filter: Any = None
+) -> Tuple[aggregator.LogAggregator, Dict[str, int]]:
+    state = aggregator.LogAggregator(starttime, endtime, sections, max_groups=max_groups)
+    stats: Dict[str, int] = {}
+    for record in ingestion.iter_records(path, stats, record_filter):
+        state.add(record)
+    return state, stats
+
+
+def run_batch(
+    paths: Sequence[str],
+    starttime: Optional[str] = None,
+    endtime: Optional[str] = None,
+    workers: int = 1,
+    sections: Optional[Sequence[str]] = None,
+    pipeline_mode: Optional[str] = None,
+    out: Optional[TextIO] = None,
+    output_format: str = "json",
+    max_groups: Optional[int] = None,
+    registry: Any = None,
+    record_filter: Any = None
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Stream every file through the analyzer and build one report.
+
+    With workers > 1 each file is aggregated in its own process and the
+    partial aggregates are merged in input order. Otherwise, pipeline_mode
+    ("thread" or "process") runs reading, decoding, validation and
+    aggregation as concurrent stages; run statistics then include per-stage
+    utilization.
+
+    If out is given, the report is streamed to it section by section in
+    output_format instead of being built in memory, and None is returned in
+    place of the report.
+
+    max_groups caps the rollup groups held in memory per aggregator; beyond
+    it they are spilled to temp files (see RollupEngine).
+
+    A metrics.MetricsRegistry passed as registry watches the aggregation
+    while it runs and receives the run statistics at the end.
+
+    A filters.RecordFilter passed as record_filter is applied by the
+    loaders, before validation; the records it drops are counted as
+    records_filtered.
+
+    Returns:
+        (report, run statistics)
+    """
+    read_stats = {"records": 0, "decode_errors": 0, "filtered": 0, "bytes": 0}
+
+    pipeline_stats = None
+    started = time.perf_counter()
+    if workers > 1 and len(paths) > 1:
+        state = aggregator.LogAggregator(starttime, endtime, sections, max_groups=max_groups)
+        if registry is not None:
+            # Watched from the start: each file's aggregate shows up as soon as it is merged
+            metrics.watch_aggregator(registry, state)
+            registry.gauge("shards_total", "Files dispatched to worker processes").set(len(paths))
+            merged = registry.counter("shards_merged_total", "Worker results merged so far")
+            merged.set(0)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Results arrive in file order, and each is merged as it arrives
+            for partial, stats in pool.map(
+                _aggregate_file,
+                paths,
+                [starttime] * len(paths),
+                [endtime] * len(paths),
+                [sections] * len(paths),
+                [max_groups] * len(paths),
+                [record_filter] * len(paths)
+            ):
+                state.merge(partial)
+                for key in read_stats:
+                    read_stats[key] += stats[key]
+                if registry is not None:
+                    merged.inc()
+    elif pipeline_mode is not None:
+        state, read_stats, pipeline_stats = pipeline.aggregate_files(
+            paths, starttime, endtime, sections, pipeline_mode,
+            max_groups=max_groups, registry=registry, record_filter=record_filter
+        )
+    else:
+        state = aggregator.LogAggregator(starttime, endtime, sections, max_groups=max_groups)
+        if registry is not None:
+            metrics.watch_aggregator(registry, state)
+        for path in paths:
+            for record in ingestion.iter_records(path, read_stats, record_filter):
+                state.add(record)
+    aggregated = time.perf_counter()
+
+    if out is None:
+        report = main._build_report(state, sections)
+    else:
+        report = None
+        report_writer.write_report(state, out, output_format, sections)
+    finished = time.perf_counter()
+
+    aggregate_seconds = aggregated - started
+    run_stats = {
+        "files": len(paths),
+        "records_read": read_stats["records"],
+        "records_filtered": read_stats["filtered"],
+        "records_accepted": state.total_requests,
+        "records_rejected": state.records_rejected,
+        "decode_errors": read_stats["decode_errors"],
+        "input_bytes": read_stats["bytes"],
+        "aggregate_seconds": round(aggregate_seconds, 3),
+        "report_seconds": round(finished - aggregated, 3),
+        "records_per_second": int(read_stats["records"] / aggregate_seconds) if aggregate_seconds else 0,
+        "mb_per_second": round(read_stats["bytes"] / 1e6 / aggregate_seconds, 2) if aggregate_seconds else 0.0
+    }
+    if pipeline_stats is not None:
+        run_stats["pipeline"] = pipeline_stats
+    spill_stats = state.rollups.spill_stats()
+    state.rollups.close()
+    if spill_stats["spills"]:
+        run_stats["spill"] = spill_stats
+    if registry is not None:
+        metrics.record_run(registry, run_stats)
+    return report, run_stats
+
+
+def run_follow(
+    paths: Sequence[str],
+    sections: Optional[Sequence[str]] = None,
+    checkpoint: Optional[str] = None,
+    output: Optional[str] = None,
+    output_format: str = "json",
+    poll_seconds: Optional[float] = None,
+    report_seconds: float = 60,
+    from_end: bool = False,
+    max_groups: Optional[int] = None,
+    registry: Any = None,
+    duration: Optional[float] = None,
+    record_filter: Any = None
+) -> Dict[str, int]:
+    """
+    Tail paths (see follow.FileFollower) until interrupted or duration has passed.
+
+    Every report_seconds, and once more at the end, the report is written to
+    output, replacing it atomically, or to stdout without output.
+
+    Returns:
+        Follower statistics (records, decode errors, bytes, rotations, ...)
+    """
+    import follow
+
+    def publish(follower: follow.FileFollower) -> None:
+        report = follower.report()
+        if output is None:
+            write_report(report, sys.stdout, output_format)
+            sys.stdout.flush()
+            return
+        temp_path = f"{output}.tmp"
+        with open(temp_path, "w") as out:
+            write_report(report, out, output_format)
+        os.replace(temp_path, output)
+
+    with follow.FileFollower(paths, checkpoint, from_end, sections, max_groups, record_filter) as follower:
+        if registry is not None:
+            metrics.watch_aggregator(registry, follower.state)
+        try:
+            follower.run(duration, poll_seconds, report_seconds=report_seconds, on_report=publish)
+        except KeyboardInterrupt:
+            pass
+        return follower.stats
+
+
+def write_report(report: Dict[str, Any], out: TextIO, output_format: str) -> None:
+
+    report_writer.write_sections(report.items(), out, output_format)
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m cli",
+        description="Analyze API log files (JSON, JSONL; optionally gzip/bz2/xz/zstd compressed)."
+    )
+    parser.add_argument("inputs", nargs="+", help="files or glob patterns ('**' recurses)")
+    parser.add_argument("--start", help="window start, ISO timestamp (requires --end)")
+    parser.add_argument("--end", help="window end, ISO timestamp (requires --start)")
+    parser.add_argument("--endpoint", action="append", help="keep only this endpoint (repeatable)")
+    parser.add_argument("--endpoint-prefix", action="append", help="keep only endpoints starting with this (repeatable)")
+    parser.add_argument("--method", action="append", help="keep only this HTTP method (repeatable)")
+    parser.add_argument(
+        "--status-class", action="append", choices=filters.STATUS_CLASSES, help="keep only this status class (repeatable)"
+    )
+    parser.add_argument("--user", action="append", help="keep only this user_id (repeatable)")
+    parser.add_argument("--workers", type=int, default=1, help="processes used to aggregate files in parallel")
+    parser.add_argument(
+        "--pipeline", choices=pipeline.MODES,
+        help="run read/decode/validate/aggregate as concurrent stages in threads or processes"
+    )
+    parser.add_argument(
+        "--max-groups", type=int,
+        help="rollup groups kept in memory before spilling to temp files (default: config.SPILL, 0 never spills)"
+    )
+    parser.add_argument(
+        "--metrics-port", type=int,
+        help="serve the analyzer's own metrics on this local port while it runs (/metrics, /metrics.json)"
+    )
+    parser.add_argument(
+        "--follow", action="store_true",
+        help="tail the input files (NDJSON) and keep rewriting the report until interrupted"
+    )
+    parser.add_argument("--checkpoint", help="with --follow: file persisting offsets and the aggregate across restarts")
+    parser.add_argument("--from-end", action="store_true", help="with --follow: skip what the files already hold")
+    parser.add_argument("--poll-seconds", type=float, help="with --follow: pause between polls (default: config.FOLLOW)")
+    parser.add_argument("--report-seconds", type=float, default=60, help="with --follow: how often the report is rewritten")
+    parser.add_argument("--sections", help="comma-separated report sections (default: main.DEFAULT_SECTIONS; the rest are opt-in)")
+    parser.add_argument("--format", dest="output_format", choices=report_writer.FORMATS, default="json")
+    parser.add_argument("-o", "--output", help="write the report here instead of stdout")
+    parser.add_argument("-q", "--quiet", action="store_true", help="do not print throughput statistics")
+    return parser
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+
+    if (args.start is None) != (args.end is None):
+        parser.error("--start and --end must be given together")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.max_groups is not None and args.max_groups < 0:
+        parser.error("--max-groups must not be negative")
+
+    sections = None
+    if args.sections:
+        sections = [s.strip() for s in args.sections.split(",") if s.strip()]
+        unknown = [s for s in sections if s not in main.REPORT_SECTIONS]
+        if unknown:
+            parser.error(f"unknown sections: {', '.join(unknown)} (choose from {', '.join(main.REPORT_SECTIONS)})")
+
+    record_filter = filters.RecordFilter(
+        args.start, args.end, args.endpoint, args.endpoint_prefix, args.method, args.status_class, args.user
+    )
+    if record_filter.is_empty:
+        record_filter = None
+
+    if args.follow:
+        if args.start is not None or args.workers > 1 or args.pipeline is not None:
+            parser.error("--follow cannot be combined with --start/--end, --workers or --pipeline")
+        # Followed files may not exist yet, and rotation replaces them, so paths are taken literally
+        paths = list(args.inputs)
+    else:
+        paths = ingestion.expand_inputs(args.inputs)
+        if not paths:
+            parser.error("no input files matched")
+
+    registry = server = None
+    if args.metrics_port is not None:
+        registry = metrics.MetricsRegistry()
+        server = metrics.serve(registry, args.metrics_port)
+        if not args.quiet:
+            host, port = server.server_address[:2]
+            print(f"metrics on http://{host}:{port}/metrics", file=sys.stderr)
+
+    if args.follow:
+        follow_stats = run_follow(
+            paths, sections, args.checkpoint, args.output, args.output_format, args.poll_seconds,
+            args.report_seconds, args.from_end, args.max_groups, registry, record_filter=record_filter
+        )
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        if not args.quiet:
+            print(
+                f"followed {len(paths)} files: {follow_stats['records']:,} records, "
+                f"{follow_stats['decode_errors']:,} undecodable, {follow_stats['rotations']} rotations, "
+                f"{follow_stats['truncations']} truncations",
+                file=sys.stderr
+            )
+        return 0
+
+    if args.output:
+        with open(args.output, "w") as out:
+            _, run_stats = run_batch(
+                paths, args.start, args.end, args.workers, sections, args.pipeline, out, args.output_format, args.max_groups,
+                registry, record_filter
+            )
+    else:
+        _, run_stats = run_batch(
+            paths, args.start, args.end, args.workers, sections, args.pipeline, sys.stdout, args.output_format, args.max_groups,
+            registry, record_filter
+        )
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+    if not args.quiet:
+        print(
+            f"{run_stats['files']} files, {run_stats['records_read']:,} records "
+            f"({run_stats['records_accepted']:,} accepted, {run_stats['records_filtered']:,} filtered, "
+            f"{run_stats['records_rejected']:,} rejected, "
+            f"{run_stats['decode_errors']:,} undecodable) in {run_stats['aggregate_seconds']:.3f}s "
+            f"+ {run_stats['report_seconds']:.3f}s report | "
+            f"{run_stats['records_per_second']:,} records/s, {run_stats['mb_per_second']} MB/s",
+            file=sys.stderr
+        )
+        if "pipeline" in run_stats:
+            stages = run_stats["pipeline"]["stages"]
+            print(
+                "stage utilization: " + ", ".join(f"{name} {stats['utilization']:.0%}" for name, stats in stages.items())
+                + f" (bottleneck: {run_stats['pipeline']['bottleneck']})",
+                file=sys.stderr
+            )
+        if "spill" in run_stats:
+            spill = run_stats["spill"]
+            print(
+                f"spilled {spill['spilled_groups']:,} groups ({spill['spill_bytes']:,} bytes) "
+                f"in {spill['spills']} spills over {spill['max_groups']:,} groups",
+                file=sys.stderr
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -10,7 +10,15 @@ ERROR_RATE_THRESHOLDS = { #in percentage
     "critical": 15.0 
 }
 
-ERROR_STATUS_CODES = [400, 401, 403, 404, 500, 502, 503, 504]
+ERROR_STATUS_CODES = frozenset({400, 401, 403, 404, 500, 502, 503, 504})
+
+# Status codes 100-599 (the range validate_log_entry accepts) map to slots 0-499
+STATUS_CODE_BASE = 100
+STATUS_CODE_SLOTS = 500
+
+# Highest severity first; also the sort order of issues and anomalies
+SEVERITY_LEVELS = ("critical", "high", "medium")
+SEVERITY_ORDER = {"critical": 0, "high": 1, "medium": 2, "low": 3}
 
 TOP_USERS_LIMIT = 5
 
@@ -28,7 +36,120 @@ CACHING_CRITERIA = {
     "min_request_count": 100,        
     "min_get_percentage": 80.0,      
     "max_error_rate": 2.0,         
-    "recommended_ttl_minutes": 15    
+    "recommended_ttl_minutes": 15,   #fallback when there is no inter-arrival data
+    "ttl_candidates_minutes": [1, 2, 5, 10, 15, 30, 60, 120, 240],
+    "staleness_cost_per_minute": 0.5   #hit-rate percentage points one minute of TTL must buy
 }
 
 
+
+ANOMALY_DETECTION = {
+    "bucket_seconds": 300,
+    "ewma_alpha": 0.3,
+    "warmup_buckets": 4,
+    "max_gap_buckets": 100,   #empty buckets replayed after an idle gap, enough for the EWMA to settle
+    "merge_replay_buckets": 48,   #first buckets with traffic per endpoint kept so a merge can replay them on the earlier shard
+    "z_score_thresholds": {
+        "medium": 3.0,
+        "high": 5.0,
+        "critical": 8.0
+    },
+    "min_deviation": {    #floor for the robust scale of each metric
+        "request_count": 1.0,
+        "error_count": 0.5,
+        "avg_response_time_ms": 50.0
+    }
+}
+
+RATE_LIMIT = {
+    "window_seconds": 60,
+    "max_requests": 100,         #per user per sliding window
+    "slots_per_window": 12,      #sub-window counters kept per tracked user
+    "prefilter_fraction": 0.1,   #share of the limit a user must reach before exact tracking
+    "max_tracked_users": 10000,
+    "sketch_width": 2048,
+    "sketch_depth": 4
+}
+
+UNIQUE_USERS = {
+    "precision": 12,         #2**12 registers per sketch: ~1.6% standard error, 4 KiB
+    "bucket_seconds": 3600
+}
+
+COST_ATTRIBUTION = {
+    "max_tracked_users": 10000,   #heavy-hitter bound on per-user cost state; 0 tracks every user exactly
+    "top_n": 10
+}
+
+SESSIONS = {
+    "gap_seconds": 1800,           #inactivity that ends a user's session
+    "max_open_sessions": 100000,   #least recently active sessions are closed early past this; 0 never evicts
+    "sub_bucket_bits": 5,          #histogram precision, as for LATENCY_HISTOGRAM
+    "max_duration_seconds": 7 * 86400,
+    "max_requests": 1000000,
+    "max_endpoints": 100000,
+    "percentiles": (50, 90, 99)
+}
+
+LATENCY_MOMENTS = {
+    "min_requests": 10   #endpoints with fewer requests get no size regression
+}
+
+BANDWIDTH = {
+    "throughput_windows_seconds": (1, 60),   #sliding windows for peak bytes/s, in whole seconds
+    "top_users": 10
+}
+
+LATENCY_HISTOGRAM = {
+    "sub_bucket_bits": 6,     #2**5 slots per power of two: values read back within ~1.6%
+    "unit_ms": 0.1,           #resolution; exact below 2**6 units (6.4 ms)
+    "max_ms": 600000,         #larger response times share the top slot
+    "bucket_seconds": 3600,   #heatmap time resolution
+    "percentiles": [50, 90, 95, 99, 99.9]
+}
+
+SAMPLING = {
+    "sample_rate": 0.1,
+    "method": "stratified",    #"uniform" or "stratified" (by endpoint)
+    "confidence": 0.95,
+    "min_per_stratum": 30,     #records taken from every endpoint, however rare
+    "check_every": 1000        #records between early-stop precision checks
+}
+
+FOLLOW = {
+    "poll_seconds": 1.0,        #pause between polls of the followed files
+    "checkpoint_seconds": 30,   #offsets and aggregate are persisted this often (and on exit)
+    "read_chunk": 1 << 20       #bytes read per call while catching up
+}
+
+METRICS = {
+    "prefix": "log_analyzer_",  #prepended to every metric name
+    "host": "127.0.0.1",        #metrics endpoint binds here only
+    "port": 9464,
+    "latency_buckets": (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),  #seconds per batch
+    "run_buckets": (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)  #seconds per run phase
+}
+
+MAPREDUCE = {
+    "shards": 4,            #default shard count when planning a job
+    "max_retries": 2,       #extra attempts for a failed shard
+    "workers": None         #LocalExecutor processes; None uses the CPU count
+}
+
+SPILL = {
+    "max_groups": 0,        #rollup groups kept in memory before spilling to temp files; 0 never spills
+    "partitions": 16,       #hash partitions, merged one at a time when reading back
+    "directory": None,      #None uses the system temp directory
+    "check_every": 1024     #records between group-count checks
+}
+
+ROLLUPS = {
+    "time_bucket_seconds": 300,
+    # Dimension combinations kept on top of the ones the report needs, e.g.
+    # ["endpoint", "method", "status_class", "time_bucket"]; each costs a group-by per record
+    "extra_dimension_sets": []
+}
+
+FILTERS = {
+    "max_line_needles": 64  #larger value sets skip the raw-line prefilter and are only checked after decoding
+}
@@ -0,0 +1,217 @@
+"""
+Record filters pushed down to the loaders.
+
+A RecordFilter names the records a report is about: a time range, endpoints
+or endpoint prefixes, methods, status classes and users. It is compiled into
+one predicate that tests the cheap string and integer fields first and
+parses the timestamp last. The loaders apply it before validation, and for
+JSONL before decoding: matches_line() rejects a raw line that cannot contain
+any accepted value, or whose timestamp is outside the range, without
+running json.loads on it.
+"""
+from __future__ import annotations
+import re
+import config
+import utils
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+
+# Characters a JSON encoder writes literally; "/" may legally be escaped as "\/"
+_LITERAL_RUN = re.compile(r"[A-Za-z0-9_.:~@+=-]+")
+
+# A timestamp field whose value has no escapes
+_TIMESTAMP_FIELD = re.compile(r'"timestamp"\s*:\s*"([^"\\]*)"')
+
+
+def _needle(value: str) -> str:
+    """Longest run of value that appears verbatim in any JSON encoding of it ("" if none)."""
+    return max(_LITERAL_RUN.findall(value), key=len, default="")
+
+
+def _line_time(line: str) -> Any:
+    """The timestamp of a raw JSONL line, or None if it cannot be read without decoding the line."""
+    # A second "timestamp" (a nested object, a duplicate key) could be the one json.loads keeps
+    if line.count('"timestamp"') != 1:
+        return None
+    match = _TIMESTAMP_FIELD.search(line)
+    if match is None:
+        return None
+    try:
+        return utils.as_utc(match.group(1))
+    except ValueError:
+        return None
+
+
+def _as_set(values: Any) -> Optional[frozenset]:
+    if values is None:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    return frozenset(values)
+
+
+class RecordFilter:
+    """
+    Conjunction of per-field conditions; a field left as None is not tested.
+
+    Args:
+        starttime/endtime: Inclusive bounds, either may be omitted; naive times are UTC
+        endpoints: Accepted endpoints (exact match)
+        endpoint_prefixes: Accepted endpoint prefixes; with endpoints, either may match
+        methods: Accepted HTTP methods
+        status_classes: Accepted classes such as "5xx"
+        users: Accepted user_ids
+
+    Raises:
+        ValueError: For an unknown status class or an inverted time range
+    """
+
+    def __init__(
+        self,
+        starttime: Any = None,
+        endtime: Any = None,
+        endpoints: Optional[Iterable[str]] = None,
+        endpoint_prefixes: Optional[Iterable[str]] = None,
+        methods: Optional[Iterable[str]] = None,
+        status_classes: Optional[Iterable[str]] = None,
+        users: Optional[Iterable[str]] = None
+    ):
+        self.starttime = None if starttime is None else utils.as_utc(starttime)
+        self.endtime = None if endtime is None else utils.as_utc(endtime)
+        if self.starttime is not None and self.endtime is not None and self.starttime > self.endtime:
+            raise ValueError("Filter starttime is after endtime")
+        self.endpoints = _as_set(endpoints)
+        self.endpoint_prefixes = None if endpoint_prefixes is None else tuple(_as_set(endpoint_prefixes))
+        self.methods = _as_set(methods)
+        self.status_classes = _as_set(status_classes)
+        self.users = _as_set(users)
+        if self.status_classes is not None:
+            unknown = self.status_classes - set(STATUS_CLASSES)
+            if unknown:
+                raise ValueError(f"Unknown status classes {sorted(unknown)}; choose from {STATUS_CLASSES}")
+
+        self.matches = self._compile()
+        self._line_needles = self._compile_needles()
+        self._line_range = None if self.starttime is None and self.endtime is None else (self.starttime, self.endtime)
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> "RecordFilter":
+        """Build from keyword arguments, e.g. a parsed JSON or CLI spec."""
+        return cls(**spec)
+
+    def to_dict(self) -> Dict[str, Any]:
+        spec: Dict[str, Any] = {}
+        for name in ("starttime", "endtime"):
+            value = getattr(self, name)
+            if value is not None:
+                spec[name] = value.isoformat().replace("+00:00", "Z")
+        for name in ("endpoints", "endpoint_prefixes", "methods", "status_classes", "users"):
+            value = getattr(self, name)
+            if value is not None:
+                spec[name] = sorted(value)
+        return spec
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # The compiled closures do not pickle; rebuild them from the spec (e.g. in a pipeline process)
+        return (self.from_dict, (self.to_dict(),))
+
+    def __repr__(self) -> str:
+        return f"RecordFilter({self.to_dict()})"
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.to_dict()
+
+    def _compile(self) -> Callable[[Dict[str, Any]], bool]:
+        checks: List[Callable[[Dict[str, Any]], bool]] = []
+
+        # Cheapest first: set lookups on short strings, then prefix scans, then timestamp parsing
+        if self.methods is not None:
+            methods = self.methods
+            checks.append(lambda log: log.get("method") in methods)
+        if self.status_classes is not None:
+            classes = frozenset(int(c[0]) for c in self.status_classes)
+
+            def status_class(log: Dict[str, Any]) -> bool:
+                code = log.get("status_code")
+                return isinstance(code, (int, float)) and code // 100 in classes
+            checks.append(status_class)
+        if self.users is not None:
+            users = self.users
+            checks.append(lambda log: log.get("user_id") in users)
+        if self.endpoints is not None or self.endpoint_prefixes is not None:
+            endpoints = self.endpoints or frozenset()
+            prefixes = self.endpoint_prefixes or ()
+
+            def endpoint(log: Dict[str, Any]) -> bool:
+                value = log.get("endpoint")
+                if value in endpoints:
+                    return True
+                return bool(prefixes) and isinstance(value, str) and value.startswith(prefixes)
+            checks.append(endpoint)
+        if self.starttime is not None or self.endtime is not None:
+            start, end = self.starttime, self.endtime
+
+            def in_range(log: Dict[str, Any]) -> bool:
+                try:
+                    log_time = utils.as_utc(log["timestamp"])
+                except (KeyError, TypeError, ValueError):
+                    return False
+                return (start is None or log_time >= start) and (end is None or log_time <= end)
+            checks.append(in_range)
+
+        if not checks:
+            return lambda log: True
+        if len(checks) == 1:
+            return checks[0]
+        checks = tuple(checks)
+
+        def matches(log: Dict[str, Any]) -> bool:
+            for check in checks:
+                if not check(log):
+                    return False
+            return True
+        return matches
+
+    def _compile_needles(self) -> Tuple[Tuple[str, ...], ...]:
+        """
+        For each string field, substrings of which a matching line must contain one.
+
+        A field is skipped when one of its values has no literal run (nothing
+        can be ruled out) or it has too many values to be worth scanning for.
+        """
+        groups = []
+        limit = config.FILTERS["max_line_needles"]
+        for values in (self.methods, self.users, (self.endpoints or frozenset()) | frozenset(self.endpoint_prefixes or ())):
+            if not values or len(values) > limit:
+                continue
+            needles = tuple(sorted({_needle(value) for value in values}))
+            if "" in needles:
+                continue
+            groups.append(needles)
+        return tuple(groups)
+
+    def matches_line(self, line: str) -> bool:
+        """False only if the raw JSONL line cannot be a matching record; True means decode and check."""
+        for needles in self._line_needles:
+            for needle in needles:
+                if needle in line:
+                    break
+            else:
+                return False
+        if self._line_range is not None:
+            log_time = _line_time(line)
+            if log_time is not None:
+                start, end = self._line_range
+                if (start is not None and log_time < start) or (end is not None and log_time > end):
+                    return False
+        return True
+
+    def accepts(self, item: Any) -> bool:
+        """Test a loader item: a raw JSONL line (pre-decode check only) or an already decoded record."""
+        if isinstance(item, str):
+            return self.matches_line(item)
+        return isinstance(item, dict) and self.matches(item)
@@ -0,0 +1,298 @@
+"""
+Follow mode: tail append-only NDJSON files into a live aggregate.
+
+Each poll stats every followed file, reads only the bytes appended since the
+last poll and feeds the complete lines into one LogAggregator. A file whose
+inode changes was rotated: the old file is read to its end before the new
+one is opened from the start. A file that shrinks under the same inode was
+truncated (copytruncate) and is re-read from the start.
+
+Offsets and the aggregate are checkpointed together, in one file replaced
+atomically. The aggregate is written with mapreduce.dump_state(), as data
+only, and a checkpoint taken for other report sections is refused. After a restart every file resumes exactly where the
+checkpointed aggregate stopped, so no data is read twice or skipped. The
+exception is data appended to a file that was then rotated away while the
+follower was down.
+"""
+from __future__ import annotations
+import json
+import marshal
+import os
+import tempfile
+import time
+import config
+import main
+from aggregator import LogAggregator
+from mapreduce import dump_state, load_state
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, BinaryIO, Callable, Dict, List, Optional, Sequence, Tuple
+
+CHECKPOINT_VERSION = 3
+
+
+class _Tail:
+
+    __slots__ = ("path", "fh", "identity", "offset")
+
+    def __init__(self, path: str, identity: Optional[Tuple[int, int]] = None, offset: int = 0):
+        self.path = path
+        self.fh: Optional[BinaryIO] = None
+        self.identity = identity      # (st_dev, st_ino) of the file the offset belongs to
+        self.offset = offset          # bytes consumed, always just after a newline
+
+    def close(self) -> None:
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+
+class FileFollower:
+    """
+    Incrementally aggregate NDJSON files that are being appended to.
+
+    Args:
+        paths: Files to follow; they need not exist yet
+        checkpoint: Optional checkpoint file, loaded if present and written by checkpoint()
+        from_end: Skip what files without a checkpointed offset already hold
+        sections: Report sections to aggregate for (default: main.DEFAULT_SECTIONS)
+        max_groups: Rollup memory budget, as for LogAggregator
+        record_filter: Optional filters.RecordFilter; lines it drops are counted as filtered
+    """
+
+    def __init__(
+        self,
+        paths: Sequence[str],
+        checkpoint: Optional[str] = None,
+        from_end: bool = False,
+        sections: Optional[Sequence[str]] = None,
+        max_groups: Optional[int] = None,
+        record_filter: Any = None
+    ):
+        self.checkpoint_path = checkpoint
+        self.sections = list(sections) if sections else None
+        self.from_end = from_end
+        self.record_filter = record_filter
+        # False while a poll is under way: the aggregate may then be ahead of the offsets
+        self.consistent = True
+        self.stats = {"records": 0, "decode_errors": 0, "filtered": 0, "bytes": 0, "rotations": 0, "truncations": 0, "polls": 0}
+        self.state = LogAggregator(sections=self.sections, max_groups=max_groups)
+        offsets: Dict[str, Dict[str, int]] = {}
+
+        if checkpoint is not None and os.path.exists(checkpoint):
+            with open(checkpoint, "rb") as f:
+                try:
+                    saved = marshal.load(f)
+                except (EOFError, ValueError, TypeError):
+                    saved = None
+            version = saved.get("version") if isinstance(saved, dict) else None
+            if version != CHECKPOINT_VERSION:
+                raise ValueError(f"Unsupported checkpoint version in {checkpoint}: {version!r}")
+            if saved["sections"] != self._sections_key():
+                raise ValueError(
+                    f"Checkpoint {checkpoint} was taken for sections {saved['sections'] or 'default'}, "
+                    f"not {self._sections_key() or 'default'}"
+                )
+            state = load_state(saved["state"])
+            # The memory budget is the caller's to change between runs
+            state.rollups.max_groups = self.state.rollups.max_groups
+            self.state = state
+            self.stats.update(saved["stats"])
+            offsets = saved["files"]
+
+        self.tails = []
+        for path in paths:
+            saved_offset = offsets.get(path)
+            if saved_offset is None:
+                self.tails.append(_Tail(path))
+            else:
+                self.tails.append(_Tail(path, (saved_offset["device"], saved_offset["inode"]), saved_offset["offset"]))
+
+    def _sections_key(self) -> Optional[List[str]]:
+        return sorted(set(self.sections)) if self.sections else None
+
+    def close(self) -> None:
+        for tail in self.tails:
+            tail.close()
+
+    def __enter__(self) -> "FileFollower":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _consume(self, tail: _Tail, final: bool = False) -> None:
+        """Aggregate every complete line after tail.offset; with final, a trailing unterminated line too."""
+        fh = tail.fh
+        fh.seek(tail.offset)
+        chunk_size = config.FOLLOW["read_chunk"]
+        pending = b""
+        while True:
+            data = fh.read(chunk_size)
+            if not data:
+                break
+            pending += data
+            end = pending.rfind(b"\n")
+            if end < 0:
+                continue
+            self._add_lines(pending[:end + 1])
+            tail.offset += end + 1
+            pending = pending[end + 1:]
+        if final and pending.strip():
+            self._add_lines(pending)
+            tail.offset += len(pending)
+
+    def _add_lines(self, data: bytes) -> None:
+        state = self.state
+        stats = self.stats
+        record_filter = self.record_filter
+        stats["bytes"] += len(data)
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            if not line.strip():
+                continue
+            if record_filter is not None and not record_filter.matches_line(line):
+                stats["records"] += 1
+                stats["filtered"] += 1
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                stats["decode_errors"] += 1
+                continue
+            stats["records"] += 1
+            if record_filter is not None and not record_filter.accepts(record):
+                stats["filtered"] += 1
+                continue
+            state.add(record)
+
+    def _open(self, tail: _Tail) -> int:
+        """Open the file now at tail.path; returns its size. The saved offset is kept only if it belongs to this file."""
+        tail.fh = open(tail.path, "rb")
+        st = os.fstat(tail.fh.fileno())
+        identity = (st.st_dev, st.st_ino)
+        if identity == tail.identity:
+            if st.st_size < tail.offset:
+                self.stats["truncations"] += 1
+                tail.offset = 0
+        else:
+            first_sight = tail.identity is None and not self.stats["polls"]
+            tail.offset = st.st_size if self.from_end and first_sight else 0
+            tail.identity = identity
+        return st.st_size
+
+    def poll(self) -> int:
+        """Read whatever was appended since the last poll; returns the number of records added."""
+        before = self.stats["records"]
+        self.consistent = False
+        for tail in self.tails:
+            try:
+                st = os.stat(tail.path)
+            except FileNotFoundError:
+                # Between rotation and re-creation: finish the old file if it is still open
+                if tail.fh is not None:
+                    self._consume(tail)
+                continue
+            identity = (st.st_dev, st.st_ino)
+
+            size = st.st_size
+            if tail.fh is None:
+                size = self._open(tail)
+            elif identity != tail.identity:
+                # Rotated: the old file is complete, read it to the end first
+                self._consume(tail, final=True)
+                tail.close()
+                self.stats["rotations"] += 1
+                size = self._open(tail)
+            elif size < tail.offset:
+                self.stats["truncations"] += 1
+                tail.offset = 0
+
+            if size > tail.offset:
+                self._consume(tail)
+        self.stats["polls"] += 1
+        self.consistent = True
+        return self.stats["records"] - before
+
+    def checkpoint(self) -> None:
+        """Persist offsets and aggregate together; the file is replaced atomically."""
+        if self.checkpoint_path is None:
+            raise ValueError("No checkpoint path configured")
+        if not self.consistent:
+            raise RuntimeError("Cannot checkpoint in the middle of a poll")
+        saved = {
+            "version": CHECKPOINT_VERSION,
+            "sections": self._sections_key(),
+            "files": {
+                tail.path: {"device": tail.identity[0], "inode": tail.identity[1], "offset": tail.offset}
+                for tail in self.tails
+                if tail.identity is not None
+            },
+            "state": dump_state(self.state),
+            "stats": self.stats
+        }
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        fd, temp_path = tempfile.mkstemp(prefix=".checkpoint-", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                marshal.dump(saved, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.checkpoint_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        if hasattr(os, "O_DIRECTORY"):
+            # Make the rename itself durable
+            dir_fd = os.open(directory, os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def report(self, sections: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        The analyze_api_logs report over everything read so far.
+
+        Costs what the report sections cost on the aggregate, not a re-read,
+        and leaves the aggregate as it was, so following can continue.
+        """
+        return main._build_report(self.state, sections or self.sections)
+
+    def run(
+        self,
+        duration: Optional[float] = None,
+        poll_seconds: Optional[float] = None,
+        checkpoint_seconds: Optional[float] = None,
+        report_seconds: Optional[float] = None,
+        on_report: Optional[Callable[["FileFollower"], None]] = None
+    ) -> None:
+        """
+        Poll until duration seconds have passed (forever if None).
+
+        Checkpoints every checkpoint_seconds and on the way out, unless a
+        poll was interrupted halfway; the previous checkpoint then stands.
+        on_report, if given, is called every report_seconds and at the end.
+        """
+        settings = config.FOLLOW
+        poll_seconds = settings["poll_seconds"] if poll_seconds is None else poll_seconds
+        checkpoint_seconds = settings["checkpoint_seconds"] if checkpoint_seconds is None else checkpoint_seconds
+        started = last_checkpoint = last_report = time.monotonic()
+        try:
+            while True:
+                self.poll()
+                now = time.monotonic()
+                if self.checkpoint_path is not None and now - last_checkpoint >= checkpoint_seconds:
+                    self.checkpoint()
+                    last_checkpoint = now
+                if on_report is not None and report_seconds is not None and now - last_report >= report_seconds:
+                    on_report(self)
+                    last_report = now
+                if duration is not None and now - started >= duration:
+                    break
+                time.sleep(poll_seconds)
+        finally:
+            if self.consistent:
+                if self.checkpoint_path is not None:
+                    self.checkpoint()
+                if on_report is not None:
+                    on_report(self)
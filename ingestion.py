@@ -0,0 +1,365 @@
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence, TextIO
+import bz2
+import glob
+import gzip
+import io
+import json
+import lzma
+import os
+import queue
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 1 << 16
+
+# Decompressed bytes handed from the read-ahead thread per queue item, and how
+# many items may be buffered before the thread blocks
+READ_AHEAD_CHUNK = 1 << 20
+READ_AHEAD_DEPTH = 8
+
+# Records per hand-off between pipeline stages
+BATCH_SIZE = 2000
+
+
+def _open_zstd(path: str) -> BinaryIO:
+    if zstandard is None:
+        raise ValueError(f"{path} is zstd-compressed; install the 'zstandard' package to read it")
+    return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+
+
+COMPRESSED_OPENERS = {
+    "gzip": gzip.open,
+    "bz2": bz2.open,
+    "xz": lzma.open,
+    "zstd": _open_zstd
+}
+
+MAGIC_BYTES = (
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd")
+)
+
+EXTENSIONS = {
+    ".gz": "gzip",
+    ".bz2": "bz2",
+    ".xz": "xz",
+    ".zst": "zstd"
+}
+
+
+def expand_inputs(patterns: Sequence[str]) -> List[str]:
+    """
+    Expand glob patterns into a sorted, de-duplicated list of files.
+
+    Patterns that match nothing but name an existing file are kept as-is;
+    '**' matches across directories.
+    """
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches and os.path.isfile(pattern):
+            matches = [pattern]
+        for path in matches:
+            if os.path.isfile(path) and path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """
+    Identify the compression codec of a file from its magic bytes.
+
+    Falls back to the file extension for files too short to sniff.
+
+    Returns:
+        "gzip", "bz2", "xz", "zstd" or None for plain files
+    """
+    with open(path, "rb") as f:
+        head = f.read(6)
+    for magic, codec in MAGIC_BYTES:
+        if head.startswith(magic):
+            return codec
+    if len(head) < 6:
+        return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    return None
+
+
+def open_text(path: str, read_ahead: bool = True) -> TextIO:
+    """
+    Open a possibly compressed file for text reading.
+
+    Compressed files are decompressed by a background thread into a bounded
+    queue, so decompression overlaps with parsing in the caller's thread.
+    """
+    codec = detect_compression(path)
+    if codec is None:
+        return open(path, "r", encoding="utf-8")
+    raw = COMPRESSED_OPENERS[codec](path)
+    if read_ahead:
+        raw = io.BufferedReader(_ReadAheadReader(raw), buffer_size=CHUNK_SIZE)
+    return io.TextIOWrapper(raw, encoding="utf-8")
+
+
+def _iter_json_array(fh: TextIO, path: str) -> Iterator[Any]:
+    """Yield elements of a top-level JSON array one at a time without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = fh.read(CHUNK_SIZE)
+    pos = buffer.index("[") + 1
+    eof = False
+
+    while True:
+        # Skip separators; refill when the buffer runs out
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError(f"Unterminated JSON array in {path}")
+            buffer = fh.read(CHUNK_SIZE)
+            pos = 0
+            eof = not buffer
+            continue
+        if buffer[pos] == "]":
+            return
+
+        try:
+            obj, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise ValueError(f"Invalid JSON in {path}: {e}") from e
+            chunk = fh.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+
+        yield obj
+        pos = end
+
+
+def iter_raw(path: str, stats: Optional[Dict[str, int]] = None) -> Iterator[Any]:
+    """
+    Stream undecoded items from a JSON array or JSONL file, optionally compressed.
+
+    The format is sniffed from the first non-whitespace character: '[' means a
+    JSON array, whose elements are yielded already decoded; anything else is
+    read as one JSON object per line, and non-blank lines are yielded as
+    strings for decode_batch(). Splitting reading from decoding lets the two
+    run in separate pipeline stages.
+
+    Args:
+        path: File to read
+        stats: Optional dict; its bytes count is increased by the file size
+    """
+    if stats is not None:
+        stats["bytes"] = stats.get("bytes", 0) + os.path.getsize(path)
+
+    with open_text(path) as fh:
+        first = ""
+        while True:
+            first = fh.read(1)
+            if not first or not first.isspace():
+                break
+        if not first:
+            return
+
+        if first == "[":
+            yield from _iter_json_array(_PrefixedReader(first, fh), path)
+            return
+
+        for line in _PrefixedReader(first, fh):
+            line = line.strip()
+            if line:
+                yield line
+
+
+def iter_raw_batches(
+    paths: Sequence[str],
+    batch_size: int = BATCH_SIZE,
+    stats: Optional[Dict[str, int]] = None
+) -> Iterator[List[Any]]:
+    """Yield iter_raw() items from several files in lists of up to batch_size."""
+    batch: List[Any] = []
+    for path in paths:
+        for item in iter_raw(path, stats):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def decode_batch(items: List[Any], stats: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+    """Decode the JSONL lines among iter_raw() items, dropping and counting undecodable ones."""
+    records = []
+    errors = 0
+    for item in items:
+        if isinstance(item, str):
+            try:
+                item = json.loads(item)
+            except ValueError:
+                errors += 1
+                continue
+        records.append(item)
+    if stats is not None:
+        stats["records"] = stats.get("records", 0) + len(records)
+        stats["decode_errors"] = stats.get("decode_errors", 0) + errors
+    return records
+
+
+def iter_records(path: str, stats: Optional[Dict[str, int]] = None, record_filter: Any = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream log records from a JSON array or JSONL file, optionally compressed.
+
+    Undecodable JSONL lines are skipped and counted. With a
+    filters.RecordFilter, lines that cannot match are dropped before they
+    are decoded and decoded records that do not match right after, so
+    neither reaches validation.
+
+    Args:
+        path: File to read
+        stats: Optional dict updated in place with records, decode_errors, filtered and bytes
+        record_filter: Optional filters.RecordFilter
+
+    Yields:
+        One decoded record at a time
+    """
+    if stats is None:
+        stats = {}
+    for key in ("records", "decode_errors", "filtered", "bytes"):
+        stats.setdefault(key, 0)
+
+    if record_filter is None:
+        for item in iter_raw(path, stats):
+            if isinstance(item, str):
+                try:
+                    item = json.loads(item)
+                except ValueError:
+                    stats["decode_errors"] += 1
+                    continue
+            stats["records"] += 1
+            yield item
+        return
+
+    matches_line = record_filter.matches_line
+    matches = record_filter.matches
+    for item in iter_raw(path, stats):
+        if isinstance(item, str):
+            if not matches_line(item):
+                stats["records"] += 1
+                stats["filtered"] += 1
+                continue
+            try:
+                item = json.loads(item)
+            except ValueError:
+                stats["decode_errors"] += 1
+                continue
+        stats["records"] += 1
+        if not isinstance(item, dict) or not matches(item):
+            stats["filtered"] += 1
+            continue
+        yield item
+
+
+def filter_batch(items: List[Any], record_filter: Any) -> List[Any]:
+    """Keep the iter_raw() or decoded items a filters.RecordFilter may accept (lines get the pre-decode check only)."""
+    accepts = record_filter.accepts
+    return [item for item in items if accepts(item)]
+
+
+class _PrefixedReader:
+    """File-like wrapper that replays already-consumed leading text."""
+
+    def __init__(self, head: str, fh: TextIO):
+        self.head = head
+        self.fh = fh
+
+    def read(self, size: int = -1) -> str:
+        head, self.head = self.head, ""
+        if size < 0:
+            return head + self.fh.read()
+        return head + self.fh.read(max(0, size - len(head)))
+
+    def __iter__(self) -> Iterator[str]:
+        head, self.head = self.head, ""
+        first_line = head + self.fh.readline()
+        if first_line:
+            yield first_line
+        yield from self.fh
+
+
+class _ReadAheadReader(io.RawIOBase):
+    """
+    Raw binary stream fed by a thread that reads ahead from another stream.
+
+    The thread pushes READ_AHEAD_CHUNK-sized blocks into a queue of at most
+    READ_AHEAD_DEPTH items and blocks when it is full. Read errors are
+    re-raised in the consumer; close() stops the thread and closes the source.
+    """
+
+    def __init__(self, source: BinaryIO, chunk_size: int = READ_AHEAD_CHUNK, depth: int = READ_AHEAD_DEPTH):
+        super().__init__()
+        self._source = source
+        self._chunk_size = chunk_size
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._current = memoryview(b"")
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, name="read-ahead", daemon=True)
+        self._thread.start()
+
+    def _put(self, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fill(self) -> None:
+        try:
+            while not self._stop.is_set():
+                block = self._source.read(self._chunk_size)
+                if not block:
+                    break
+                if not self._put(block):
+                    return
+            self._put(b"")
+        except BaseException as e:
+            self._put(e)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while not self._current:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._current = memoryview(item)
+        size = min(len(buffer), len(self._current))
+        buffer[:size] = self._current[:size]
+        self._current = self._current[size:]
+        return size
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._source.close()
+        super().close()
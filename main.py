@@ -1,58 +1,237 @@
-from typing import Any, Dict, List, Tuple
-from collections import defaultdict
-from datetime import datetime
+from __future__ import annotations
 import config
 import utils
 import analytics
-import advanced_features.cost_estimation
-import advanced_features.caching
+import aggregator
+# typing alone is most of a cold start; annotations are never evaluated, so it is only imported for type checkers
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
+REPORT_SECTIONS = (
+    "summary",
+    "endpoint_stats",
+    "performance_issues",
+    "recommendations",
+    "hourly_distribution",
+    "top_users_by_requests",
+    "cost_analysis",
+    "caching_opportunities",
+    "anomalies",
+    "rate_limit_violations",
+    "unique_users",
+    "status_codes",
+    "latency_histograms",
+    "cost_by_user",
+    "sessions",
+    "latency_moments",
+    "bandwidth"
+)
 
-def analyze_api_logs(logs: List[Dict[str, Any]] , starttime : any, endtime: any) -> Dict[str, Any]:
-   
+# Sections reported when none are asked for; the others are opt-in
+DEFAULT_SECTIONS = (
+    "summary",
+    "endpoint_stats",
+    "performance_issues",
+    "recommendations",
+    "hourly_distribution",
+    "top_users_by_requests",
+    "cost_analysis",
+    "caching_opportunities",
+    "anomalies",
+    "status_codes"
+)
+
+# Sections derived from the per-endpoint stats
+ENDPOINT_STATS_SECTIONS = frozenset({
+    "endpoint_stats", "performance_issues", "recommendations", "cost_analysis", "caching_opportunities"
+})
+
+
+def analyze_api_logs(
+    logs: List[Dict[str, Any]],
+    starttime: Any = None,
+    endtime: Any = None,
+    sections: Optional[Sequence[str]] = None,
+    filters: Any = None
+) -> Dict[str, Any]:
+    """
+    Analyze API logs, optionally restricted to a time window and to some report sections.
+
+    Either end of the window may be omitted. Without sections, the
+    DEFAULT_SECTIONS are reported; the rest of REPORT_SECTIONS are opt-in.
+    Sections that are not requested are neither computed nor imported. filters, a filters.RecordFilter or the
+    dict of its arguments, drops non-matching records before validation.
+    """
     if not isinstance(logs, list):
         raise ValueError("logs must be a list")
-    
+
     if len(logs) == 0:
         return utils._create_empty_report()
-    if starttime is not None and endtime is not None:
-        starttime = utils.parse_timestamp(starttime)
-        endtime = utils.parse_timestamp(endtime)
-    valid_logs = []
-    
+
+    state = aggregator.LogAggregator(starttime, endtime, sections)
+    if filters is None:
+        for log in logs:
+            state.add(log)
+    else:
+        from filters import RecordFilter
+        if not isinstance(filters, RecordFilter):
+            filters = RecordFilter.from_dict(filters)
+        matches = filters.matches
+        for log in logs:
+            if isinstance(log, dict) and matches(log):
+                state.add(log)
+
+    return _build_report(state, sections)
+
+
+def analyze_windows(
+    logs: List[Dict[str, Any]],
+    windows: Sequence[Tuple[Any, Any]],
+    sections: Optional[Sequence[str]] = None
+) -> Dict[str, Any]:
+    """
+    Analyze several time windows over the same logs in a single pass.
+
+    Each record is validated and parsed once, then routed to every window
+    that contains it. The report for a window equals
+    analyze_api_logs(logs, start, end, sections).
+
+    Args:
+        logs: List of API log entries
+        windows: (start, end) pairs, inclusive; may overlap
+        sections: Optional subset of report keys
+
+    Returns:
+        {"windows": [{"start", "end", "report"}, ...], "diff": [...]} where
+        diff compares key metrics of each window with the previous one
+
+    Raises:
+        ValueError: If logs is not a list or a window is malformed
+    """
+    import windows as window_lookup
+
+    if not isinstance(logs, list):
+        raise ValueError("logs must be a list")
+    bounds = window_lookup.parse_windows(windows)
+
+    states = [aggregator.LogAggregator(start, end, sections) for start, end in bounds]
+    index = window_lookup.WindowIndex(bounds)
     for log in logs:
-        if utils.validate_log_entry(log) :
-            
-            try :
-                log_time = utils.parse_timestamp(log["timestamp"])
-                if starttime <= log_time <= endtime:
-                    valid_logs.append(log)
-                    continue
-            except :
-                valid_logs.append(log)    
-        
-    
-    if len(valid_logs) == 0:
-        return utils._create_empty_report()
-    
-    summary = analytics._calculate_summary(valid_logs)
-    endpoint_stats = analytics._calculate_endpoint_stats(valid_logs)
-    performance_issues = analytics._detect_performance_issues(endpoint_stats, summary)
-    recommendations = analytics._generate_recommendations(endpoint_stats, summary, valid_logs)
-    hourly_distribution = analytics._calculate_hourly_distribution(valid_logs)
-    top_users = analytics._calculate_top_users(valid_logs)
-    cost_analysis = advanced_features.cost_estimation._calculate_cost_analysis(valid_logs, endpoint_stats)
-    caching_analysis = advanced_features.caching._analyze_caching_opportunities(valid_logs, endpoint_stats)
-    
-    report = {
-        "summary": summary,
-        "endpoint_stats": endpoint_stats,
-        "performance_issues": performance_issues,
-        "recommendations": recommendations,
-        "hourly_distribution": hourly_distribution,
-        "top_users_by_requests": top_users , 
-        "cost_analysis": cost_analysis , 
-        "caching_opportunities": caching_analysis
+        if not utils.validate_log_entry(log):
+            continue
+        log_time = utils.parse_timestamp(log["timestamp"])
+        for i in index.lookup(log_time):
+            states[i].add_parsed(log, log_time)
+
+    return {
+        "windows": [
+            {
+                "start": start.isoformat().replace("+00:00", "Z"),
+                "end": end.isoformat().replace("+00:00", "Z"),
+                "report": _build_report(state, sections)
+            }
+            for (start, end), state in zip(bounds, states)
+        ],
+        "diff": window_lookup.compare_windows(states)
     }
-    
-    return report
\ No newline at end of file
+
+
+def analyze_sampled(
+    logs: List[Dict[str, Any]],
+    sample_rate: Optional[float] = None,
+    method: Optional[str] = None,
+    starttime: Any = None,
+    endtime: Any = None,
+    sections: Optional[Sequence[str]] = None,
+    confidence: Optional[float] = None,
+    target_relative_error: Optional[float] = None,
+    seed: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Approximate report from a random sample, with confidence intervals.
+
+    See sampling.analyze_sampled for the arguments and the sections that are
+    available from a sample.
+    """
+    import sampling
+
+    return sampling.analyze_sampled(
+        logs, sample_rate, method, starttime, endtime, sections, confidence, target_relative_error, seed
+    )
+
+
+def _build_report(state: aggregator.LogAggregator, sections: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    Turn aggregated state into the analyze_api_logs report.
+
+    Args:
+        state: Aggregator that has consumed the logs
+        sections: Report keys to include (defaults to DEFAULT_SECTIONS)
+
+    Returns:
+        Dictionary containing analysis results
+    """
+    return dict(_iter_report(state, sections))
+
+
+def _iter_report(state: aggregator.LogAggregator, sections: Optional[Sequence[str]] = None) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield (key, value) for each report section, in report order.
+
+    Sections are computed only when reached, so a caller that writes each one
+    out before asking for the next never holds the whole report.
+    """
+    if state.total_requests == 0:
+        yield from utils._create_empty_report().items()
+        return
+
+    wanted = set(sections or DEFAULT_SECTIONS)
+
+    summary = analytics._calculate_summary(state)
+    endpoint_stats = []
+    if wanted & ENDPOINT_STATS_SECTIONS:
+        endpoint_stats = analytics._calculate_endpoint_stats(state)
+
+    if "summary" in wanted:
+        yield "summary", summary
+    if "endpoint_stats" in wanted:
+        yield "endpoint_stats", endpoint_stats
+    if "performance_issues" in wanted:
+        yield "performance_issues", analytics._detect_performance_issues(endpoint_stats, summary)
+    if "recommendations" in wanted:
+        yield "recommendations", analytics._generate_recommendations(endpoint_stats, summary, state)
+    if "hourly_distribution" in wanted:
+        yield "hourly_distribution", analytics._calculate_hourly_distribution(state)
+    if "top_users_by_requests" in wanted:
+        yield "top_users_by_requests", analytics._calculate_top_users(state)
+    if "cost_analysis" in wanted:
+        from advanced_features.cost_estimation import _calculate_cost_analysis
+        yield "cost_analysis", _calculate_cost_analysis(state, endpoint_stats)
+    if "caching_opportunities" in wanted:
+        from advanced_features.caching import _analyze_caching_opportunities
+        yield "caching_opportunities", _analyze_caching_opportunities(state, endpoint_stats)
+    if "anomalies" in wanted:
+        yield "anomalies", state.anomalies()
+    if "rate_limit_violations" in wanted:
+        yield "rate_limit_violations", state.rate_limit_violations()
+    if "unique_users" in wanted and state.unique_users is not None:
+        from advanced_features.unique_users import _calculate_unique_users
+        yield "unique_users", _calculate_unique_users(state)
+    if "status_codes" in wanted:
+        yield "status_codes", analytics._calculate_status_codes(state)
+    if "latency_histograms" in wanted and state.latency is not None:
+        from advanced_features.latency_histograms import _calculate_latency_histograms
+        yield "latency_histograms", _calculate_latency_histograms(state)
+    if "cost_by_user" in wanted and state.user_costs is not None:
+        from advanced_features.cost_attribution import _calculate_cost_by_user
+        yield "cost_by_user", _calculate_cost_by_user(state)
+    if "sessions" in wanted and state.sessions is not None:
+        from advanced_features.sessions import _calculate_sessions
+        yield "sessions", _calculate_sessions(state)
+    if "latency_moments" in wanted and state.moments is not None:
+        from advanced_features.moments import _calculate_latency_moments
+        yield "latency_moments", _calculate_latency_moments(state)
+    if "bandwidth" in wanted and state.throughput is not None:
+        from advanced_features.bandwidth import _calculate_bandwidth
+        yield "bandwidth", _calculate_bandwidth(state)
@@ -0,0 +1,431 @@
+"""
+Map/reduce over shards of one analysis job.
+
+A job (a set of log files, optionally restricted to a time range) is split
+into shard tasks by time range or by file set. The map step, run_shard(),
+aggregates one shard and returns its LogAggregator serialized to bytes, so
+it can run in a separate function invocation and ship its partial result
+back. The bytes are plain data (marshal of dicts, lists and arrays, see
+dump_state()), never a pickle, so a coordinator can load partials it did
+not produce itself. The coordinator, run_job(), submits every task to an executor,
+retries failed shards and reduces the partials with LogAggregator.merge()
+into an analyze_api_logs report.
+
+The executor is anything with the concurrent.futures submit() interface: a
+serverless invoker only has to wrap its call in a Future. LocalExecutor, a
+process pool, stands in for one when testing.
+"""
+from __future__ import annotations
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+import importlib
+import marshal
+import os
+import time
+import zlib
+import config
+import ingestion
+import main
+import windows
+from aggregator import LogAggregator
+from filters import RecordFilter
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional, Sequence
+
+# Partials may only rebuild classes defined in these modules
+_STATE_MODULES = ("aggregator", "rollups")
+_STATE_PACKAGES = ("advanced_features.",)
+_STATE_FORMAT = 1
+
+# Time shards are inclusive at both ends, like analyze_api_logs windows; each one
+# stops this short of the next shard's start so no record is counted twice
+_RESOLUTION = timedelta(microseconds=1)
+
+
+class ShardTask:
+    """One shard of a job: the files to read and the time range to keep from them."""
+
+    __slots__ = ("shard_id", "paths", "starttime", "endtime", "sections")
+
+    def __init__(
+        self,
+        shard_id: int,
+        paths: Sequence[str],
+        starttime: Optional[str] = None,
+        endtime: Optional[str] = None,
+        sections: Optional[Sequence[str]] = None
+    ):
+        self.shard_id = shard_id
+        self.paths = list(paths)
+        self.starttime = starttime
+        self.endtime = endtime
+        self.sections = list(sections) if sections else None
+
+    def __repr__(self) -> str:
+        return f"ShardTask({self.shard_id}, {len(self.paths)} files, {self.starttime} .. {self.endtime})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-safe invocation payload."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ShardTask":
+        return cls(**data)
+
+
+def _format(moment: Any) -> str:
+    return moment.isoformat().replace("+00:00", "Z")
+
+
+def plan_time_shards(
+    paths: Sequence[str],
+    starttime: Any,
+    endtime: Any,
+    shards: Optional[int] = None,
+    sections: Optional[Sequence[str]] = None
+) -> List[ShardTask]:
+    """
+    Split [starttime, endtime] into equal, non-overlapping time ranges.
+
+    Every shard reads all of paths and keeps its own range, so this suits
+    inputs the shards can read cheaply (e.g. object storage); combine with
+    plan_file_shards when the files are already partitioned by time.
+
+    Raises:
+        ValueError: If the range is missing or inverted, or shards < 1
+    """
+    if shards is None:
+        shards = config.MAPREDUCE["shards"]
+    if shards < 1:
+        raise ValueError("shards must be at least 1")
+    if starttime is None or endtime is None:
+        raise ValueError("Time sharding needs both starttime and endtime")
+    (start, end), = windows.parse_windows([(starttime, endtime)])
+
+    step = (end - start) / shards
+    tasks = []
+    for i in range(shards):
+        shard_start = start + step * i
+        shard_end = end if i == shards - 1 else start + step * (i + 1) - _RESOLUTION
+        if shard_end < shard_start:
+            # More shards than microseconds in the range
+            continue
+        tasks.append(ShardTask(len(tasks), paths, _format(shard_start), _format(shard_end), sections))
+    return tasks
+
+
+def plan_file_shards(
+    paths: Sequence[str],
+    shards: Optional[int] = None,
+    starttime: Any = None,
+    endtime: Any = None,
+    sections: Optional[Sequence[str]] = None
+) -> List[ShardTask]:
+    """
+    Split the files into shards of contiguous runs, balanced by size on disk.
+
+    Files stay in input order across shards, so the reduced report keeps the
+    order a single pass over paths would give.
+    """
+    if shards is None:
+        shards = config.MAPREDUCE["shards"]
+    if shards < 1:
+        raise ValueError("shards must be at least 1")
+    if starttime is not None and not isinstance(starttime, str):
+        starttime = _format(starttime)
+    if endtime is not None and not isinstance(endtime, str):
+        endtime = _format(endtime)
+
+    sizes = [os.path.getsize(path) for path in paths]
+    total = sum(sizes) or 1
+    groups: List[List[str]] = []
+    before = 0
+    current = -1
+    for path, size in zip(paths, sizes):
+        # A file goes to the shard its midpoint falls in
+        shard = min(int((before + size / 2) * shards / total), shards - 1)
+        if shard > current:
+            groups.append([])
+            current = shard
+        groups[-1].append(path)
+        before += size
+    return [ShardTask(i, group, starttime, endtime, sections) for i, group in enumerate(groups)]
+
+
+def _state_class(module_name: str, class_name: str) -> type:
+    if module_name not in _STATE_MODULES and not module_name.startswith(_STATE_PACKAGES):
+        raise ValueError(f"Partial refers to {module_name}.{class_name}, which is not aggregation state")
+    cls = getattr(importlib.import_module(module_name), class_name, None)
+    if not isinstance(cls, type) or cls.__module__ != module_name:
+        raise ValueError(f"Partial refers to unknown class {module_name}.{class_name}")
+    return cls
+
+
+def _attributes(obj: Any) -> Dict[str, Any]:
+    getstate = getattr(type(obj), "__getstate__", object.__getstate__)
+    if getstate is not object.__getstate__:
+        # e.g. RollupEngine merges its spill files back first
+        return getstate(obj)
+    attributes = dict(getattr(obj, "__dict__", {}))
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if hasattr(obj, name):
+                attributes[name] = getattr(obj, name)
+    return attributes
+
+
+class _StateWriter:
+    """Turns aggregation state into marshal-able data; every tuple in the output is a tagged node."""
+
+    def __init__(self):
+        self.memo: Dict[int, int] = {}
+        self.keep: List[Any] = []
+
+    def _shared(self, value: Any) -> Optional[Any]:
+        index = self.memo.get(id(value))
+        if index is not None:
+            return ("r", index)
+        self.memo[id(value)] = len(self.keep)
+        self.keep.append(value)
+        return None
+
+    def encode(self, value: Any) -> Any:
+        if value is None or isinstance(value, (bool, int, float, str, bytes)):
+            return value
+        if isinstance(value, tuple):
+            return ("t", [self.encode(item) for item in value])
+        if isinstance(value, datetime):
+            return ("dt", value.isoformat())
+        # Mutable values may be shared (e.g. a rollup in both RollupEngine.rollups and _plans)
+        ref = self._shared(value)
+        if ref is not None:
+            return ref
+        index = self.memo[id(value)]
+        if isinstance(value, list):
+            return ("l", index, [self.encode(item) for item in value])
+        if isinstance(value, dict):
+            tag = "od" if isinstance(value, OrderedDict) else "d"
+            items = []
+            for key, item in value.items():
+                items.append(self.encode(key))
+                items.append(self.encode(item))
+            return (tag, index, items)
+        if isinstance(value, (set, frozenset)):
+            return ("fs" if isinstance(value, frozenset) else "s", index, [self.encode(item) for item in value])
+        if isinstance(value, deque):
+            return ("q", index, [self.encode(item) for item in value], value.maxlen)
+        if isinstance(value, array):
+            return ("a", index, value.typecode, value.tobytes())
+        if isinstance(value, bytearray):
+            return ("ba", index, bytes(value))
+        cls = type(value)
+        if cls.__module__ not in _STATE_MODULES and not cls.__module__.startswith(_STATE_PACKAGES):
+            raise TypeError(f"Cannot serialize {cls.__module__}.{cls.__name__} in a partial aggregate")
+        return ("o", index, cls.__module__, cls.__qualname__, self.encode(_attributes(value)))
+
+
+class _StateReader:
+
+    def __init__(self):
+        self.memo: Dict[int, Any] = {}
+
+    def decode(self, node: Any) -> Any:
+        if not isinstance(node, tuple):
+            return node
+        tag = node[0]
+        if tag == "t":
+            return tuple(self.decode(item) for item in node[1])
+        if tag == "dt":
+            return datetime.fromisoformat(node[1])
+        if tag == "r":
+            return self.memo[node[1]]
+        index = node[1]
+        if tag == "l":
+            value = self.memo[index] = []
+            value.extend(self.decode(item) for item in node[2])
+        elif tag in ("d", "od"):
+            value = self.memo[index] = OrderedDict() if tag == "od" else {}
+            items = node[2]
+            for i in range(0, len(items), 2):
+                value[self.decode(items[i])] = self.decode(items[i + 1])
+        elif tag == "s":
+            value = self.memo[index] = set()
+            value.update(self.decode(item) for item in node[2])
+        elif tag == "fs":
+            value = self.memo[index] = frozenset(self.decode(item) for item in node[2])
+        elif tag == "q":
+            value = self.memo[index] = deque(maxlen=node[3])
+            value.extend(self.decode(item) for item in node[2])
+        elif tag == "a":
+            value = self.memo[index] = array(node[2])
+            value.frombytes(node[3])
+        elif tag == "ba":
+            value = self.memo[index] = bytearray(node[2])
+        elif tag == "o":
+            cls = _state_class(node[2], node[3])
+            value = self.memo[index] = cls.__new__(cls)
+            for name, item in self.decode(node[4]).items():
+                object.__setattr__(value, name, item)
+        else:
+            raise ValueError(f"Unknown node {tag!r} in partial aggregate")
+        return value
+
+
+def dump_state(state: LogAggregator) -> bytes:
+    """
+    Serialize an aggregator as data only: marshal of tagged lists, dicts and arrays, compressed.
+
+    Objects are written as their class name and attributes, and load_state()
+    rebuilds only classes from the aggregation modules, so loading a partial
+    never runs code the partial chose.
+    """
+    return zlib.compress(marshal.dumps((_STATE_FORMAT, _StateWriter().encode(state))), 1)
+
+
+def load_state(data: bytes) -> LogAggregator:
+    """Rebuild an aggregator written by dump_state()."""
+    version, node = marshal.loads(zlib.decompress(data))
+    if version != _STATE_FORMAT:
+        raise ValueError(f"Unsupported partial aggregate format {version}")
+    state = _StateReader().decode(node)
+    if not isinstance(state, LogAggregator):
+        raise ValueError("Partial aggregate does not hold a LogAggregator")
+    return state
+
+
+def run_shard(task: Any) -> Dict[str, Any]:
+    """
+    Map step: aggregate one shard.
+
+    Args:
+        task: ShardTask or its to_dict() payload
+
+    Returns:
+        {"shard_id", "aggregate" (dump_state() of the LogAggregator),
+        "read_stats", "seconds"}
+    """
+    if isinstance(task, dict):
+        task = ShardTask.from_dict(task)
+    started = time.perf_counter()
+    state = LogAggregator(task.starttime, task.endtime, task.sections)
+    # Lines outside the shard's range are dropped before they are decoded
+    record_filter = None
+    if task.starttime is not None or task.endtime is not None:
+        record_filter = RecordFilter(task.starttime, task.endtime)
+    read_stats = {"records": 0, "decode_errors": 0, "filtered": 0, "bytes": 0}
+    for path in task.paths:
+        for record in ingestion.iter_records(path, read_stats, record_filter):
+            state.add(record)
+    aggregate = dump_state(state)
+    return {
+        "shard_id": task.shard_id,
+        "aggregate": aggregate,
+        "read_stats": read_stats,
+        "seconds": time.perf_counter() - started
+    }
+
+
+def reduce_partials(partials: Sequence[Dict[str, Any]], sections: Optional[Sequence[str]] = None) -> LogAggregator:
+    """Merge run_shard() results in shard order, whatever order they finished in."""
+    state = LogAggregator(sections=sections)
+    for partial in sorted(partials, key=lambda p: p["shard_id"]):
+        state.merge(load_state(partial["aggregate"]))
+    return state
+
+
+class LocalExecutor(ProcessPoolExecutor):
+    """Process pool standing in for a serverless invoker: one process per concurrent shard."""
+
+
+def run_job(
+    tasks: Sequence[ShardTask],
+    executor: Any = None,
+    max_retries: Optional[int] = None,
+    stats: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Run every shard through the executor and reduce them into one report.
+
+    run_shard() only reads its inputs, so a failed shard is simply submitted
+    again, up to max_retries times. Results are kept per shard_id and the
+    first one to arrive wins, so a shard that ends up running twice is
+    counted once; the reduce runs in shard order, so the report does not
+    depend on completion order.
+
+    Args:
+        tasks: Shards from plan_time_shards/plan_file_shards, with distinct shard_ids
+        executor: concurrent.futures-style executor; defaults to a LocalExecutor
+        max_retries: Extra attempts per shard (default config.MAPREDUCE)
+        stats: If given, filled with shard counts, retries and timings
+
+    Returns:
+        The analyze_api_logs report for the whole job
+
+    Raises:
+        ValueError: If shard_ids repeat or tasks ask for different sections
+        RuntimeError: If a shard still fails after its retries
+    """
+    if max_retries is None:
+        max_retries = config.MAPREDUCE["max_retries"]
+    if len({task.shard_id for task in tasks}) != len(tasks):
+        raise ValueError("Shard ids must be unique")
+    sections = tasks[0].sections if tasks else None
+    if any(task.sections != sections for task in tasks):
+        raise ValueError("All shards of a job must request the same sections")
+
+    owned = executor is None
+    if owned:
+        executor = LocalExecutor(max_workers=config.MAPREDUCE["workers"])
+    started = time.perf_counter()
+    attempts = {task.shard_id: 0 for task in tasks}
+    results: Dict[int, Dict[str, Any]] = {}
+    errors: List[str] = []
+    try:
+        pending = {}
+        for task in tasks:
+            attempts[task.shard_id] += 1
+            pending[executor.submit(run_shard, task.to_dict())] = task
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    results.setdefault(task.shard_id, future.result())
+                    continue
+                errors.append(f"shard {task.shard_id}: {error}")
+                if task.shard_id in results:
+                    continue
+                if attempts[task.shard_id] > max_retries:
+                    raise RuntimeError(
+                        f"Shard {task.shard_id} failed after {attempts[task.shard_id]} attempts: {error}"
+                    ) from error
+                attempts[task.shard_id] += 1
+                pending[executor.submit(run_shard, task.to_dict())] = task
+    finally:
+        if owned:
+            executor.shutdown(cancel_futures=True)
+    mapped = time.perf_counter()
+
+    state = reduce_partials(list(results.values()), sections)
+    report = main._build_report(state, sections)
+    state.rollups.close()
+
+    if stats is not None:
+        shard_seconds = [result["seconds"] for result in results.values()]
+        stats.update({
+            "shards": len(tasks),
+            "attempts": sum(attempts.values()),
+            "retries": sum(attempts.values()) - len(tasks),
+            "errors": errors,
+            "records_read": sum(result["read_stats"]["records"] for result in results.values()),
+            "aggregate_bytes": sum(len(result["aggregate"]) for result in results.values()),
+            "map_seconds": round(mapped - started, 3),
+            "reduce_seconds": round(time.perf_counter() - mapped, 3),
+            "slowest_shard_seconds": round(max(shard_seconds, default=0.0), 3),
+            "total_shard_seconds": round(sum(shard_seconds), 3)
+        })
+    return report
@@ -0,0 +1,331 @@
+"""
+The analyzer's own health metrics: throughput, rejects, stage latency, memory.
+
+A MetricsRegistry holds counters, gauges and fixed-bucket histograms and
+renders them in the Prometheus text format or as a plain dict. Nothing here
+runs per record: watch_aggregator() registers a collector that reads the
+counters LogAggregator keeps anyway when the registry is scraped, and
+record_run() folds a finished run's statistics (including the pipeline's
+per-batch stage latencies) in at once.
+
+    registry = MetricsRegistry()
+    server = serve(registry, port=9464)      # GET /metrics, GET /metrics.json
+    watch_aggregator(registry, state)
+"""
+from __future__ import annotations
+from bisect import bisect_left
+import sys
+import threading
+import time
+import config
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+    from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+class Metric:
+    """One labelled series of a counter or gauge."""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Histogram:
+    """Counts per fixed upper bound, plus sum and count, as Prometheus histograms keep them."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        # The last slot is +Inf
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float, count: int = 1) -> None:
+        self.counts[bisect_left(self.bounds, value)] += count
+        self.sum += value * count
+        self.count += count
+
+    def add_counts(self, counts: Sequence[int], total: float) -> None:
+        """Fold in counts already bucketed with the same bounds, e.g. by a pipeline stage."""
+        if len(counts) != len(self.counts):
+            raise ValueError("Histogram counts do not match the bucket bounds")
+        for i, count in enumerate(counts):
+            self.counts[i] += count
+        self.sum += total
+        self.count += sum(counts)
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class MetricsRegistry:
+    """
+    Named metric families, each with one series per label set.
+
+    Collectors are called before every snapshot()/render() to refresh
+    metrics derived from state owned elsewhere.
+    """
+
+    def __init__(self, prefix: Optional[str] = None):
+        self.prefix = config.METRICS["prefix"] if prefix is None else prefix
+        self._families: Dict[str, Dict[str, Any]] = {}
+        self._collectors: List[Callable[["MetricsRegistry"], None]] = []
+        self._lock = threading.Lock()
+
+    def _series(self, kind: str, name: str, help_text: str, labels: Dict[str, Any], make: Callable[[], Any]) -> Any:
+        name = self.prefix + name
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = {"type": kind, "help": help_text, "series": {}}
+        elif family["type"] != kind:
+            raise ValueError(f"Metric {name} is a {family['type']}, not a {kind}")
+        key = _label_key(labels)
+        series = family["series"].get(key)
+        if series is None:
+            series = family["series"][key] = make()
+        return series
+
+    def counter(self, name: str, help_text: str = "", **labels: Any) -> Metric:
+        return self._series("counter", name, help_text, labels, Metric)
+
+    def gauge(self, name: str, help_text: str = "", **labels: Any) -> Metric:
+        return self._series("gauge", name, help_text, labels, Metric)
+
+    def histogram(self, name: str, help_text: str = "", bounds: Optional[Sequence[float]] = None, **labels: Any) -> Histogram:
+        if bounds is None:
+            bounds = config.METRICS["latency_buckets"]
+        return self._series("histogram", name, help_text, labels, lambda: Histogram(bounds))
+
+    def add_collector(self, collector: Callable[["MetricsRegistry"], None]) -> None:
+        self._collectors.append(collector)
+
+    def collect(self) -> None:
+        with self._lock:
+            for collector in self._collectors:
+                collector(self)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        {name: value} for unlabelled series, {name: [{"labels", "value"}]} otherwise;
+        histogram values are {"buckets": {upper bound: cumulative count}, "sum", "count"}.
+        """
+        self.collect()
+        snapshot: Dict[str, Any] = {}
+        for name, family in list(self._families.items()):
+            rows = []
+            for key, series in list(family["series"].items()):
+                if family["type"] == "histogram":
+                    cumulative = 0
+                    buckets = {}
+                    for bound, count in zip(series.bounds + (float("inf"),), series.counts):
+                        cumulative += count
+                        buckets[_format_value(bound)] = cumulative
+                    value = {"buckets": buckets, "sum": series.sum, "count": series.count}
+                else:
+                    value = series.value
+                rows.append({"labels": dict(key), "value": value})
+            if len(rows) == 1 and not rows[0]["labels"]:
+                snapshot[name] = rows[0]["value"]
+            else:
+                snapshot[name] = rows
+        return snapshot
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        self.collect()
+        lines = []
+        for name, family in list(self._families.items()):
+            if family["help"]:
+                lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for key, series in list(family["series"].items()):
+                if family["type"] != "histogram":
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(series.value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(series.bounds + (float("inf"),), series.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(series.sum)}")
+                lines.append(f"{name}_count{_format_labels(key)} {series.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _state_bytes(state: Any) -> int:
+    """Rough size of the aggregation containers: the containers themselves, not the values they share."""
+    # Runs in the metrics server thread while records are still being added: list() copies each dict atomically
+    size = sys.getsizeof
+    total = 0
+    engine = state.rollups
+    for rollup in engine.rollups.values():
+        total += size(rollup._groups) + size(rollup.keys) + size(rollup.first_seen)
+        total += size(rollup.min_response_time) + size(rollup.max_response_time)
+        total += sum(size(column) for column in (
+            rollup.request_count, rollup.error_count, rollup.get_count,
+            rollup.response_time_sum, rollup.execution_cost, rollup.memory_cost
+        ))
+        if rollup.payload_bytes:
+            total += sum(size(column) for column in (
+                rollup.request_bytes, rollup.response_bytes, rollup.cacheable_bytes, rollup.max_response_bytes
+            ))
+    for encoder in list(engine.encoders.values()):
+        total += size(encoder.codes) + size(encoder.values)
+    total += sum(size(histogram.counts) for histogram in list(state.status_codes.values()))
+    if state.latency is not None:
+        total += sum(size(histogram.counts) for histogram in list(state.latency.cells.values()))
+    if state.unique_users is not None:
+        counter = state.unique_users
+        sketches = [counter.overall] + list(counter.by_endpoint.values()) + list(counter.by_bucket.values())
+        total += sum(size(sketch.registers) for sketch in sketches)
+    if state.user_costs is not None:
+        users = state.user_costs.users
+        total += size(users) + sum(size(entry.by_endpoint) for entry in list(users.values()))
+    if state.sessions is not None:
+        sessions = state.sessions.open
+        total += size(sessions) + sum(size(session.endpoints) for session in list(sessions.values()))
+    if state.moments is not None:
+        by_endpoint = list(state.moments.by_endpoint.values())
+        total += size(state.moments.by_endpoint) + sum(size(moments) for moments in by_endpoint)
+    return total
+
+
+def watch_aggregator(registry: MetricsRegistry, state: Any) -> None:
+    """
+    Expose a LogAggregator's progress, reject rate and memory on every scrape.
+
+    The aggregator is only read when the registry is scraped, so watching it
+    costs nothing per record. Throughput is averaged since the watch started.
+    """
+    started = time.perf_counter()
+
+    def collect(registry: MetricsRegistry) -> None:
+        seen = state.records_seen
+        rejected = state.records_rejected
+        elapsed = time.perf_counter() - started
+        registry.counter("records_seen_total", "Records offered to the aggregator").set(seen)
+        registry.counter("records_rejected_total", "Records failing validate_log_entry").set(rejected)
+        registry.counter("records_outside_window_total", "Valid records outside the requested time window").set(
+            state.records_outside_window
+        )
+        registry.gauge("reject_ratio", "Invalid share of records seen").set(rejected / seen if seen else 0.0)
+        registry.gauge("records_per_second", "Records aggregated per second since the watch started").set(
+            round(seen / elapsed, 1) if elapsed else 0.0
+        )
+        registry.gauge("state_bytes", "Approximate memory held by the aggregation state").set(_state_bytes(state))
+
+        if state.sessions is not None:
+            registry.gauge("open_sessions", "User sessions currently held open").set(len(state.sessions.open))
+            registry.counter("evicted_sessions_total", "Sessions closed early to bound the open-session table").set(
+                state.sessions.evicted
+            )
+
+        engine = state.rollups
+        registry.gauge("rollup_groups", "Rollup groups held in memory").set(engine.group_count())
+        spill = engine.spill_stats()
+        registry.counter("spilled_groups_total", "Rollup groups written to spill files").set(spill["spilled_groups"])
+        # Dimension values are dictionary-encoded: every record looks each one up and only new values miss.
+        # The counters outlive spills, which start the dictionaries over
+        lookups = engine.encoded_records
+        for dimension in engine._used_dimensions:
+            misses = engine.encoder_misses[dimension]
+            registry.counter("encoder_lookups_total", "Dimension dictionary lookups", dimension=dimension).set(lookups)
+            registry.counter("encoder_misses_total", "Dimension dictionary lookups that added a new code", dimension=dimension).set(misses)
+            registry.gauge("encoder_hit_ratio", "Dimension dictionary lookups that found an existing code", dimension=dimension).set(
+                round(1 - misses / lookups, 4) if lookups else 0.0
+            )
+
+    registry.add_collector(collect)
+
+
+def record_run(registry: MetricsRegistry, run_stats: Dict[str, Any]) -> None:
+    """Fold the statistics of one finished cli.run_batch run into the registry."""
+    registry.counter("runs_total", "Batch runs completed").inc()
+    registry.counter("files_total", "Input files read").inc(run_stats["files"])
+    registry.counter("records_read_total", "Records read from input files").inc(run_stats["records_read"])
+    registry.counter("decode_errors_total", "Input lines that were not valid JSON objects").inc(run_stats["decode_errors"])
+    registry.counter("input_bytes_total", "Input bytes read").inc(run_stats["input_bytes"])
+    registry.gauge("last_run_records_per_second", "Aggregation throughput of the last run").set(run_stats["records_per_second"])
+    for stage, seconds in (("aggregate", run_stats["aggregate_seconds"]), ("report", run_stats["report_seconds"])):
+        registry.histogram(
+            "run_phase_seconds", "Wall time per run phase", bounds=config.METRICS["run_buckets"], phase=stage
+        ).observe(seconds)
+
+    for stage, stats in run_stats.get("pipeline", {}).get("stages", {}).items():
+        registry.histogram("stage_batch_seconds", "Busy time per batch in each pipeline stage", stage=stage).add_counts(
+            stats["batch_latency"], stats["busy_seconds"]
+        )
+        registry.counter("stage_busy_seconds_total", "Busy time per pipeline stage", stage=stage).inc(stats["busy_seconds"])
+        registry.gauge("stage_utilization", "Busy share of wall time in the last run", stage=stage).set(stats["utilization"])
+
+
+def serve(registry: MetricsRegistry, port: Optional[int] = None, host: Optional[str] = None) -> ThreadingHTTPServer:
+    """
+    Serve /metrics (Prometheus text) and /metrics.json from a daemon thread.
+
+    Port 0 picks a free port (see server.server_address). Call
+    server.shutdown() to stop.
+    """
+    # http.server pulls in the email package; only pay for it when serving
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import json
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self) -> None:
+            path = self.path.split("?", 1)[0]
+            if path == "/metrics":
+                body = registry.render().encode("utf-8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/metrics.json":
+                body = json.dumps(registry.snapshot()).encode("utf-8")
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            # Scrapes every few seconds would flood stderr
+            pass
+
+    server = ThreadingHTTPServer(
+        (config.METRICS["host"] if host is None else host, config.METRICS["port"] if port is None else port),
+        Handler
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,334 @@
+"""
+Staged batch pipeline: read -> decode -> validate -> aggregate.
+
+Each stage runs concurrently and hands lists of records to the next one
+through a bounded queue, so a slow stage applies backpressure instead of
+letting buffers grow. The source and the sink always run in the calling
+process; the middle stages run in threads or, to get past the GIL for
+CPU-bound work, in processes (stage functions must then be picklable).
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import functools
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+from bisect import bisect_left
+import aggregator
+import config
+import ingestion
+import utils
+
+QUEUE_SIZE = 4
+MODES = ("thread", "process")
+
+_DONE = "done"
+_POLL_SECONDS = 0.05
+
+
+def _new_stats() -> Dict[str, Any]:
+    return {
+        "batches": 0,
+        "items_in": 0,
+        "items_out": 0,
+        "busy_seconds": 0.0,
+        "wait_input_seconds": 0.0,
+        "wait_output_seconds": 0.0,
+        # Batches per busy-time bucket of config.METRICS["latency_buckets"], the last one unbounded
+        "batch_latency": [0] * (len(config.METRICS["latency_buckets"]) + 1)
+    }
+
+
+def _record_batch(stats: Dict[str, Any], seconds: float) -> None:
+    stats["busy_seconds"] += seconds
+    stats["batch_latency"][bisect_left(config.METRICS["latency_buckets"], seconds)] += 1
+
+
+def _get(inbox: Any, stop: Any) -> Any:
+    # None means the pipeline was stopped by a failure elsewhere
+    while True:
+        try:
+            return inbox.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            if stop.is_set():
+                return None
+
+
+def _put(outbox: Any, item: Any, stop: Any) -> bool:
+    while True:
+        try:
+            outbox.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            if stop.is_set():
+                return False
+
+
+def _run_stage(name: str, fn: Callable[[List[Any]], List[Any]], inbox: Any, outbox: Any, stop: Any, results: Any) -> None:
+    stats = _new_stats()
+    error = None
+    try:
+        while True:
+            waited = time.perf_counter()
+            batch = _get(inbox, stop)
+            started = time.perf_counter()
+            stats["wait_input_seconds"] += started - waited
+            if batch is None:
+                break
+            if batch == _DONE:
+                _put(outbox, _DONE, stop)
+                break
+
+            out = fn(batch)
+            finished = time.perf_counter()
+            _record_batch(stats, finished - started)
+            stats["batches"] += 1
+            stats["items_in"] += len(batch)
+            stats["items_out"] += len(out)
+
+            if out and not _put(outbox, out, stop):
+                break
+            stats["wait_output_seconds"] += time.perf_counter() - finished
+    except BaseException as e:
+        stop.set()
+        error = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+    if stop.is_set() and hasattr(outbox, "cancel_join_thread"):
+        # Batches nobody will read must not keep the process from exiting
+        outbox.cancel_join_thread()
+    results.put((name, stats, error))
+
+
+def _run_source(source: Iterable[List[Any]], outbox: Any, stop: Any, state: Dict[str, Any]) -> None:
+    stats = state["stats"]
+    try:
+        batches = iter(source)
+        while True:
+            started = time.perf_counter()
+            batch = next(batches, None)
+            finished = time.perf_counter()
+            if batch is None:
+                stats["busy_seconds"] += finished - started
+                _put(outbox, _DONE, stop)
+                return
+            _record_batch(stats, finished - started)
+            stats["batches"] += 1
+            stats["items_out"] += len(batch)
+            if not _put(outbox, batch, stop):
+                return
+            stats["wait_output_seconds"] += time.perf_counter() - finished
+    except BaseException as e:
+        stop.set()
+        state["error"] = e
+
+
+class Pipeline:
+    """
+    Bounded-queue pipeline over batches.
+
+    Args:
+        stages: (name, function) pairs; each function maps a batch (list) to a batch
+        mode: "thread" or "process" for the middle stages
+        queue_size: Batches buffered between two stages before the producer blocks
+    """
+
+    def __init__(self, stages: Sequence[Tuple[str, Callable[[List[Any]], List[Any]]]], mode: str = "thread", queue_size: int = QUEUE_SIZE):
+        if mode not in MODES:
+            raise ValueError(f"Unknown pipeline mode {mode!r}; choose from {MODES}")
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        self.stages = list(stages)
+        self.mode = mode
+        self.queue_size = queue_size
+
+    def run(
+        self,
+        source: Iterable[List[Any]],
+        sink: Callable[[List[Any]], None],
+        source_name: str = "read",
+        sink_name: str = "aggregate"
+    ) -> Dict[str, Any]:
+        """
+        Push every batch from source through the stages into sink.
+
+        Returns:
+            wall_seconds, the bottleneck stage and per-stage stats (batches,
+            items in/out, busy and waiting seconds, utilization)
+
+        Raises:
+            RuntimeError: If a stage fails; the other stages are stopped first
+        """
+        if self.mode == "process":
+            context = multiprocessing.get_context()
+            make_queue = lambda: context.Queue(maxsize=self.queue_size)
+            stop = context.Event()
+            results = context.Queue()
+            spawn = context.Process
+        else:
+            make_queue = lambda: queue.Queue(maxsize=self.queue_size)
+            stop = threading.Event()
+            results = queue.Queue()
+            spawn = threading.Thread
+
+        queues = [make_queue() for _ in range(len(self.stages) + 1)]
+        source_state = {"stats": _new_stats(), "error": None}
+        sink_stats = _new_stats()
+
+        started = time.perf_counter()
+        reader = threading.Thread(target=_run_source, args=(source, queues[0], stop, source_state), daemon=True)
+        workers = [
+            spawn(target=_run_stage, args=(name, fn, queues[i], queues[i + 1], stop, results), daemon=True)
+            for i, (name, fn) in enumerate(self.stages)
+        ]
+        # Start processes before the reader thread so nothing forks mid-read
+        for worker in workers:
+            worker.start()
+        reader.start()
+
+        sink_error = None
+        try:
+            while True:
+                waited = time.perf_counter()
+                batch = _get(queues[-1], stop)
+                begun = time.perf_counter()
+                sink_stats["wait_input_seconds"] += begun - waited
+                if batch is None or batch == _DONE:
+                    break
+                sink(batch)
+                _record_batch(sink_stats, time.perf_counter() - begun)
+                sink_stats["batches"] += 1
+                sink_stats["items_in"] += len(batch)
+        except BaseException as e:
+            stop.set()
+            sink_error = e
+
+        stage_results: Dict[str, Tuple[Dict[str, Any], Optional[str]]] = {}
+        for _ in workers:
+            name, stats, error = results.get()
+            stage_results[name] = (stats, error)
+        reader.join()
+        for worker in workers:
+            worker.join()
+        if stop.is_set():
+            for q in queues:
+                if hasattr(q, "cancel_join_thread"):
+                    q.cancel_join_thread()
+        wall_seconds = time.perf_counter() - started
+
+        if sink_error is not None:
+            raise sink_error
+        if source_state["error"] is not None:
+            raise RuntimeError(f"Pipeline stage '{source_name}' failed: {source_state['error']}") from source_state["error"]
+        for name, _ in self.stages:
+            error = stage_results[name][1]
+            if error is not None:
+                raise RuntimeError(f"Pipeline stage '{name}' failed: {error}")
+
+        ordered = [(source_name, source_state["stats"])]
+        ordered += [(name, stage_results[name][0]) for name, _ in self.stages]
+        ordered.append((sink_name, sink_stats))
+        stages = {}
+        for name, stats in ordered:
+            stats["utilization"] = round(utils.safe_divide(stats["busy_seconds"], wall_seconds), 3)
+            for key in ("busy_seconds", "wait_input_seconds", "wait_output_seconds"):
+                stats[key] = round(stats[key], 4)
+            stages[name] = stats
+
+        return {
+            "wall_seconds": round(wall_seconds, 4),
+            "bottleneck": max(stages, key=lambda name: stages[name]["utilization"]),
+            "stages": stages
+        }
+
+
+def _decode_stage(batch: List[Any]) -> List[Dict[str, Any]]:
+    return ingestion.decode_batch(batch)
+
+
+def _validate_stage(batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [log for log in batch if utils.validate_log_entry(log)]
+
+
+def _prefilter_stage(batch: List[Any], record_filter: Any) -> List[Any]:
+    return ingestion.filter_batch(batch, record_filter)
+
+
+def _filter_stage(batch: List[Dict[str, Any]], record_filter: Any) -> List[Dict[str, Any]]:
+    matches = record_filter.matches
+    return [log for log in batch if isinstance(log, dict) and matches(log)]
+
+
+LOG_STAGES = (("decode", _decode_stage), ("validate", _validate_stage))
+
+
+def log_stages(record_filter: Any = None) -> Sequence[Tuple[str, Callable[[List[Any]], List[Any]]]]:
+    """
+    LOG_STAGES, with a filters.RecordFilter pushed down around decoding.
+
+    Raw lines that cannot match are dropped before the decode stage and
+    decoded records that do not match before the validate stage.
+    """
+    if record_filter is None:
+        return LOG_STAGES
+    return (
+        ("prefilter", functools.partial(_prefilter_stage, record_filter=record_filter)),
+        ("decode", _decode_stage),
+        ("filter", functools.partial(_filter_stage, record_filter=record_filter)),
+        ("validate", _validate_stage)
+    )
+
+
+def aggregate_files(
+    paths: Sequence[str],
+    starttime: Optional[str] = None,
+    endtime: Optional[str] = None,
+    sections: Optional[Sequence[str]] = None,
+    mode: str = "thread",
+    batch_size: int = ingestion.BATCH_SIZE,
+    queue_size: int = QUEUE_SIZE,
+    max_groups: Optional[int] = None,
+    registry: Any = None,
+    record_filter: Any = None
+) -> Tuple[aggregator.LogAggregator, Dict[str, int], Dict[str, Any]]:
+    """
+    Aggregate log files through the read -> decode -> validate -> aggregate pipeline.
+
+    Only the trackers the report sections need are attached (see
+    aggregator.TRACKERS). Records reach the aggregator in file order, so the result is the same as
+    feeding iter_records() into LogAggregator.add() one by one. A
+    metrics.MetricsRegistry passed as registry watches the aggregator. With
+    a filters.RecordFilter, non-matching records are dropped before
+    validation and counted as filtered in the read statistics.
+
+    Returns:
+        (aggregator, read statistics, pipeline statistics)
+    """
+    state = aggregator.LogAggregator(starttime, endtime, sections, max_groups=max_groups)
+    if registry is not None:
+        import metrics
+        metrics.watch_aggregator(registry, state)
+    read_stats = {"bytes": 0}
+
+    def sink(batch: List[Dict[str, Any]]) -> None:
+        for log in batch:
+            state.add(log, validated=True)
+
+    pipeline_stats = Pipeline(log_stages(record_filter), mode, queue_size).run(
+        ingestion.iter_raw_batches(paths, batch_size, read_stats), sink
+    )
+
+    stages = pipeline_stats["stages"]
+    decode = stages["decode"]
+    validate = stages["validate"]
+    read_stats["records"] = decode["items_out"]
+    read_stats["decode_errors"] = decode["items_in"] - decode["items_out"]
+    read_stats["filtered"] = 0
+    for name in ("prefilter", "filter"):
+        if name in stages:
+            read_stats["filtered"] += stages[name]["items_in"] - stages[name]["items_out"]
+    if "prefilter" in stages:
+        # Lines dropped unread still count as read
+        read_stats["records"] += stages["prefilter"]["items_in"] - stages["prefilter"]["items_out"]
+    state.records_seen += validate["items_in"] - validate["items_out"]
+    state.records_rejected += validate["items_in"] - validate["items_out"]
+    return state, read_stats, pipeline_stats
@@ -0,0 +1,186 @@
+"""
+Streaming report serialization.
+
+Writes the analyze_api_logs report as JSON (indented like json.dump(report,
+out, indent=2)) or NDJSON (one {"section", "data"} line per section),
+section by section straight from the aggregation state. Each section is
+computed, written and dropped before the next one is built, so neither the
+whole report dict nor its full JSON text is ever held in memory. Output is
+byte-for-byte what json.dump would write for the same report.
+"""
+from __future__ import annotations
+import json
+from json.encoder import encode_basestring_ascii
+import main
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Iterable, List, Optional, Sequence, TextIO, Tuple
+
+FORMATS = ("json", "ndjson")
+
+INDENT = "  "
+
+# Pending pieces written out in one call once this many have accumulated
+FLUSH_PIECES = 4096
+
+_float_repr = float.__repr__
+_int_repr = int.__repr__
+_INFINITY = float("inf")
+
+
+def _float_str(value: float) -> str:
+    # Same spelling as json for the non-finite values
+    if value != value:
+        return "NaN"
+    if value == _INFINITY:
+        return "Infinity"
+    if value == -_INFINITY:
+        return "-Infinity"
+    return _float_repr(value)
+
+
+def _key_str(key: Any) -> str:
+    if isinstance(key, str):
+        return encode_basestring_ascii(key)
+    if key is True:
+        return '"true"'
+    if key is False:
+        return '"false"'
+    if key is None:
+        return '"null"'
+    if isinstance(key, int):
+        return '"' + _int_repr(key) + '"'
+    if isinstance(key, float):
+        return '"' + _float_str(key) + '"'
+    raise TypeError(f"keys must be str, int, float, bool or None, not {key.__class__.__name__}")
+
+
+class _IndentedWriter:
+    """
+    Indented JSON encoder that writes to a text stream as it goes.
+
+    json.dump with indent falls back to the pure-Python encoder, which yields
+    one small string per token through a chain of generators. This writes
+    the same text from a direct recursive walk into a piece buffer, with
+    strings escaped by the C escaper and numbers formatted by repr.
+    """
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.pieces: List[str] = []
+
+    def flush(self) -> None:
+        if self.pieces:
+            self.out.write("".join(self.pieces))
+            # Cleared in place: enclosing containers hold a reference to the list
+            self.pieces.clear()
+
+    def scalar(self, value: Any) -> Optional[str]:
+        # Strings first: they are the most common value in a report
+        if isinstance(value, str):
+            return encode_basestring_ascii(value)
+        if value is None:
+            return "null"
+        if value is True:
+            return "true"
+        if value is False:
+            return "false"
+        if isinstance(value, int):
+            return _int_repr(value)
+        if isinstance(value, float):
+            return _float_str(value)
+        return None
+
+    def value(self, value: Any, level: int) -> None:
+        text = self.scalar(value)
+        if text is not None:
+            self.pieces.append(text)
+        elif isinstance(value, dict):
+            self.mapping(value, level)
+        elif isinstance(value, (list, tuple)):
+            self.sequence(value, level)
+        else:
+            raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
+        if len(self.pieces) >= FLUSH_PIECES:
+            self.flush()
+
+    def mapping(self, value: dict, level: int) -> None:
+        if not value:
+            self.pieces.append("{}")
+            return
+        pieces = self.pieces
+        inner = "\n" + INDENT * (level + 1)
+        separator = "," + inner
+        pieces.append("{" + inner)
+        first = True
+        for key, item in value.items():
+            if first:
+                first = False
+            else:
+                pieces.append(separator)
+            pieces.append(_key_str(key) + ": ")
+            self.value(item, level + 1)
+        pieces.append("\n" + INDENT * level + "}")
+
+    def sequence(self, value: Sequence[Any], level: int) -> None:
+        if not value:
+            self.pieces.append("[]")
+            return
+        pieces = self.pieces
+        inner = "\n" + INDENT * (level + 1)
+        separator = "," + inner
+        pieces.append("[" + inner)
+        first = True
+        for item in value:
+            if first:
+                first = False
+            else:
+                pieces.append(separator)
+            self.value(item, level + 1)
+        pieces.append("\n" + INDENT * level + "]")
+
+
+def write_sections(sections: Iterable[Tuple[str, Any]], out: TextIO, output_format: str = "json") -> None:
+    """
+    Write (key, value) report sections to a text stream as they arrive.
+
+    Args:
+        sections: Report sections in order, e.g. report.items() or main._iter_report(state)
+        out: Anything with a write(str) method: a file, sys.stdout, socket.makefile("w")
+        output_format: "json" (one indented object) or "ndjson" (one line per section)
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown report format {output_format!r}; choose from {FORMATS}")
+
+    if output_format == "ndjson":
+        # The C encoder is already the fast path for compact JSON
+        for section, data in sections:
+            out.write(json.dumps({"section": section, "data": data}) + "\n")
+        return
+
+    writer = _IndentedWriter(out)
+    opened = False
+    for section, data in sections:
+        writer.pieces.append(",\n" + INDENT if opened else "{\n" + INDENT)
+        opened = True
+        writer.pieces.append(_key_str(section) + ": ")
+        writer.value(data, 1)
+        writer.flush()
+    writer.pieces.append("\n}\n" if opened else "{}\n")
+    writer.flush()
+
+
+def write_report(
+    state: Any,
+    out: TextIO,
+    output_format: str = "json",
+    sections: Optional[Sequence[str]] = None
+) -> None:
+    """
+    Stream the report for an aggregation state to out, one section at a time.
+
+    Writes the same text as json.dump(main._build_report(state, sections), out,
+    indent=2) plus a trailing newline (or the NDJSON equivalent), without
+    building the report first.
+    """
+    write_sections(main._iter_report(state, sections), out, output_format)
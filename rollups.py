@@ -0,0 +1,707 @@
+from __future__ import annotations
+from array import array
+import heapq
+import marshal
+import os
+import config
+import utils
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+DIMENSIONS = ("endpoint", "method", "status_code", "status_class", "user_id", "hour", "time_bucket")
+
+# Rollups the standard report sections are projected from
+REPORT_DIMENSION_SETS = (
+    (),
+    ("endpoint",),
+    ("hour",),
+    ("user_id",)
+)
+
+# Rollups the bandwidth section reads payload bytes from; rollups over time_bucket keep them too
+BYTE_DIMENSION_SETS = (
+    (),
+    ("endpoint",),
+    ("user_id",),
+    ("endpoint", "time_bucket")
+)
+
+KEY_BITS = 32
+
+MEASURES = (
+    "request_count", "error_count", "get_count", "response_time_sum",
+    "execution_cost", "memory_cost", "min_response_time", "max_response_time",
+    "request_bytes", "response_bytes", "cacheable_bytes", "max_response_bytes"
+)
+
+# Kept only by rollups built with payload_bytes; always last in MEASURES
+BYTE_MEASURES = MEASURES[-4:]
+
+EMPTY_MEASURES = {
+    "request_count": 0,
+    "error_count": 0,
+    "get_count": 0,
+    "response_time_sum": 0.0,
+    "execution_cost": 0.0,
+    "memory_cost": 0.0,
+    "min_response_time": None,
+    "max_response_time": None,
+    "request_bytes": 0.0,
+    "response_bytes": 0.0,
+    "cacheable_bytes": 0.0,
+    "max_response_bytes": None
+}
+
+
+class _Encoder:
+    """Dictionary encoder mapping one dimension's values to dense integer codes."""
+
+    __slots__ = ("codes", "values")
+
+    def __init__(self):
+        self.codes: Dict[Any, int] = {}
+        self.values: List[Any] = []
+
+    def encode(self, value: Any) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class Rollup:
+    """
+    Aggregates for one combination of dimensions.
+
+    Each group is keyed by the dimension codes packed into a single int and
+    owns one slot in every measure column. Counts and sums live in typed
+    arrays; min/max stay in lists so they keep the input's numeric type.
+    The BYTE_MEASURES columns exist only with payload_bytes.
+    """
+
+    def __init__(self, dimensions: Sequence[str], payload_bytes: bool = False):
+        self.dimensions = tuple(dimensions)
+        self.payload_bytes = payload_bytes
+        self.measure_names = MEASURES if payload_bytes else MEASURES[:-len(BYTE_MEASURES)]
+        self._groups: Dict[int, int] = {}
+        self.keys: List[int] = []
+        self.request_count = array("q")
+        self.error_count = array("q")
+        self.get_count = array("q")
+        self.response_time_sum = array("d")
+        self.execution_cost = array("d")
+        self.memory_cost = array("d")
+        self.min_response_time: List[Any] = []
+        self.max_response_time: List[Any] = []
+        # Payload bytes; cacheable_bytes counts the responses to successful GETs
+        self.request_bytes: Optional[array] = None
+        self.response_bytes: Optional[array] = None
+        self.cacheable_bytes: Optional[array] = None
+        self.max_response_bytes: Optional[List[Any]] = None
+        if payload_bytes:
+            self.request_bytes = array("d")
+            self.response_bytes = array("d")
+            self.cacheable_bytes = array("d")
+            self.max_response_bytes = []
+        # Engine-wide sequence number of the record that created each group
+        self.first_seen = array("q")
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def clear(self) -> None:
+        self.__init__(self.dimensions, self.payload_bytes)
+
+    def _slot(self, key: int, seq: int) -> int:
+        slot = self._groups.get(key)
+        if slot is None:
+            slot = self._groups[key] = len(self.keys)
+            self.keys.append(key)
+            self.first_seen.append(seq)
+            self.request_count.append(0)
+            self.error_count.append(0)
+            self.get_count.append(0)
+            self.response_time_sum.append(0.0)
+            self.execution_cost.append(0.0)
+            self.memory_cost.append(0.0)
+            self.min_response_time.append(None)
+            self.max_response_time.append(None)
+            if self.payload_bytes:
+                self.request_bytes.append(0.0)
+                self.response_bytes.append(0.0)
+                self.cacheable_bytes.append(0.0)
+                self.max_response_bytes.append(None)
+        return slot
+
+    def add(
+        self,
+        key: int,
+        response_time: Any,
+        is_error: bool,
+        is_get: bool,
+        execution_cost: float,
+        memory_cost: float,
+        request_bytes: Any,
+        response_bytes: Any,
+        seq: int
+    ) -> None:
+        slot = self._groups.get(key)
+        if slot is None:
+            slot = self._slot(key, seq)
+        self.request_count[slot] += 1
+        if is_error:
+            self.error_count[slot] += 1
+        if is_get:
+            self.get_count[slot] += 1
+        self.response_time_sum[slot] += response_time
+        self.execution_cost[slot] += execution_cost
+        self.memory_cost[slot] += memory_cost
+        current = self.min_response_time[slot]
+        if current is None or response_time < current:
+            self.min_response_time[slot] = response_time
+        current = self.max_response_time[slot]
+        if current is None or response_time > current:
+            self.max_response_time[slot] = response_time
+        if not self.payload_bytes:
+            return
+        self.request_bytes[slot] += request_bytes
+        self.response_bytes[slot] += response_bytes
+        if is_get and not is_error:
+            self.cacheable_bytes[slot] += response_bytes
+        current = self.max_response_bytes[slot]
+        if current is None or response_bytes > current:
+            self.max_response_bytes[slot] = response_bytes
+
+    def add_measures(self, key: int, measures: Dict[str, Any], seq: int = 0) -> None:
+        slot = self._slot(key, seq)
+        if seq < self.first_seen[slot]:
+            self.first_seen[slot] = seq
+        self.request_count[slot] += measures["request_count"]
+        self.error_count[slot] += measures["error_count"]
+        self.get_count[slot] += measures["get_count"]
+        self.response_time_sum[slot] += measures["response_time_sum"]
+        self.execution_cost[slot] += measures["execution_cost"]
+        self.memory_cost[slot] += measures["memory_cost"]
+        extremes = [
+            (self.min_response_time, measures["min_response_time"], lambda a, b: a < b),
+            (self.max_response_time, measures["max_response_time"], lambda a, b: a > b)
+        ]
+        if self.payload_bytes:
+            if "request_bytes" not in measures:
+                raise ValueError("Measures without payload bytes cannot go into a rollup that keeps them")
+            self.request_bytes[slot] += measures["request_bytes"]
+            self.response_bytes[slot] += measures["response_bytes"]
+            self.cacheable_bytes[slot] += measures["cacheable_bytes"]
+            extremes.append((self.max_response_bytes, measures["max_response_bytes"], lambda a, b: a > b))
+        for column, value, better in extremes:
+            if value is not None and (column[slot] is None or better(value, column[slot])):
+                column[slot] = value
+
+    def measures(self, slot: int) -> Dict[str, Any]:
+        measures = {
+            "request_count": self.request_count[slot],
+            "error_count": self.error_count[slot],
+            "get_count": self.get_count[slot],
+            "response_time_sum": self.response_time_sum[slot],
+            "execution_cost": self.execution_cost[slot],
+            "memory_cost": self.memory_cost[slot],
+            "min_response_time": self.min_response_time[slot],
+            "max_response_time": self.max_response_time[slot]
+        }
+        if self.payload_bytes:
+            measures["request_bytes"] = self.request_bytes[slot]
+            measures["response_bytes"] = self.response_bytes[slot]
+            measures["cacheable_bytes"] = self.cacheable_bytes[slot]
+            measures["max_response_bytes"] = self.max_response_bytes[slot]
+        return measures
+
+
+class StatusCodeHistogram:
+    """
+    Request counts for every status code of one endpoint, in a fixed array.
+
+    Slot status_code - config.STATUS_CODE_BASE counts that code, so adding a
+    record is one index and merging is a slot-wise sum, whatever codes occur.
+    """
+
+    __slots__ = ("counts",)
+
+    def __init__(self):
+        self.counts = array("q", bytes(8 * config.STATUS_CODE_SLOTS))
+
+    def add(self, status_code: int, count: int = 1) -> None:
+        try:
+            self.counts[status_code - config.STATUS_CODE_BASE] += count
+        except TypeError:
+            # Integral floats such as 404.0 pass validation
+            self.counts[int(status_code) - config.STATUS_CODE_BASE] += count
+
+    def merge(self, other: "StatusCodeHistogram") -> "StatusCodeHistogram":
+        counts = self.counts
+        for slot, count in enumerate(other.counts):
+            if count:
+                counts[slot] += count
+        return self
+
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def most_common(self) -> Optional[int]:
+        """Most frequent status code; the lowest code wins a tie."""
+        top = max(self.counts)
+        if not top:
+            return None
+        return self.counts.index(top) + config.STATUS_CODE_BASE
+
+    def codes(self) -> Dict[str, int]:
+        return {
+            str(slot + config.STATUS_CODE_BASE): count
+            for slot, count in enumerate(self.counts)
+            if count
+        }
+
+    def classes(self) -> Dict[str, int]:
+        base = config.STATUS_CODE_BASE
+        return {
+            f"{first // 100}xx": sum(self.counts[first - base:first - base + 100])
+            for first in range(base, base + config.STATUS_CODE_SLOTS, 100)
+        }
+
+
+class _SpillStore:
+    """
+    Local temp files holding rollup groups spilled out of memory.
+
+    Groups are hash-partitioned by their dimension values into one file per
+    (rollup, partition); each spill appends one marshal blob per file. The
+    directory is removed when the store is closed or garbage collected.
+    """
+
+    def __init__(self, partitions: int, directory: Optional[str] = None):
+        # Spilling is off by default, so these stay out of the import of main
+        import shutil
+        import tempfile
+        import weakref
+        self.partitions = partitions
+        self.path = tempfile.mkdtemp(prefix="api-log-spill-", dir=directory)
+        self._cleanup = weakref.finalize(self, shutil.rmtree, self.path, True)
+        self.spills = 0
+        self.groups = 0
+        self.bytes = 0
+        self._files: Dict[int, set] = {}
+
+    def _file(self, index: int, partition: int) -> str:
+        return os.path.join(self.path, f"{index}-{partition}.spill")
+
+    def partition(self, values: Tuple[Any, ...]) -> int:
+        # hash() differs between processes, but spill files never leave the process that wrote them
+        return hash(values) % self.partitions
+
+    def write(self, index: int, entries: List[Tuple[Any, ...]]) -> None:
+        buckets: List[List[Tuple[Any, ...]]] = [[] for _ in range(self.partitions)]
+        for entry in entries:
+            buckets[self.partition(entry[0])].append(entry)
+        files = self._files.setdefault(index, set())
+        for partition, bucket in enumerate(buckets):
+            if not bucket:
+                continue
+            data = marshal.dumps(bucket)
+            with open(self._file(index, partition), "ab") as f:
+                f.write(data)
+            files.add(partition)
+            self.bytes += len(data)
+        self.groups += len(entries)
+
+    def has(self, index: int) -> bool:
+        return bool(self._files.get(index))
+
+    def read(self, index: int, partition: int) -> Iterator[Tuple[Any, ...]]:
+        if partition not in self._files.get(index, ()):
+            return
+        with open(self._file(index, partition), "rb") as f:
+            while True:
+                try:
+                    bucket = marshal.load(f)
+                except EOFError:
+                    return
+                yield from bucket
+
+    def discard(self, index: int) -> None:
+        for partition in self._files.pop(index, ()):
+            os.remove(self._file(index, partition))
+
+    def close(self) -> None:
+        self._cleanup()
+
+
+def _entry_measures(entry: Tuple[Any, ...]) -> Dict[str, Any]:
+    # Spilled entry: (values, first_seen, *the rollup's measures in MEASURES order)
+    return dict(zip(MEASURES, entry[2:]))
+
+
+class RollupEngine:
+    """
+    Single-scan group-by engine over a configured set of dimension combinations.
+
+    Dimension values are dictionary-encoded once per record and shared by all
+    rollups. The report sections are projections of REPORT_DIMENSION_SETS;
+    query() answers ad-hoc slices from whichever rollup covers the requested
+    dimensions, without going back to the raw logs.
+
+    With max_groups set, memory is budgeted: once the rollups hold more than
+    max_groups groups, every group is spilled to hash-partitioned temp files
+    and the in-memory rollups start over. Reads merge the spills back, so
+    results are exact. rows()/lookup()/query() restore the whole rollup they
+    read (the endpoint rollup is needed in full by the report anyway), while
+    top() merges one partition at a time and keeps only the best n groups.
+
+    With payload_bytes, the rollups the bandwidth section reads
+    (BYTE_DIMENSION_SETS, added if missing, and any over time_bucket) also
+    keep BYTE_MEASURES.
+    """
+
+    def __init__(
+        self,
+        extra_dimension_sets: Optional[Iterable[Sequence[str]]] = None,
+        time_bucket_seconds: Optional[int] = None,
+        max_groups: Optional[int] = None,
+        spill_partitions: Optional[int] = None,
+        spill_directory: Optional[str] = None,
+        payload_bytes: bool = False
+    ):
+        if extra_dimension_sets is None:
+            extra_dimension_sets = config.ROLLUPS["extra_dimension_sets"]
+        if time_bucket_seconds is None:
+            time_bucket_seconds = config.ROLLUPS["time_bucket_seconds"]
+        self.time_bucket_seconds = time_bucket_seconds
+        self.payload_bytes = payload_bytes
+        self.max_groups = config.SPILL["max_groups"] if max_groups is None else max_groups
+        self.spill_partitions = config.SPILL["partitions"] if spill_partitions is None else spill_partitions
+        self.spill_directory = config.SPILL["directory"] if spill_directory is None else spill_directory
+
+        self.rollups: Dict[Tuple[str, ...], Rollup] = {}
+        dimension_sets = list(REPORT_DIMENSION_SETS) + [tuple(d) for d in extra_dimension_sets]
+        if payload_bytes:
+            dimension_sets += BYTE_DIMENSION_SETS
+        for dimensions in dimension_sets:
+            unknown = [d for d in dimensions if d not in DIMENSIONS]
+            if unknown:
+                raise ValueError(f"Unknown rollup dimensions: {unknown}")
+            dimensions = tuple(dimensions)
+            if dimensions not in self.rollups:
+                keeps_bytes = payload_bytes and (dimensions in BYTE_DIMENSION_SETS or "time_bucket" in dimensions)
+                self.rollups[dimensions] = Rollup(dimensions, keeps_bytes)
+
+        self.encoders = {dimension: _Encoder() for dimension in DIMENSIONS}
+        # Dictionary lookups by add(), kept across spills (which start the encoders over)
+        self.encoded_records = 0
+        self.encoder_misses = {dimension: 0 for dimension in DIMENSIONS}
+        used = {d for dimensions in self.rollups for d in dimensions}
+        self._used_dimensions = [d for d in DIMENSIONS if d in used]
+        self._plans = [
+            (rollup, [(d, KEY_BITS * i) for i, d in enumerate(rollup.dimensions)])
+            for rollup in self.rollups.values()
+        ]
+        self.sequence = 0
+        self._since_check = 0
+        self._spill: Optional[_SpillStore] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Spill files are local to this process: ship every group in memory instead
+        if self._spill is not None:
+            for dimensions in self.rollups:
+                self._restore(dimensions)
+            self._spill.close()
+            self._spill = None
+        return self.__dict__
+
+    def add(
+        self,
+        log: Dict[str, Any],
+        log_time: Any,
+        epoch_seconds: float,
+        is_error: bool,
+        execution_cost: float,
+        memory_cost: float
+    ) -> None:
+        # Encode each dimension once; every rollup reuses the codes
+        codes = {}
+        misses = self.encoder_misses
+        for dimension in self._used_dimensions:
+            if dimension == "status_class":
+                value = f"{log['status_code'] // 100}xx"
+            elif dimension == "hour":
+                value = log_time.strftime("%H:00")
+            elif dimension == "time_bucket":
+                value = int(epoch_seconds // self.time_bucket_seconds) * self.time_bucket_seconds
+            else:
+                value = log[dimension]
+            encoder = self.encoders[dimension]
+            code = encoder.codes.get(value)
+            if code is None:
+                code = encoder.encode(value)
+                misses[dimension] += 1
+            codes[dimension] = code
+        self.encoded_records += 1
+
+        response_time = log["response_time_ms"]
+        is_get = log["method"] == "GET"
+        request_bytes = log["request_size_bytes"]
+        response_bytes = log["response_size_bytes"]
+        self.sequence += 1
+        seq = self.sequence
+        for rollup, plan in self._plans:
+            key = 0
+            for dimension, shift in plan:
+                key |= codes[dimension] << shift
+            rollup.add(key, response_time, is_error, is_get, execution_cost, memory_cost, request_bytes, response_bytes, seq)
+
+        if self.max_groups:
+            self._check_budget()
+
+    def _check_budget(self) -> None:
+        # Counting groups costs a few len() calls, so only every check_every records
+        self._since_check += 1
+        if self._since_check >= config.SPILL["check_every"]:
+            self._since_check = 0
+            if self.group_count() > self.max_groups:
+                self.spill()
+
+    def group_count(self) -> int:
+        """Groups held in memory, across the rollups that can spill."""
+        return sum(len(rollup) for dimensions, rollup in self.rollups.items() if dimensions)
+
+    def spill(self) -> None:
+        """Write every in-memory group (except the grand total) to the spill files and start over."""
+        if self._spill is None:
+            self._spill = _SpillStore(self.spill_partitions, self.spill_directory)
+        for index, (dimensions, rollup) in enumerate(self.rollups.items()):
+            if not dimensions or not len(rollup):
+                continue
+            self._spill.write(index, [
+                (self._decode(rollup, key), rollup.first_seen[slot]) + tuple(rollup.measures(slot)[m] for m in rollup.measure_names)
+                for slot, key in enumerate(rollup.keys)
+            ])
+            rollup.clear()
+        # Nothing in memory refers to the old codes any more
+        self.encoders = {dimension: _Encoder() for dimension in DIMENSIONS}
+        self._spill.spills += 1
+
+    def spill_stats(self) -> Dict[str, Any]:
+        spill = self._spill
+        return {
+            "max_groups": self.max_groups,
+            "groups_in_memory": self.group_count(),
+            "spills": spill.spills if spill else 0,
+            "spilled_groups": spill.groups if spill else 0,
+            "spill_bytes": spill.bytes if spill else 0,
+            "partitions": self.spill_partitions
+        }
+
+    def close(self) -> None:
+        """Delete any spill files now rather than when the engine is garbage collected."""
+        if self._spill is not None:
+            self._spill.close()
+
+    def _index(self, dimensions: Sequence[str]) -> int:
+        return list(self.rollups).index(tuple(dimensions))
+
+    def _restore(self, dimensions: Sequence[str]) -> None:
+        """Merge a rollup's spilled groups back into memory, in first-seen order."""
+        if self._spill is None:
+            return
+        index = self._index(dimensions)
+        if not self._spill.has(index):
+            return
+        rollup = self.rollup(dimensions)
+        groups: Dict[Tuple[Any, ...], int] = {}
+        merged = Rollup([], rollup.payload_bytes)
+        for slot, key in enumerate(rollup.keys):
+            values = self._decode(rollup, key)
+            merged.add_measures(groups.setdefault(values, len(groups)), rollup.measures(slot), rollup.first_seen[slot])
+        for partition in range(self._spill.partitions):
+            for entry in self._spill.read(index, partition):
+                merged.add_measures(groups.setdefault(entry[0], len(groups)), _entry_measures(entry), entry[1])
+
+        rollup.clear()
+        for values, slot in sorted(groups.items(), key=lambda item: merged.first_seen[item[1]]):
+            self.add_group(dimensions, values, merged.measures(slot), merged.first_seen[slot], check_budget=False)
+        self._spill.discard(index)
+
+    def rollup(self, dimensions: Sequence[str]) -> Rollup:
+        try:
+            return self.rollups[tuple(dimensions)]
+        except KeyError:
+            raise ValueError(f"No rollup configured for dimensions {tuple(dimensions)}") from None
+
+    def _decode(self, rollup: Rollup, key: int) -> Tuple[Any, ...]:
+        mask = (1 << KEY_BITS) - 1
+        return tuple(
+            self.encoders[d].values[(key >> (KEY_BITS * i)) & mask]
+            for i, d in enumerate(rollup.dimensions)
+        )
+
+    def rows(self, dimensions: Sequence[str]) -> Iterator[Tuple[Tuple[Any, ...], Dict[str, Any]]]:
+        """Yield (dimension values, raw measures) for every group of a configured rollup, in first-seen order."""
+        self._restore(dimensions)
+        rollup = self.rollup(dimensions)
+        for slot in sorted(range(len(rollup)), key=rollup.first_seen.__getitem__):
+            yield self._decode(rollup, rollup.keys[slot]), rollup.measures(slot)
+
+    def top(self, dimensions: Sequence[str], n: int, measure: str = "request_count") -> List[Tuple[Tuple[Any, ...], Dict[str, Any]]]:
+        """
+        The n groups with the largest measure, ties going to the group seen first.
+
+        Same result as sorting rows() by the measure, but a spilled rollup is
+        merged one partition at a time and never held in memory as a whole.
+        """
+        rollup = self.rollup(dimensions)
+        index = self._index(dimensions)
+
+        def ranked(candidates):
+            return heapq.nlargest(n, candidates, key=lambda c: (c[2][measure], -c[1]))
+
+        in_memory = [
+            (self._decode(rollup, key), rollup.first_seen[slot], rollup.measures(slot))
+            for slot, key in enumerate(rollup.keys)
+        ]
+        if self._spill is None or not self._spill.has(index):
+            return [(values, measures) for values, _, measures in ranked(in_memory)]
+
+        by_partition: Dict[int, list] = {}
+        for candidate in in_memory:
+            by_partition.setdefault(self._spill.partition(candidate[0]), []).append(candidate)
+        best: list = []
+        for partition in range(self._spill.partitions):
+            groups: Dict[Tuple[Any, ...], int] = {}
+            merged = Rollup([], rollup.payload_bytes)
+            for values, first_seen, measures in by_partition.pop(partition, ()):
+                merged.add_measures(groups.setdefault(values, len(groups)), measures, first_seen)
+            for entry in self._spill.read(index, partition):
+                merged.add_measures(groups.setdefault(entry[0], len(groups)), _entry_measures(entry), entry[1])
+            best = ranked(best + [
+                (values, merged.first_seen[slot], merged.measures(slot)) for values, slot in groups.items()
+            ])
+        return [(values, measures) for values, _, measures in best]
+
+    def totals(self) -> Dict[str, Any]:
+        rollup = self.rollup(())
+        return rollup.measures(0) if len(rollup) else dict(EMPTY_MEASURES)
+
+    def lookup(self, dimensions: Sequence[str], values: Sequence[Any]) -> Optional[Dict[str, Any]]:
+        """Raw measures for one group of a configured rollup, or None if never seen."""
+        self._restore(dimensions)
+        rollup = self.rollup(dimensions)
+        key = 0
+        for i, (dimension, value) in enumerate(zip(rollup.dimensions, values)):
+            code = self.encoders[dimension].codes.get(value)
+            if code is None:
+                return None
+            key |= code << (KEY_BITS * i)
+        slot = rollup._groups.get(key)
+        return None if slot is None else rollup.measures(slot)
+
+    def query(self, group_by: Sequence[str], where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Answer an ad-hoc slice from the smallest rollup covering the requested dimensions.
+
+        Args:
+            group_by: Dimensions to group by, e.g. ["endpoint", "method", "time_bucket"]
+            where: Optional filters, dimension -> value or list/set/tuple of accepted values
+
+        Returns:
+            One row per group with dimension values, counts, error rate and response times
+
+        Raises:
+            ValueError: If no configured rollup covers the dimensions
+        """
+        where = where or {}
+        needed = set(group_by) | set(where)
+        candidates = [r for dims, r in self.rollups.items() if needed <= set(dims)]
+        if not candidates:
+            raise ValueError(f"No rollup covers dimensions {sorted(needed)}; add them to config.ROLLUPS")
+        source = min(candidates, key=lambda r: (len(r.dimensions), len(r)))
+        self._restore(source.dimensions)
+
+        accepted = {
+            d: set(v) if isinstance(v, (list, set, tuple, frozenset)) else {v}
+            for d, v in where.items()
+        }
+        positions = {d: i for i, d in enumerate(source.dimensions)}
+
+        # Re-aggregate the source groups into the requested grouping
+        projected = Rollup([], source.payload_bytes)
+        groups: Dict[Tuple[Any, ...], int] = {}
+        for slot in sorted(range(len(source)), key=source.first_seen.__getitem__):
+            values = self._decode(source, source.keys[slot])
+            if any(values[positions[d]] not in allowed for d, allowed in accepted.items()):
+                continue
+            group = tuple(values[positions[d]] for d in group_by)
+            projected.add_measures(groups.setdefault(group, len(groups)), source.measures(slot))
+
+        rows = []
+        for group, slot in groups.items():
+            measures = projected.measures(slot)
+            row = {}
+            for dimension, value in zip(group_by, group):
+                row[dimension] = utils.format_timestamp(value) if dimension == "time_bucket" else value
+            row.update({
+                "request_count": measures["request_count"],
+                "error_count": measures["error_count"],
+                "error_rate_percentage": round(utils.safe_divide(measures["error_count"] * 100, measures["request_count"]), 1),
+                "avg_response_time_ms": round(utils.safe_divide(measures["response_time_sum"], measures["request_count"]), 1),
+                "min_response_time_ms": measures["min_response_time"],
+                "max_response_time_ms": measures["max_response_time"]
+            })
+            if source.payload_bytes:
+                row["request_bytes"] = measures["request_bytes"]
+                row["response_bytes"] = measures["response_bytes"]
+            rows.append(row)
+        return rows
+
+    def add_group(
+        self,
+        dimensions: Sequence[str],
+        values: Sequence[Any],
+        measures: Dict[str, Any],
+        first_seen: Optional[int] = None,
+        check_budget: bool = True
+    ) -> None:
+        """Fold pre-aggregated measures for one group (e.g. from another shard or a SQL GROUP BY) into a rollup."""
+        rollup = self.rollup(dimensions)
+        key = 0
+        for i, (dimension, value) in enumerate(zip(rollup.dimensions, values)):
+            key |= self.encoders[dimension].encode(value) << (KEY_BITS * i)
+        if first_seen is None:
+            self.sequence += 1
+            first_seen = self.sequence
+        rollup.add_measures(key, measures, first_seen)
+        if check_budget and self.max_groups:
+            self._check_budget()
+
+    def merge(self, other: "RollupEngine") -> "RollupEngine":
+        """Fold another engine's rollups into this one, re-mapping its dimension codes."""
+        if other.payload_bytes != self.payload_bytes:
+            # One side has no byte totals, so no merged total would be right
+            raise ValueError("Cannot merge rollups kept with and without payload bytes (the bandwidth section)")
+        # The other shard's groups count as first seen after all of ours
+        offset = self.sequence
+        for index, (dimensions, other_rollup) in enumerate(other.rollups.items()):
+            if dimensions not in self.rollups:
+                continue
+            for slot, key in enumerate(other_rollup.keys):
+                self.add_group(
+                    dimensions, other._decode(other_rollup, key), other_rollup.measures(slot),
+                    offset + other_rollup.first_seen[slot]
+                )
+            if other._spill is not None:
+                for partition in range(other._spill.partitions):
+                    for entry in other._spill.read(index, partition):
+                        self.add_group(dimensions, entry[0], _entry_measures(entry), offset + entry[1])
+        self.sequence = offset + other.sequence
+        self.encoded_records += other.encoded_records
+        for dimension, misses in other.encoder_misses.items():
+            self.encoder_misses[dimension] += misses
+        return self
@@ -0,0 +1,347 @@
+"""
+Approximate reports from a random sample of the logs.
+
+Only the sampled records are validated and aggregated. Counts, sums and
+costs are scaled back up by each record's inverse inclusion probability, and
+the summary, endpoint stats and cost analysis carry confidence intervals
+from the usual stratified-sampling variance estimators (with finite
+population correction; ratios such as averages and error rates are
+linearized).
+"""
+from __future__ import annotations
+import math
+import random
+import config
+import utils
+import main
+from aggregator import LogAggregator
+from rollups import StatusCodeHistogram
+from advanced_features.latency_histograms import LatencyHistogram
+from advanced_features.cost_estimation import _memory_cost
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+METHODS = ("uniform", "stratified")
+
+# Sections a sample cannot answer: they depend on every record or on exact ordering
+UNSUPPORTED_SECTIONS = frozenset({
+    "anomalies", "rate_limit_violations", "caching_opportunities", "unique_users", "cost_by_user", "sessions", "latency_moments", "bandwidth"
+})
+
+_OVERALL = object()
+
+# Per-domain sums kept by each stratum; x is the in-domain indicator, so x*x == x and e*e == e
+_X, _E, _T, _T2, _M, _M2, _C, _C2 = range(8)
+
+
+class _Stratum:
+
+    def __init__(self, population: int, starttime: Any, endtime: Any, sections: Sequence[str]):
+        self.population = population
+        self.processed = 0
+        self.state = LogAggregator(starttime, endtime, sections)
+        self.moments: Dict[Any, List[float]] = {}
+
+    @property
+    def weight(self) -> float:
+        return self.population / self.processed
+
+    def add(self, log: Any) -> None:
+        self.processed += 1
+        if not isinstance(log, dict) or not self.state.add(log):
+            return
+
+        response_time = log["response_time_ms"]
+        memory = _memory_cost(log["response_size_bytes"])
+        cost = (
+            config.COST_STRUCTURE["per_request"]
+            + response_time * config.COST_STRUCTURE["per_ms_execution"]
+            + memory
+        )
+        is_error = 1 if utils.is_error_status(log["status_code"]) else 0
+        for domain in (_OVERALL, log["endpoint"]):
+            sums = self.moments.get(domain)
+            if sums is None:
+                sums = self.moments[domain] = [0.0] * 8
+            sums[_X] += 1
+            sums[_E] += is_error
+            sums[_T] += response_time
+            sums[_T2] += response_time * response_time
+            sums[_M] += memory
+            sums[_M2] += memory * memory
+            sums[_C] += cost
+            sums[_C2] += cost * cost
+
+
+def _variance_term(stratum: _Stratum, total: float, total_sq: float) -> float:
+    # N^2 (1 - n/N) s^2 / n for one stratum's contribution to a scaled-up total
+    n, population = stratum.processed, stratum.population
+    if n < 2:
+        return 0.0
+    sample_variance = max(total_sq - total * total / n, 0.0) / (n - 1)
+    return population * population * (1 - n / population) * sample_variance / n
+
+
+def _estimate_total(strata: Sequence[_Stratum], domain: Any, index: int, square_index: int) -> Tuple[float, float]:
+    estimate = 0.0
+    variance = 0.0
+    for stratum in strata:
+        if not stratum.processed:
+            continue
+        sums = stratum.moments.get(domain)
+        total = sums[index] if sums else 0.0
+        total_sq = sums[square_index] if sums else 0.0
+        estimate += stratum.weight * total
+        variance += _variance_term(stratum, total, total_sq)
+    return estimate, variance
+
+
+def _estimate_ratio(strata: Sequence[_Stratum], domain: Any, index: int, square_index: int) -> Tuple[float, float]:
+    """Ratio of the domain total of a variable to the domain size, with its linearized variance."""
+    numerator, _ = _estimate_total(strata, domain, index, square_index)
+    denominator, _ = _estimate_total(strata, domain, _X, _X)
+    if not denominator:
+        return 0.0, 0.0
+    ratio = numerator / denominator
+
+    variance = 0.0
+    for stratum in strata:
+        sums = stratum.moments.get(domain)
+        if not stratum.processed or not sums:
+            continue
+        # Residuals d = y - R x; y is zero outside the domain, so y*x == y
+        residual = sums[index] - ratio * sums[_X]
+        residual_sq = sums[square_index] - 2 * ratio * sums[index] + ratio * ratio * sums[_X]
+        variance += _variance_term(stratum, residual, residual_sq)
+    return ratio, variance / (denominator * denominator)
+
+
+def _interval(estimate: float, variance: float, z: float, digits: int, scale: float = 1.0) -> List[float]:
+    half_width = z * math.sqrt(variance)
+    low = max((estimate - half_width) * scale, 0.0)
+    high = (estimate + half_width) * scale
+    if digits == 0:
+        return [int(math.floor(low)), int(math.ceil(high))]
+    return [round(low, digits), round(high, digits)]
+
+
+def _plan(
+    logs: List[Any],
+    method: str,
+    sample_rate: float,
+    min_per_stratum: int,
+    rng: random.Random
+) -> Tuple[Dict[Any, List[int]], List[Tuple[Any, int]]]:
+    """
+    Pick the records to sample and the order to process them in.
+
+    Within a stratum, records come in random order, so any prefix of the
+    processing order is itself a uniform sample of each stratum. The first
+    min_per_stratum picks of every stratum go first, so stopping early
+    never leaves a rare endpoint unsampled.
+    """
+    if method == "stratified":
+        strata: Dict[Any, List[int]] = {}
+        for i, log in enumerate(logs):
+            endpoint = log.get("endpoint") if isinstance(log, dict) else None
+            key = endpoint if isinstance(endpoint, str) else None
+            strata.setdefault(key, []).append(i)
+    else:
+        strata = {_OVERALL: range(len(logs))}
+
+    head = min_per_stratum if method == "stratified" else 0
+    keyed = []
+    for key, indexes in strata.items():
+        population = len(indexes)
+        size = min(population, max(math.ceil(sample_rate * population), head, 2))
+        for j, i in enumerate(rng.sample(indexes, size)):
+            if j < head:
+                order = (j + rng.random()) / head - 1
+            else:
+                order = (j + rng.random()) / size
+            keyed.append((order, key, i))
+    keyed.sort(key=lambda item: item[0])
+    return {key: len(indexes) for key, indexes in strata.items()}, [(key, i) for _, key, i in keyed]
+
+
+def _scaled_state(strata: Dict[Any, _Stratum], starttime: Any, endtime: Any, sections: Sequence[str]) -> LogAggregator:
+    state = LogAggregator(starttime, endtime, sections)
+    for stratum in strata.values():
+        if not stratum.processed:
+            continue
+        weight = stratum.weight
+        engine = stratum.state.rollups
+        for dimensions in engine.rollups:
+            for values, measures in engine.rows(dimensions):
+                scaled = dict(measures)
+                for count in ("request_count", "error_count", "get_count"):
+                    scaled[count] = round(measures[count] * weight)
+                for total in ("response_time_sum", "execution_cost", "memory_cost"):
+                    scaled[total] = measures[total] * weight
+                state.rollups.add_group(dimensions, values, scaled)
+        for endpoint, histogram in stratum.state.status_codes.items():
+            if endpoint not in state.status_codes:
+                state.status_codes[endpoint] = StatusCodeHistogram()
+            counts = state.status_codes[endpoint].counts
+            for slot, count in enumerate(histogram.counts):
+                if count:
+                    counts[slot] += round(count * weight)
+        if state.latency is not None:
+            for key, histogram in stratum.state.latency.cells.items():
+                if key not in state.latency.cells:
+                    state.latency.cells[key] = LatencyHistogram(*histogram.layout())
+                scaled = LatencyHistogram(*histogram.layout())
+                for slot, count in enumerate(histogram.counts):
+                    if count:
+                        scaled.counts[slot] = round(count * weight)
+                scaled.total = sum(scaled.counts)
+                scaled.min, scaled.max = histogram.min, histogram.max
+                state.latency.cells[key].merge(scaled)
+        for attribute, pick in (("start_time", min), ("end_time", max)):
+            value = getattr(stratum.state, attribute)
+            if value is not None:
+                current = getattr(state, attribute)
+                setattr(state, attribute, value if current is None else pick(current, value))
+    return state
+
+
+def _add_intervals(report: Dict[str, Any], strata: Sequence[_Stratum], z: float) -> None:
+    per_request = config.COST_STRUCTURE["per_request"]
+    per_ms = config.COST_STRUCTURE["per_ms_execution"]
+
+    if "summary" in report:
+        report["summary"]["confidence_intervals"] = {
+            "total_requests": _interval(*_estimate_total(strata, _OVERALL, _X, _X), z, 0),
+            "avg_response_time_ms": _interval(*_estimate_ratio(strata, _OVERALL, _T, _T2), z, 1),
+            "error_rate_percentage": _interval(*_estimate_ratio(strata, _OVERALL, _E, _E), z, 1, 100)
+        }
+
+    for stats in report.get("endpoint_stats", []):
+        endpoint = stats["endpoint"]
+        stats["confidence_intervals"] = {
+            "request_count": _interval(*_estimate_total(strata, endpoint, _X, _X), z, 0),
+            "avg_response_time_ms": _interval(*_estimate_ratio(strata, endpoint, _T, _T2), z, 1),
+            "error_count": _interval(*_estimate_total(strata, endpoint, _E, _E), z, 0)
+        }
+
+    if "cost_analysis" in report:
+        costs = report["cost_analysis"]
+        costs["confidence_intervals"] = {
+            "total_cost_usd": _interval(*_estimate_total(strata, _OVERALL, _C, _C2), z, 4),
+            "request_costs": _interval(*_estimate_total(strata, _OVERALL, _X, _X), z, 4, per_request),
+            "execution_costs": _interval(*_estimate_total(strata, _OVERALL, _T, _T2), z, 4, per_ms),
+            "memory_costs": _interval(*_estimate_total(strata, _OVERALL, _M, _M2), z, 4)
+        }
+        for entry in costs["cost_by_endpoint"]:
+            entry["confidence_intervals"] = {
+                "total_cost": _interval(*_estimate_total(strata, entry["endpoint"], _C, _C2), z, 4)
+            }
+
+
+def _precise_enough(strata: Sequence[_Stratum], z: float, target: float) -> bool:
+    # Stop when the mean latency and the total cost are both known to within target (relative half-width)
+    for estimate, variance in (
+        _estimate_ratio(strata, _OVERALL, _T, _T2),
+        _estimate_total(strata, _OVERALL, _C, _C2)
+    ):
+        if not estimate or z * math.sqrt(variance) > target * estimate:
+            return False
+    return True
+
+
+def analyze_sampled(
+    logs: List[Dict[str, Any]],
+    sample_rate: Optional[float] = None,
+    method: Optional[str] = None,
+    starttime: Any = None,
+    endtime: Any = None,
+    sections: Optional[Sequence[str]] = None,
+    confidence: Optional[float] = None,
+    target_relative_error: Optional[float] = None,
+    seed: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Approximate analyze_api_logs report computed from a random sample.
+
+    Args:
+        logs: List of API log entries
+        sample_rate: Fraction of records to sample (config.SAMPLING default)
+        method: "uniform" (simple random sample) or "stratified" (per endpoint,
+            with at least min_per_stratum records from each endpoint)
+        starttime, endtime: Optional time window, as in analyze_api_logs
+        sections: Report sections; anomalies, rate limits, caching and unique
+            users need every record and are not available
+        confidence: Confidence level of the intervals, e.g. 0.95
+        target_relative_error: Stop sampling once the average response time
+            and the total cost are known to within this fraction
+        seed: Random seed for a reproducible sample
+
+    Returns:
+        The report with scaled-up counts and costs, "confidence_intervals" in
+        the summary, each endpoint_stats entry and the cost analysis, and a
+        "sampling" section describing the sample
+
+    Raises:
+        ValueError: For invalid arguments or unsupported sections
+    """
+    settings = config.SAMPLING
+    sample_rate = settings["sample_rate"] if sample_rate is None else sample_rate
+    method = settings["method"] if method is None else method
+    confidence = settings["confidence"] if confidence is None else confidence
+
+    if not isinstance(logs, list):
+        raise ValueError("logs must be a list")
+    if not 0 < sample_rate <= 1:
+        raise ValueError("sample_rate must be in (0, 1]")
+    if method not in METHODS:
+        raise ValueError(f"Unknown sampling method {method!r}; choose from {METHODS}")
+    if not 0 < confidence < 1:
+        raise ValueError("confidence must be in (0, 1)")
+    if sections is None:
+        sections = [s for s in main.DEFAULT_SECTIONS if s not in UNSUPPORTED_SECTIONS]
+    unsupported = UNSUPPORTED_SECTIONS.intersection(sections)
+    if unsupported:
+        raise ValueError(f"Sections not available from a sample: {sorted(unsupported)}")
+
+    if len(logs) == 0:
+        return utils._create_empty_report()
+
+    from statistics import NormalDist
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    rng = random.Random(seed)
+
+    populations, order = _plan(logs, method, sample_rate, settings["min_per_stratum"], rng)
+    strata = {key: _Stratum(population, starttime, endtime, sections) for key, population in populations.items()}
+    stratum_list = list(strata.values())
+    head = sum(min(population, settings["min_per_stratum"]) for population in populations.values())
+
+    stopped_early = False
+    check_every = settings["check_every"]
+    for processed, (key, i) in enumerate(order, 1):
+        strata[key].add(logs[i])
+        if (
+            target_relative_error is not None
+            and processed >= head
+            and processed % check_every == 0
+            and processed < len(order)
+            and _precise_enough(stratum_list, z, target_relative_error)
+        ):
+            stopped_early = True
+            break
+
+    state = _scaled_state(strata, starttime, endtime, sections)
+    report = main._build_report(state, sections)
+    if state.total_requests:
+        _add_intervals(report, stratum_list, z)
+    report["sampling"] = {
+        "method": method,
+        "sample_rate": sample_rate,
+        "confidence": confidence,
+        "population_records": len(logs),
+        "planned_records": len(order),
+        "sampled_records": sum(stratum.processed for stratum in stratum_list),
+        "strata": len(strata),
+        "stopped_early": stopped_early
+    }
+    return report
@@ -0,0 +1,359 @@
+"""
+Optional local SQLite store for API logs.
+
+Logs are ingested once, then any number of reports can be computed with the
+heavy lifting pushed down into SQL aggregates. Everything stays in a local
+file (or in memory); no server is involved.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import sqlite3
+import config
+import utils
+import main
+from aggregator import LogAggregator
+from rollups import StatusCodeHistogram
+from advanced_features.caching import InterArrivalHistogram
+from advanced_features.unique_users import HyperLogLog
+
+INGEST_BATCH_SIZE = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    ts REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    hour TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    method TEXT NOT NULL,
+    response_time_ms NUMERIC NOT NULL,
+    status_code NUMERIC NOT NULL,
+    user_id TEXT NOT NULL,
+    request_size_bytes NUMERIC NOT NULL,
+    response_size_bytes NUMERIC NOT NULL,
+    is_error INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_logs_ts ON logs (ts);
+CREATE INDEX IF NOT EXISTS idx_logs_endpoint_ts ON logs (endpoint, ts);
+"""
+
+_INSERT = "INSERT INTO logs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+class SQLiteLogStore:
+    """
+    SQLite-backed log store with indexed ingest and SQL pushdown analytics.
+
+    report() produces the same report as analyze_api_logs over the same
+    records: counts, sums, min/max, status histograms and memory-cost tiers
+    are computed by GROUP BY queries and loaded into the rollups the report
+    sections are projected from. Anomaly and rate-limit detection still need
+    a scan; it replays the selected rows in ingest order, the order
+    analyze_api_logs would have seen them.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "SQLiteLogStore":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def ingest(self, logs: Iterable[Dict[str, Any]], batch_size: int = INGEST_BATCH_SIZE) -> Dict[str, int]:
+        """
+        Validate and bulk-insert log entries, one transaction per batch.
+
+        Returns:
+            Dictionary with inserted and rejected counts
+        """
+        inserted = 0
+        rejected = 0
+        batch: List[Tuple[Any, ...]] = []
+        for log in logs:
+            if not utils.validate_log_entry(log):
+                rejected += 1
+                continue
+            log_time = utils.parse_timestamp(log["timestamp"])
+            batch.append((
+                # Naive timestamps are UTC, as in the window bounds
+                utils.as_utc(log_time).timestamp(),
+                log["timestamp"],
+                log_time.strftime("%H:00"),
+                log["endpoint"],
+                log["method"],
+                log["response_time_ms"],
+                log["status_code"],
+                log["user_id"],
+                log["request_size_bytes"],
+                log["response_size_bytes"],
+                1 if utils.is_error_status(log["status_code"]) else 0
+            ))
+            if len(batch) >= batch_size:
+                inserted += self._flush(batch)
+                batch = []
+        if batch:
+            inserted += self._flush(batch)
+        return {"inserted": inserted, "rejected": rejected}
+
+    def _flush(self, batch: List[Tuple[Any, ...]]) -> int:
+        with self.conn:
+            self.conn.executemany(_INSERT, batch)
+        return len(batch)
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+    def _window(self, starttime: Any, endtime: Any, record_filter: Any = None) -> Tuple[str, List[Any]]:
+        # Same rule as analyze_api_logs: either end may be omitted, naive times are UTC
+        clauses = []
+        params: List[Any] = []
+        for bound, op in ((starttime, ">="), (endtime, "<=")):
+            if bound is not None:
+                clauses.append(f"ts {op} ?")
+                params.append(utils.as_utc(bound).timestamp())
+        if record_filter is not None:
+            filter_clauses, filter_params = self._filter_sql(record_filter)
+            clauses += filter_clauses
+            params += filter_params
+        return " AND ".join(clauses) or "1 = 1", params
+
+    def _filter_sql(self, record_filter: Any) -> Tuple[List[str], List[Any]]:
+        """A filters.RecordFilter as WHERE clauses, so SQLite can use the ts and endpoint indexes."""
+        clauses = []
+        params: List[Any] = []
+        if record_filter.starttime is not None:
+            clauses.append("ts >= ?")
+            params.append(record_filter.starttime.timestamp())
+        if record_filter.endtime is not None:
+            clauses.append("ts <= ?")
+            params.append(record_filter.endtime.timestamp())
+        for column, values in (("method", record_filter.methods), ("user_id", record_filter.users)):
+            if values is not None:
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params += sorted(values)
+        if record_filter.status_classes is not None:
+            classes = sorted(int(c[0]) for c in record_filter.status_classes)
+            clauses.append(f"CAST(status_code / 100 AS INTEGER) IN ({', '.join('?' * len(classes))})")
+            params += classes
+        if record_filter.endpoints is not None or record_filter.endpoint_prefixes is not None:
+            alternatives = []
+            if record_filter.endpoints:
+                alternatives.append(f"endpoint IN ({', '.join('?' * len(record_filter.endpoints))})")
+                params += sorted(record_filter.endpoints)
+            for prefix in record_filter.endpoint_prefixes or ():
+                # substr() rather than LIKE: no wildcard escaping, and case-sensitive like startswith()
+                alternatives.append("substr(endpoint, 1, ?) = ?")
+                params += [len(prefix), prefix]
+            clauses.append(f"({' OR '.join(alternatives) or '0 = 1'})")
+        return clauses, params
+
+    def _dimension_sql(self, dimension: str, bucket_seconds: int) -> str:
+        if dimension == "status_class":
+            return "CAST(status_code / 100 AS INTEGER) || 'xx'"
+        if dimension == "time_bucket":
+            return f"CAST(ts / {int(bucket_seconds)} AS INTEGER) * {int(bucket_seconds)}"
+        return dimension
+
+    def _load_rollups(self, state: LogAggregator, where: str, params: List[Any]) -> None:
+        memory = config.COST_STRUCTURE["memory_costs"]
+        measures_sql = (
+            "COUNT(*), SUM(is_error), SUM(method = 'GET'), SUM(response_time_ms), "
+            "SUM(response_time_ms * ?), "
+            "SUM(CASE WHEN response_size_bytes <= 1024 THEN ? "
+            "WHEN response_size_bytes <= 10240 THEN ? ELSE ? END), "
+            "MIN(response_time_ms), MAX(response_time_ms)"
+        )
+        bytes_sql = (
+            ", SUM(request_size_bytes), SUM(response_size_bytes), "
+            "TOTAL(CASE WHEN method = 'GET' AND NOT is_error THEN response_size_bytes END), "
+            "MAX(response_size_bytes)"
+        )
+        measure_params = [
+            config.COST_STRUCTURE["per_ms_execution"], memory["small"], memory["medium"], memory["large"]
+        ]
+        engine = state.rollups
+
+        for dimensions, rollup in engine.rollups.items():
+            columns = [self._dimension_sql(d, engine.time_bucket_seconds) for d in dimensions]
+            # Payload bytes only for the rollups that keep them
+            select = ", ".join(columns + [measures_sql + bytes_sql if rollup.payload_bytes else measures_sql])
+            sql = f"SELECT {select} FROM logs WHERE {where}"
+            if columns:
+                # First-seen group order keeps tie-breaking identical to the in-memory path
+                sql += f" GROUP BY {', '.join(columns)} ORDER BY MIN(rowid)"
+            for row in self.conn.execute(sql, measure_params + params):
+                values, measures = row[:len(columns)], row[len(columns):]
+                if measures[0] == 0:
+                    continue
+                engine.add_group(dimensions, values, dict(zip(rollup.measure_names, measures)))
+
+    def _load_status_codes(self, state: LogAggregator, where: str, params: List[Any]) -> None:
+        rows = self.conn.execute(
+            f"SELECT endpoint, status_code, COUNT(*) FROM logs WHERE {where} "
+            "GROUP BY endpoint, status_code ORDER BY MIN(rowid)",
+            params
+        )
+        for endpoint, status_code, count in rows:
+            histogram = state.status_codes.get(endpoint)
+            if histogram is None:
+                histogram = state.status_codes[endpoint] = StatusCodeHistogram()
+            histogram.add(status_code, count)
+
+    def _load_time_range(self, state: LogAggregator, where: str, params: List[Any]) -> None:
+        for attribute, order in (("start_time", "ASC"), ("end_time", "DESC")):
+            row = self.conn.execute(
+                f"SELECT timestamp FROM logs WHERE {where} ORDER BY ts {order} LIMIT 1", params
+            ).fetchone()
+            if row is not None:
+                setattr(state, attribute, utils.parse_timestamp(row[0]))
+
+    def _load_inter_arrival(self, state: LogAggregator, where: str, params: List[Any]) -> None:
+        edges = InterArrivalHistogram().edges_seconds
+        bins = " ".join(f"WHEN gap <= {edge!r} THEN {i}" for i, edge in enumerate(edges))
+        gets = (
+            "WITH gets AS ("
+            "SELECT endpoint, ts, MAX(ts - LAG(ts) OVER (PARTITION BY endpoint ORDER BY ts, rowid), 0) AS gap "
+            f"FROM logs WHERE method = 'GET' AND {where})"
+        )
+        for endpoint, count, first_ts, last_ts in self.conn.execute(
+            f"{gets} SELECT endpoint, COUNT(*), MIN(ts), MAX(ts) FROM gets GROUP BY endpoint", params
+        ):
+            hist = state.inter_arrival[endpoint] = InterArrivalHistogram()
+            hist.request_count = count
+            hist.first_ts = first_ts
+            hist.last_ts = last_ts
+        for endpoint, bin_index, count in self.conn.execute(
+            f"{gets} SELECT endpoint, CASE {bins} ELSE {len(edges)} END AS bin, COUNT(*) "
+            "FROM gets WHERE gap IS NOT NULL GROUP BY endpoint, bin",
+            params
+        ):
+            state.inter_arrival[endpoint].counts[bin_index] = count
+
+    def _load_unique_users(self, state: LogAggregator, where: str, params: List[Any]) -> None:
+        # Sketches ignore repeats, so one add per distinct pair gives the same registers as a full scan
+        counter = state.unique_users
+        bucket = int(counter.bucket_seconds)
+        for sketches, key_sql in ((counter.by_endpoint, "endpoint"), (counter.by_bucket, f"CAST(ts / {bucket} AS INTEGER) * {bucket}")):
+            for key, user_id in self.conn.execute(f"SELECT DISTINCT {key_sql}, user_id FROM logs WHERE {where}", params):
+                sketch = sketches.get(key)
+                if sketch is None:
+                    sketch = sketches[key] = HyperLogLog(counter.precision)
+                sketch.add(user_id)
+        for sketch in counter.by_endpoint.values():
+            counter.overall.merge(sketch)
+
+    def _load_latency(self, state: LogAggregator, where: str, params: List[Any]) -> None:
+        # One add per distinct response time in a cell, weighted by how often it occurs
+        recorder = state.latency
+        bucket = int(recorder.bucket_seconds)
+        rows = self.conn.execute(
+            f"SELECT endpoint, CAST(ts / {bucket} AS INTEGER) * {bucket} AS cell, response_time_ms, COUNT(*) "
+            f"FROM logs WHERE {where} GROUP BY endpoint, cell, response_time_ms ORDER BY MIN(rowid)",
+            params
+        )
+        for endpoint, cell, response_time, count in rows:
+            recorder.add(endpoint, cell, response_time, count)
+
+    def _load_user_costs(self, state: LogAggregator, where: str, params: List[Any]) -> None:
+        memory = config.COST_STRUCTURE["memory_costs"]
+        rows = self.conn.execute(
+            "SELECT user_id, endpoint, COUNT(*), SUM(response_time_ms * ?), "
+            "SUM(CASE WHEN response_size_bytes <= 1024 THEN ? WHEN response_size_bytes <= 10240 THEN ? ELSE ? END) "
+            f"FROM logs WHERE {where} GROUP BY user_id, endpoint ORDER BY MIN(rowid)",
+            [config.COST_STRUCTURE["per_ms_execution"], memory["small"], memory["medium"], memory["large"]] + params
+        )
+        for user_id, endpoint, count, execution_cost, memory_cost in rows:
+            state.user_costs.add(user_id, endpoint, execution_cost, memory_cost, count)
+
+    def _load_sessions(self, state: LogAggregator, where: str, params: List[Any]) -> None:
+        # Sessions depend on arrival order, so they are replayed like the detectors
+        sessions = state.sessions
+        for user_id, endpoint, ts in self.conn.execute(
+            f"SELECT user_id, endpoint, ts FROM logs WHERE {where} ORDER BY rowid", params
+        ):
+            sessions.add(user_id, endpoint, ts)
+
+    def _load_moments(self, state: LogAggregator, where: str, params: List[Any]) -> None:
+        # Replayed in arrival order so the floating-point results match an in-memory pass
+        moments = state.moments
+        for endpoint, response_time, request_size, response_size in self.conn.execute(
+            "SELECT endpoint, response_time_ms, request_size_bytes, response_size_bytes "
+            f"FROM logs WHERE {where} ORDER BY rowid", params
+        ):
+            moments.add(endpoint, response_time, request_size, response_size)
+
+    def _load_throughput(self, state: LogAggregator, where: str, params: List[Any]) -> None:
+        # Per-second totals in time order are all the sliding windows see
+        throughput = state.throughput
+        for second, ingress, egress in self.conn.execute(
+            "SELECT CAST(ts AS INTEGER) AS second, SUM(request_size_bytes), SUM(response_size_bytes) "
+            f"FROM logs WHERE {where} GROUP BY second ORDER BY second", params
+        ):
+            throughput.add(second, ingress, egress)
+
+    def _load_anomalies(self, state: LogAggregator, where: str, params: List[Any]) -> None:
+        # The anomaly detector only needs per-bucket sums, in time order
+        detector = state.anomaly_detector
+        for row in self.conn.execute(
+            "SELECT endpoint, CAST(ts / ? AS INTEGER) AS bucket, COUNT(*), SUM(is_error), TOTAL(response_time_ms) "
+            f"FROM logs WHERE {where} GROUP BY endpoint, bucket ORDER BY bucket", [detector.bucket_seconds] + params
+        ):
+            detector.add_bucket(*row)
+
+    def _load_rate_limits(self, state: LogAggregator, where: str, params: List[Any]) -> None:
+        detector = state.rate_limit_detector
+        for user_id, ts in self.conn.execute(f"SELECT user_id, ts FROM logs WHERE {where} ORDER BY rowid", params):
+            detector.add(user_id, ts)
+
+    def aggregate(
+        self,
+        starttime: Any = None,
+        endtime: Any = None,
+        sections: Optional[Sequence[str]] = None,
+        record_filter: Any = None
+    ) -> LogAggregator:
+        """Build aggregation state for a time window, and optionally a filters.RecordFilter, from SQL aggregates."""
+        where, params = self._window(starttime, endtime, record_filter)
+        wanted = set(sections or main.DEFAULT_SECTIONS)
+
+        state = LogAggregator(sections=wanted)
+        self._load_rollups(state, where, params)
+        self._load_status_codes(state, where, params)
+        self._load_time_range(state, where, params)
+        if state.unique_users is not None:
+            self._load_unique_users(state, where, params)
+        if state.latency is not None:
+            self._load_latency(state, where, params)
+        if state.user_costs is not None:
+            self._load_user_costs(state, where, params)
+        if state.sessions is not None:
+            self._load_sessions(state, where, params)
+        if state.moments is not None:
+            self._load_moments(state, where, params)
+        if state.throughput is not None:
+            self._load_throughput(state, where, params)
+        if wanted & {"caching_opportunities", "bandwidth"}:
+            self._load_inter_arrival(state, where, params)
+        if state.anomaly_detector is not None:
+            self._load_anomalies(state, where, params)
+        if state.rate_limit_detector is not None:
+            self._load_rate_limits(state, where, params)
+        return state
+
+    def report(
+        self,
+        starttime: Any = None,
+        endtime: Any = None,
+        sections: Optional[Sequence[str]] = None,
+        record_filter: Any = None
+    ) -> Dict[str, Any]:
+        """Same report as analyze_api_logs over the stored records."""
+        return main._build_report(self.aggregate(starttime, endtime, sections, record_filter), sections)
@@ -0,0 +1,139 @@
+"""
+Tests for streaming anomaly detection
+Run: pytest test_anomaly_detection.py -v
+"""
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import analyze_api_logs
+from advanced_features.anomaly_detection import AnomalyDetector, _detect_anomalies
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data")
+
+
+def _steady_logs(minutes, per_minute=4, endpoint="/api/steady"):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    logs = []
+    for minute in range(minutes):
+        for i in range(per_minute):
+            logs.append({
+                "timestamp": (base + timedelta(minutes=minute, seconds=i * 10)).isoformat() + "Z",
+                "endpoint": endpoint,
+                "method": "GET",
+                "response_time_ms": 100,
+                "status_code": 200,
+                "user_id": "user_001",
+                "request_size_bytes": 256,
+                "response_size_bytes": 1024
+            })
+    return logs
+
+
+def test_steady_traffic_has_no_anomalies():
+    assert _detect_anomalies(_steady_logs(60)) == []
+
+
+def test_latency_spike_detected():
+    logs = _steady_logs(60)
+    # 10:40-10:45 bucket gets slow
+    for log in logs[160:180]:
+        log["response_time_ms"] = 900
+
+    anomalies = _detect_anomalies(logs)
+
+    assert len(anomalies) == 1
+    anomaly = anomalies[0]
+    assert anomaly["metric"] == "avg_response_time_ms"
+    assert anomaly["start"] == "2025-01-15T10:40:00Z"
+    assert anomaly["end"] == "2025-01-15T10:45:00Z"
+    assert anomaly["peak_value"] == 900
+    assert anomaly["severity"] == "critical"
+
+
+def test_error_surge_spanning_buckets_is_one_record():
+    logs = _steady_logs(60)
+    for log in logs[120:160]:
+        log["status_code"] = 500
+
+    anomalies = [a for a in _detect_anomalies(logs) if a["metric"] == "error_count"]
+
+    assert len(anomalies) == 1
+    assert anomalies[0]["start"] == "2025-01-15T10:30:00Z"
+    assert anomalies[0]["end"] == "2025-01-15T10:40:00Z"
+
+
+def test_state_is_constant_per_endpoint():
+    detector = AnomalyDetector()
+    for log in _steady_logs(600):
+        detector.add(log["endpoint"], datetime.fromisoformat(log["timestamp"][:-1]).timestamp(), 100, False)
+
+    state = detector._endpoints["/api/steady"]
+    assert len(detector._endpoints) == 1
+    assert len(state.head) == detector.replay_buckets
+    assert state.anomalies == [] and state.open == {}
+
+
+def test_merged_shards_match_single_pass():
+    logs = _steady_logs(60) + _steady_logs(60, endpoint="/api/other")
+    for log in logs[120:160]:
+        log["status_code"] = 500
+    logs.sort(key=lambda log: log["timestamp"])
+
+    def _detector(part):
+        detector = AnomalyDetector()
+        for log in part:
+            detector.add(log["endpoint"], datetime.fromisoformat(log["timestamp"][:-1]).timestamp(),
+                         log["response_time_ms"], log["status_code"] >= 400)
+        return detector
+
+    expected = _detect_anomalies(logs)
+    # The surge straddles the cut, and the second shard is merged first
+    merged = _detector(logs[250:]).merge(_detector(logs[:250]))
+
+    assert expected
+    assert merged.finalize() == expected
+
+
+def test_merge_past_the_replayed_head():
+    # Four hours a side of the cut, with spikes on both sides and one across it
+    logs = _steady_logs(480)
+    for start, stop in ((400, 440), (1020, 1120), (1560, 1700)):
+        for log in logs[start:stop]:
+            log["status_code"] = 500
+            log["response_time_ms"] = 700
+
+    def _detector(part):
+        detector = AnomalyDetector()
+        for log in part:
+            detector.add(log["endpoint"], datetime.fromisoformat(log["timestamp"][:-1]).timestamp(),
+                         log["response_time_ms"], log["status_code"] >= 400)
+        return detector
+
+    expected = _detect_anomalies(logs)
+    assert len(expected) >= 6
+    for cut in (100, 420, 1060, 1600, 1900):
+        first, second = _detector(logs[:cut]), _detector(logs[cut:])
+        assert _detector(logs[:cut]).merge(second).finalize() == expected
+        assert second.merge(first).finalize() == expected
+        # finalize() does not close anything for good
+        assert second.finalize() == expected
+
+
+def test_injected_dataset_anomalies_detected():
+    file_path = os.path.join(DATA_DIR, "sample_medium.json")
+    if not os.path.exists(file_path):
+        pytest.skip(f"Sample dataset not found: {file_path}")
+
+    with open(file_path, "r") as f:
+        logs = json.load(f)
+
+    anomalies = analyze_api_logs(logs)["anomalies"]
+    found = {(a["endpoint"], a["metric"], a["start"]) for a in anomalies}
+
+    assert ("/api/search", "request_count", "2025-01-15T10:20:00Z") in found
+    assert ("/api/payments", "error_count", "2025-01-15T10:35:00Z") in found
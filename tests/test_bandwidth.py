@@ -0,0 +1,128 @@
+"""
+Tests for bandwidth and throughput analysis
+Run: pytest test_bandwidth.py -v
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from advanced_features.bandwidth import ThroughputTracker
+from aggregator import LogAggregator
+from main import analyze_api_logs, _build_report
+from storage import SQLiteLogStore
+
+BASE = datetime(2025, 1, 15, 10, 0, 0)
+
+
+def _logs(count, seed=0):
+    rng = random.Random(seed)
+    logs = []
+    t = 0.0
+    for _ in range(count):
+        t += rng.expovariate(2.0)
+        logs.append({
+            "timestamp": (BASE + timedelta(seconds=t)).isoformat() + "Z",
+            "endpoint": rng.choice(["/api/users", "/api/reports", "/api/orders"]),
+            "method": rng.choice(["GET", "GET", "GET", "POST"]),
+            "response_time_ms": rng.randint(20, 400),
+            "status_code": rng.choice([200, 200, 200, 404, 500]),
+            "user_id": f"user_{rng.randrange(30):02d}",
+            "request_size_bytes": rng.randint(100, 2000),
+            "response_size_bytes": rng.randint(200, 50000)
+        })
+    return logs
+
+
+def _brute_peak(points, window):
+    """Largest byte total over any window of whole seconds, divided by its length."""
+    by_second = {}
+    for t, size in points:
+        by_second[int(t)] = by_second.get(int(t), 0) + size
+    best = 0
+    for end in by_second:
+        best = max(best, sum(by_second.get(s, 0) for s in range(end - window + 1, end + 1)))
+    return best / window
+
+
+def test_throughput_peaks_match_brute_force():
+    rng = random.Random(1)
+    points = []
+    t = 0.0
+    for _ in range(4000):
+        t += rng.expovariate(5.0) if rng.random() < 0.99 else 30
+        points.append((t, rng.randint(100, 10000)))
+    tracker = ThroughputTracker((1, 10, 60))
+    for t, size in points:
+        tracker.add(t, 0, size)
+        assert all(len(w.recent) <= w.seconds for w in tracker.windows)
+    for window in tracker.peaks():
+        assert window.peak_egress / window.seconds == pytest.approx(_brute_peak(points, window.seconds))
+
+    with pytest.raises(ValueError):
+        ThroughputTracker((0.5,))
+    with pytest.raises(ValueError):
+        tracker.merge(ThroughputTracker((1,)))
+
+
+def test_section_totals():
+    logs = _logs(3000)
+    report = analyze_api_logs(logs, sections=["bandwidth"])["bandwidth"]
+    assert report["ingress_bytes"] == sum(log["request_size_bytes"] for log in logs)
+    assert report["egress_bytes"] == sum(log["response_size_bytes"] for log in logs)
+    cacheable = sum(log["response_size_bytes"] for log in logs if log["method"] == "GET" and log["status_code"] < 400)
+    assert report["cacheable_egress_bytes"] == cacheable
+    assert 0 < report["cache_servable_egress_bytes"] <= cacheable
+
+    reports = next(e for e in report["by_endpoint"] if e["endpoint"] == "/api/reports")
+    sizes = [log["response_size_bytes"] for log in logs if log["endpoint"] == "/api/reports"]
+    assert reports["egress_bytes"] == sum(sizes) and reports["max_response_bytes"] == max(sizes)
+    assert sum(b["egress_bytes"] for b in report["by_time_bucket"]) == report["egress_bytes"]
+    assert max(b["egress_bytes"] for b in report["by_time_bucket"]) >= reports["peak_bucket_egress_bytes"]
+
+    by_user = {}
+    for log in logs:
+        by_user[log["user_id"]] = by_user.get(log["user_id"], 0) + log["response_size_bytes"]
+    top = max(by_user, key=by_user.get)
+    assert report["top_users_by_egress"][0] == {
+        "user_id": top,
+        "request_count": sum(1 for log in logs if log["user_id"] == top),
+        "ingress_bytes": sum(log["request_size_bytes"] for log in logs if log["user_id"] == top),
+        "egress_bytes": by_user[top],
+        "max_response_bytes": max(log["response_size_bytes"] for log in logs if log["user_id"] == top)
+    }
+    one_second = report["throughput_peaks"][0]
+    assert one_second["window_seconds"] == 1
+    assert one_second["peak_egress"]["bytes_per_second"] >= max(log["response_size_bytes"] for log in logs)
+
+
+def test_merge_and_storage_agree():
+    logs = _logs(2000, seed=2)
+    single = analyze_api_logs(logs, sections=["bandwidth"])
+
+    merged = LogAggregator(sections=["bandwidth"]).add_many(logs[:1000])
+    merged.merge(LogAggregator(sections=["bandwidth"]).add_many(logs[1000:]))
+    report = _build_report(merged, ["bandwidth"])
+    for key in ("ingress_bytes", "egress_bytes", "cacheable_egress_bytes", "by_time_bucket", "top_users_by_egress"):
+        assert report["bandwidth"][key] == single["bandwidth"][key]
+    # A peak can only be missed at the shard boundary, never inflated
+    for mine, whole in zip(report["bandwidth"]["throughput_peaks"], single["bandwidth"]["throughput_peaks"]):
+        assert mine["peak_egress"]["bytes_per_second"] <= whole["peak_egress"]["bytes_per_second"]
+
+    with SQLiteLogStore() as store:
+        store.ingest(logs)
+        assert store.report(sections=["bandwidth"]) == single
+
+
+def test_needs_an_aggregator_built_for_the_section():
+    logs = _logs(200)
+    plain = LogAggregator().add_many(logs)
+    assert "bandwidth" not in _build_report(plain, ["bandwidth", "summary"])
+
+    with_bytes = LogAggregator(sections=["bandwidth"]).add_many(logs)
+    for mine, theirs in ((plain, with_bytes), (with_bytes, plain)):
+        with pytest.raises(ValueError, match="bandwidth"):
+            mine.merge(theirs)
@@ -0,0 +1,77 @@
+"""
+Tests for data-driven TTL recommendation in caching analysis
+Run: pytest test_caching_ttl.py -v
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aggregator import LogAggregator
+from main import analyze_api_logs
+from advanced_features.caching import InterArrivalHistogram
+
+
+def _make_logs(endpoint, count, gap_seconds, method="GET"):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * gap_seconds)).isoformat() + "Z",
+            "endpoint": endpoint,
+            "method": method,
+            "response_time_ms": 100,
+            "status_code": 200,
+            "user_id": "user_001",
+            "request_size_bytes": 256,
+            "response_size_bytes": 1024
+        }
+        for i in range(count)
+    ]
+
+
+def _histograms(logs):
+    return LogAggregator().add_many(logs).inter_arrival
+
+
+def test_dense_traffic_gets_short_ttl():
+    hist = _histograms(_make_logs("/api/hot", 200, 30))["/api/hot"]
+    ttl = hist.recommend_ttl()
+
+    assert ttl["recommended_ttl_minutes"] == 1
+    assert ttl["expected_hit_rate_at_ttl"] == 99.5
+
+
+def test_sparse_traffic_gets_longer_ttl():
+    hist = _histograms(_make_logs("/api/cold", 200, 240))["/api/cold"]
+    ttl = hist.recommend_ttl()
+
+    assert ttl["recommended_ttl_minutes"] == 5
+    assert ttl["expected_hit_rate_at_ttl"] == 99.5
+
+
+def test_merge_matches_single_pass():
+    logs = _make_logs("/api/hot", 150, 45)
+    full = _histograms(logs)["/api/hot"]
+
+    left = _histograms(logs[:70])["/api/hot"]
+    right = _histograms(logs[70:])["/api/hot"]
+    # Merge order must not matter
+    merged = InterArrivalHistogram.from_dict(right.to_dict()).merge(left)
+
+    assert merged.to_dict() == full.to_dict()
+    assert merged.recommend_ttl() == full.recommend_ttl()
+
+
+def test_single_request_falls_back_to_default_ttl():
+    hist = InterArrivalHistogram()
+    hist.add(0.0)
+
+    assert hist.recommend_ttl()["recommended_ttl_minutes"] == 15
+
+
+def test_caching_opportunity_includes_ttl_fields():
+    result = analyze_api_logs(_make_logs("/api/hot", 200, 30))
+    opportunity = result["caching_opportunities"]["caching_opportunities"][0]
+
+    assert opportunity["recommended_ttl_minutes"] == 1
+    assert opportunity["expected_hit_rate_at_ttl"] == 99.5
@@ -0,0 +1,166 @@
+"""
+Tests for the batch CLI and streaming file ingestion
+Run: pytest test_cli.py -v
+"""
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import analyze_api_logs
+import cli
+import ingestion
+
+
+def _make_logs(count):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    endpoints = ["/api/users", "/api/products", "/api/payments"]
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * 7)).isoformat() + "Z",
+            "endpoint": endpoints[i % 3],
+            "method": "GET" if i % 4 else "POST",
+            "response_time_ms": 50 + (i * 37) % 900,
+            "status_code": 500 if i % 29 == 0 else 200,
+            "user_id": f"user_{i % 11:03d}",
+            "request_size_bytes": 256,
+            "response_size_bytes": (i * 131) % 16000
+        }
+        for i in range(count)
+    ]
+
+
+def test_json_array_streamed_in_small_chunks(tmp_path, monkeypatch):
+    logs = _make_logs(50)
+    path = tmp_path / "logs.json"
+    path.write_text(json.dumps(logs, indent=2))
+    # Force many buffer refills mid-object
+    monkeypatch.setattr(ingestion, "CHUNK_SIZE", 64)
+
+    assert list(ingestion.iter_records(str(path))) == logs
+
+
+def test_compressed_jsonl_with_bad_line(tmp_path):
+    logs = _make_logs(20)
+    path = tmp_path / "logs.jsonl.gz"
+    with gzip.open(path, "wt") as f:
+        for log in logs[:10]:
+            f.write(json.dumps(log) + "\n")
+        f.write("{not json\n\n")
+        for log in logs[10:]:
+            f.write(json.dumps(log) + "\n")
+
+    stats = {}
+    assert list(ingestion.iter_records(str(path), stats)) == logs
+    assert stats["records"] == 20
+    assert stats["decode_errors"] == 1
+
+
+def test_compression_detected_from_magic_bytes(tmp_path):
+    logs = _make_logs(30)
+    payload = json.dumps(logs).encode()
+    plain = tmp_path / "archive.log"
+    plain.write_bytes(payload)
+    for name, opener in (("archive-gz", gzip.open), ("archive-bz", bz2.open), ("archive.gz.bak", lzma.open)):
+        with opener(tmp_path / name, "wb") as f:
+            f.write(payload)
+
+    assert ingestion.detect_compression(str(plain)) is None
+    assert ingestion.detect_compression(str(tmp_path / "archive-gz")) == "gzip"
+    assert ingestion.detect_compression(str(tmp_path / "archive-bz")) == "bz2"
+    assert ingestion.detect_compression(str(tmp_path / "archive.gz.bak")) == "xz"
+    for name in ("archive-gz", "archive-bz", "archive.gz.bak"):
+        assert list(ingestion.iter_records(str(tmp_path / name))) == logs
+
+
+def test_read_ahead_propagates_errors_and_stops_on_close():
+    class Failing(io.BytesIO):
+        def read(self, size=-1):
+            if self.tell() >= 10:
+                raise OSError("corrupt stream")
+            return super().read(4)
+
+    reader = ingestion._ReadAheadReader(Failing(b"x" * 100), chunk_size=4, depth=1)
+    with pytest.raises(OSError, match="corrupt stream"):
+        reader.readall()
+
+    endless = ingestion._ReadAheadReader(io.BytesIO(b"y" * 100000), chunk_size=16, depth=2)
+    assert endless.read(4) == b"yyyy"
+    endless.close()
+    assert not endless._thread.is_alive()
+
+
+def test_expand_inputs_globs_and_dedupes(tmp_path):
+    (tmp_path / "a.jsonl").write_text("")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "b.jsonl").write_text("")
+
+    paths = ingestion.expand_inputs([str(tmp_path / "**" / "*.jsonl"), str(tmp_path / "a.jsonl")])
+
+    assert [os.path.basename(p) for p in paths] == ["a.jsonl", "b.jsonl"]
+
+
+def test_batch_report_matches_in_memory(tmp_path):
+    logs = _make_logs(600)
+    with bz2.open(tmp_path / "part1.json.bz2", "wt") as f:
+        json.dump(logs[:250], f)
+    with open(tmp_path / "part2.jsonl", "w") as f:
+        for log in logs[250:]:
+            f.write(json.dumps(log) + "\n")
+
+    paths = ingestion.expand_inputs([str(tmp_path / "part*")])
+    report, run_stats = cli.run_batch(paths)
+
+    assert report == analyze_api_logs(logs)
+    assert run_stats["files"] == 2
+    assert run_stats["records_read"] == 600
+    assert run_stats["records_accepted"] == 600
+
+
+def test_parallel_workers_match_sequential(tmp_path):
+    logs = _make_logs(900)
+    for i in range(3):
+        with open(tmp_path / f"part{i}.jsonl", "w") as f:
+            for log in logs[i * 300:(i + 1) * 300]:
+                f.write(json.dumps(log) + "\n")
+
+    paths = ingestion.expand_inputs([str(tmp_path / "*.jsonl")])
+    sections = ["summary", "endpoint_stats", "cost_analysis", "caching_opportunities", "top_users_by_requests"]
+    sequential, _ = cli.run_batch(paths, sections=sections)
+    parallel, _ = cli.run_batch(paths, workers=2, sections=sections)
+
+    assert parallel == sequential
+    assert sorted(parallel) == sorted(sections)
+
+
+def test_cli_window_and_ndjson_output(tmp_path, capsys):
+    logs = _make_logs(100)
+    path = tmp_path / "logs.jsonl"
+    path.write_text("\n".join(json.dumps(log) for log in logs))
+
+    exit_code = cli.main_cli([
+        str(path), "--start", "2025-01-15T10:00:00Z", "--end", "2025-01-15T10:01:00Z",
+        "--sections", "summary", "--format", "ndjson"
+    ])
+    out, err = capsys.readouterr()
+
+    assert exit_code == 0
+    line = json.loads(out)
+    assert line["section"] == "summary"
+    assert line["data"]["total_requests"] == 9
+    assert "records/s" in err
+
+
+def test_cli_rejects_half_window(tmp_path):
+    path = tmp_path / "logs.jsonl"
+    path.write_text("")
+
+    with pytest.raises(SystemExit):
+        cli.main_cli([str(path), "--start", "2025-01-15T10:00:00Z"])
@@ -0,0 +1,128 @@
+"""
+Tests for per-user cost attribution
+Run: pytest test_cost_attribution.py -v
+"""
+import os
+import random
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from main import analyze_api_logs
+from aggregator import LogAggregator
+from advanced_features.cost_attribution import UserCostTracker
+from advanced_features.cost_estimation import _memory_cost
+
+
+def _make_logs(count, users, seed=3):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    endpoints = ["/api/users", "/api/products", "/api/payments"]
+    rng = random.Random(seed)
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i)).isoformat() + "Z",
+            "endpoint": endpoints[i % 3],
+            "method": "GET",
+            "response_time_ms": rng.randint(20, 2000),
+            "status_code": 200,
+            # Skewed: a few users send most of the traffic
+            "user_id": f"user_{int(rng.paretovariate(1.2)) % users:05d}",
+            "request_size_bytes": 100,
+            "response_size_bytes": rng.choice([500, 5000, 50000])
+        }
+        for i in range(count)
+    ]
+
+
+def _cost(log):
+    return (
+        config.COST_STRUCTURE["per_request"]
+        + log["response_time_ms"] * config.COST_STRUCTURE["per_ms_execution"]
+        + _memory_cost(log["response_size_bytes"])
+    )
+
+
+def _true_costs(logs):
+    costs = defaultdict(float)
+    for log in logs:
+        costs[log["user_id"]] += _cost(log)
+    return costs
+
+
+def _feed(tracker, logs):
+    for log in logs:
+        tracker.add(
+            log["user_id"],
+            log["endpoint"],
+            log["response_time_ms"] * config.COST_STRUCTURE["per_ms_execution"],
+            _memory_cost(log["response_size_bytes"])
+        )
+    return tracker
+
+
+def test_report_matches_brute_force():
+    logs = _make_logs(3000, users=200)
+    report = analyze_api_logs(logs, sections=["cost_by_user"])["cost_by_user"]
+    truth = _true_costs(logs)
+
+    assert report["exact"]
+    assert report["tracked_users"] == len(truth)
+    top = report["top_users"]
+    assert [row["user_id"] for row in top] == sorted(truth, key=truth.get, reverse=True)[:config.COST_ATTRIBUTION["top_n"]]
+
+    first = top[0]
+    assert first["total_cost"] == round(truth[first["user_id"]], 4)
+    assert first["max_overestimate_usd"] == 0
+    assert sum(row["request_count"] for row in first["cost_by_endpoint"]) == first["request_count"]
+    breakdown = first["cost_breakdown"]
+    assert round(sum(breakdown.values()), 3) == round(first["total_cost"], 3)
+
+
+def test_bounded_mode_keeps_heavy_hitters():
+    logs = _make_logs(20000, users=5000)
+    truth = _true_costs(logs)
+    tracker = _feed(UserCostTracker(max_tracked_users=100), logs)
+
+    assert len(tracker.users) == 100
+    assert not tracker.exact
+    total = sum(truth.values())
+    for user_id, cost in truth.items():
+        if cost > total / 100:
+            assert user_id in tracker.users
+    for user_id, entry in tracker.users.items():
+        assert truth[user_id] - 1e-9 <= entry.cost <= truth[user_id] + entry.error + 1e-9
+    assert max(truth[u] for u in truth if u not in tracker.users) <= tracker.floor + 1e-9
+
+
+def test_merge_bounded_summaries():
+    logs = _make_logs(20000, users=5000)
+    truth = _true_costs(logs)
+    merged = _feed(UserCostTracker(max_tracked_users=200), logs[:10000])
+    merged.merge(_feed(UserCostTracker(max_tracked_users=200), logs[10000:]))
+
+    assert len(merged.users) <= 200
+    for user_id, entry in merged.users.items():
+        assert truth[user_id] - 1e-9 <= entry.cost <= truth[user_id] + entry.error + 1e-9
+    heaviest = max(truth, key=truth.get)
+    assert merged.top(1)[0][0] == heaviest
+
+
+def test_merged_shards_equal_single_pass_when_exact():
+    logs = _make_logs(3000, users=300)
+    single = LogAggregator(sections=["cost_by_user"]).add_many(logs)
+    merged = LogAggregator(sections=["cost_by_user"]).add_many(logs[:1000])
+    merged.merge(LogAggregator(sections=["cost_by_user"]).add_many(logs[1000:]))
+
+    for user_id, entry in single.user_costs.users.items():
+        assert merged.user_costs.users[user_id].cost == pytest.approx(entry.cost)
+        assert merged.user_costs.users[user_id].by_endpoint.keys() == entry.by_endpoint.keys()
+    assert "cost_by_user" not in analyze_api_logs(logs)
+
+
+def test_invalid_capacity_rejected():
+    with pytest.raises(ValueError):
+        UserCostTracker(max_tracked_users=-5)
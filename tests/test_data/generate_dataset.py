@@ -1,135 +1,388 @@
+"""
+Synthetic API log generator for tests and load tests.
+
+Streams any number of records, in timestamp order, to JSONL (optionally
+gzip/bz2/xz compressed, picked by extension), a JSON array, or an SQLite log
+store. Nothing is held in memory beyond one batch, so 100M records cost the
+same memory as 10k.
+
+Traffic follows a scenario: the endpoint mix, how many users and path
+variants there are, and the incidents laid over it (traffic spikes, error
+clusters, rate-limit abusers). Incident windows are seconds after the start.
+With the same seed, records and scenario the output is byte-identical.
+
+Run: python generate_dataset.py logs.jsonl.gz --records 10000000 --seed 7
+"""
+from typing import Any, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+from datetime import datetime, timezone
+import argparse
+import bz2
+import functools
+import gzip
 import json
+import lzma
+import os
 import random
-from datetime import datetime, timedelta
-
-def generate_dataset():
-    logs = []
-    
-    endpoints = {
-        "/api/users": {"weight": 35, "method": "GET", "time_range": (80, 200), "error_rate": 0.01},
-        "/api/products": {"weight": 30, "method": "GET", "time_range": (100, 250), "error_rate": 0.015},
-        "/api/payments": {"weight": 15, "method": "POST", "time_range": (700, 1200), "error_rate": 0.12},
-        "/api/reports": {"weight": 8, "method": "GET", "time_range": (1800, 2500), "error_rate": 0.02},
-        "/api/search": {"weight": 12, "method": "GET", "time_range": (300, 600), "error_rate": 0.03}
-    }
-    
-    users = [f"user_{str(i).zfill(3)}" for i in range(1, 31)]  
-    
-    # user_001 will be VERY active (anomaly trigger)
-    user_weights = [40] + [2] * 29  # user_001 gets 40x weight
-    
-    base_time = datetime(2025, 1, 15, 10, 0, 0)
-    
-    # Generate 500 logs over 1 hour
-    for i in range(10000):
-        # Pick endpoint based on weights
-        endpoint = random.choices(
-            list(endpoints.keys()),
-            weights=[endpoints[e]["weight"] for e in endpoints.keys()],
-            k=1
-        )[0]
-        
-        config = endpoints[endpoint]
-        
-        # Method
-        if endpoint in ["/api/users", "/api/products"]:
-            method = random.choice(["GET", "GET", "GET", "GET", "GET", "POST"])  # 83% GET
-        elif endpoint == "/api/search":
-            method = "GET"  # 100% GET
-        elif endpoint == "/api/reports":
-            method = random.choice(["GET", "GET", "GET", "GET", "POST"])  # 80% GET
-        else:
-            method = config["method"]
-        
-        # Pick user (with user_001 being very active)
-        user_id = random.choices(users, weights=user_weights, k=1)[0]
-        
-        # Response time
-        response_time = random.randint(config["time_range"][0], config["time_range"][1])
-        
-        # Timestamp - spread over 60 minutes
-        minutes_offset = (i / 500) * 60
-        timestamp = base_time + timedelta(minutes=minutes_offset)
-        
-        # Create request spike for /api/search between 10:20-10:25 (minute 20-25)
-        if 20 <= minutes_offset <= 25 and random.random() < 0.6:
-            endpoint = "/api/search"
-            method = "GET"
-            response_time = random.randint(300, 600)
-        
-        # Create error cluster for /api/payments around 10:35-10:40 (minute 35-40)
-        if 35 <= minutes_offset <= 40 and endpoint == "/api/payments":
-            status_code = random.choice([500, 500, 500, 503, 503, 200])  # High error rate
-        else:
-            # Normal error rate
-            if random.random() < config["error_rate"]:
-                status_code = random.choice([400, 404, 500, 503])
-            else:
-                if method == "POST" and endpoint != "/api/payments":
-                    status_code = 201
+import sys
+import time
+
+# Records drawn per batch; part of what the output depends on, so changing it changes every dataset
+BATCH_SIZE = 10000
+
+# Roughly the traffic behind the bundled sample files
+DEFAULT_SCENARIO: Dict[str, Any] = {
+    "start": "2025-01-15T10:00:00Z",
+    "duration_seconds": 3600,
+    # methods are integer weights; error codes are drawn uniformly, otherwise the method's success code
+    "endpoints": {
+        "/api/users": {"weight": 35, "methods": {"GET": 5, "POST": 1}, "response_time_ms": [80, 200],
+                       "error_rate": 0.01, "request_size_bytes": [256, 512], "response_size_bytes": [512, 2048]},
+        "/api/products": {"weight": 30, "methods": {"GET": 5, "POST": 1}, "response_time_ms": [100, 250],
+                          "error_rate": 0.015, "request_size_bytes": [256, 512], "response_size_bytes": [1024, 4096]},
+        "/api/payments": {"weight": 15, "methods": {"POST": 1}, "response_time_ms": [700, 1200],
+                          "error_rate": 0.12, "request_size_bytes": [1024, 3072], "response_size_bytes": [256, 1024],
+                          "success_status": {"POST": 200}},
+        "/api/reports": {"weight": 8, "methods": {"GET": 4, "POST": 1}, "response_time_ms": [1800, 2500],
+                         "error_rate": 0.02, "request_size_bytes": [256, 1024], "response_size_bytes": [12288, 20480]},
+        "/api/search": {"weight": 12, "methods": {"GET": 1}, "response_time_ms": [300, 600],
+                        "error_rate": 0.03, "request_size_bytes": [512, 2048], "response_size_bytes": [4096, 12288]}
+    },
+    "error_status_codes": [400, 404, 500, 503],
+    "success_status": {"GET": 200, "POST": 201},
+    # >1 turns each endpoint into that many paths, e.g. /api/users/0 ... /api/users/999
+    "paths_per_endpoint": 1,
+    # user_001 .. user_NNN; the first hot_users are hot_weight times as active as the rest
+    "users": 30,
+    "hot_users": 1,
+    "hot_weight": 20,
+    # Share of the traffic in the window redirected to the endpoint
+    "spikes": [
+        {"endpoint": "/api/search", "start": 1200, "end": 1500, "share": 0.6}
+    ],
+    # The endpoint's error rate and codes inside the window
+    "error_clusters": [
+        {"endpoint": "/api/payments", "start": 2100, "end": 2400, "error_rate": 0.83, "status_codes": [500, 503]}
+    ],
+    # One user sending requests_per_minute to the endpoint, taken out of the regular traffic
+    "abusers": [
+        {"user_id": "user_002", "endpoint": "/api/products", "method": "GET", "start": 2700, "end": 2760,
+         "requests_per_minute": 240}
+    ]
+}
+
+# Fast levels: generation, not compression, should be the bottleneck
+WRITE_OPENERS = {
+    ".gz": functools.partial(gzip.open, compresslevel=1),
+    ".bz2": functools.partial(bz2.open, compresslevel=1),
+    ".xz": functools.partial(lzma.open, preset=0)
+}
+
+FORMATS = ("jsonl", "json", "sqlite")
+
+_FIELDS = (
+    "timestamp", "endpoint", "method", "response_time_ms", "status_code",
+    "user_id", "request_size_bytes", "response_size_bytes"
+)
+
+
+def load_scenario(overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """DEFAULT_SCENARIO with top-level keys replaced by overrides."""
+    scenario = dict(DEFAULT_SCENARIO)
+    if overrides:
+        unknown = set(overrides) - set(DEFAULT_SCENARIO)
+        if unknown:
+            raise ValueError(f"Unknown scenario keys: {', '.join(sorted(unknown))}")
+        scenario.update(overrides)
+    if scenario["duration_seconds"] <= 0:
+        raise ValueError("duration_seconds must be positive")
+    if scenario["users"] < scenario["hot_users"] or scenario["users"] < 1:
+        raise ValueError("users must be at least 1 and at least hot_users")
+    for incident in scenario["spikes"] + scenario["error_clusters"] + scenario["abusers"]:
+        if incident["endpoint"] not in scenario["endpoints"]:
+            raise ValueError(f"Incident endpoint {incident['endpoint']} is not in the endpoint mix")
+    return scenario
+
+
+def _index_range(window: Dict[str, Any], records: int, duration: float) -> Tuple[int, int]:
+    """Record indices whose timestamps fall in [start, end]."""
+    first = -(-window["start"] * records // duration)
+    last = window["end"] * records // duration + 1
+    return max(0, int(first)), min(records, int(last))
+
+
+class _Plan:
+    """Scenario compiled into lookup tables indexed by endpoint number."""
+
+    def __init__(self, scenario: Dict[str, Any], records: int):
+        self.records = records
+        self.duration = scenario["duration_seconds"]
+        start = datetime.fromisoformat(scenario["start"].replace("Z", "+00:00"))
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        self.start = start
+
+        endpoints = scenario["endpoints"]
+        self.paths = list(endpoints)
+        index = {path: i for i, path in enumerate(self.paths)}
+        self.cum_weights = []
+        total = 0
+        for path in self.paths:
+            total += endpoints[path]["weight"]
+            self.cum_weights.append(total)
+
+        self.methods = []
+        self.ranges = []
+        self.error_rates = []
+        self.success = []
+        for path in self.paths:
+            spec = endpoints[path]
+            self.methods.append([method for method, weight in spec["methods"].items() for _ in range(weight)])
+            self.ranges.append(tuple(
+                (lo, hi - lo + 1) for lo, hi in (spec["response_time_ms"], spec["request_size_bytes"], spec["response_size_bytes"])
+            ))
+            self.error_rates.append(spec["error_rate"])
+            self.success.append({**scenario["success_status"], **spec.get("success_status", {})})
+        self.error_codes = list(scenario["error_status_codes"])
+
+        self.paths_per_endpoint = scenario["paths_per_endpoint"]
+        users = scenario["users"]
+        self.user_width = max(3, len(str(users)))
+        self.hot_users = scenario["hot_users"]
+        self.cold_users = users - self.hot_users
+        hot_mass = self.hot_users * scenario["hot_weight"]
+        self.hot_share = hot_mass / (hot_mass + self.cold_users)
+
+        self.spikes = [
+            (*_index_range(spike, records, self.duration), index[spike["endpoint"]], spike["share"])
+            for spike in scenario["spikes"]
+        ]
+        self.clusters = [
+            (*_index_range(cluster, records, self.duration), index[cluster["endpoint"]], cluster["error_rate"], list(cluster["status_codes"]))
+            for cluster in scenario["error_clusters"]
+        ]
+        rate = records / self.duration
+        self.abusers = [
+            (*_index_range(abuser, records, self.duration), index[abuser["endpoint"]], abuser.get("method"),
+             abuser["user_id"], min(1.0, abuser["requests_per_minute"] / 60 / rate))
+            for abuser in scenario["abusers"]
+        ]
+
+
+def _iter_columns(plan: _Plan, rng: random.Random) -> Iterator[Tuple[List[Any], ...]]:
+    """
+    Yield batches as columns in _FIELDS order.
+
+    Every random draw is made for a whole batch at once, one call per
+    column, and the per-record work is table lookups.
+    """
+    records = plan.records
+    draw = rng.random
+    # Integer microseconds, so timestamps are exact and strictly ordered
+    span_micros = int(plan.duration * 1000000)
+    start_epoch = plan.start.timestamp()
+    last_second = None
+    second_text = ""
+
+    for lo in range(0, records, BATCH_SIZE):
+        hi = min(records, lo + BATCH_SIZE)
+        n = hi - lo
+        endpoint_ids = rng.choices(range(len(plan.paths)), cum_weights=plan.cum_weights, k=n)
+        users: List[Optional[str]] = [None] * n
+        methods: List[Optional[str]] = [None] * n
+
+        for first, last, endpoint_id, share in plan.spikes:
+            for i in range(max(first, lo), min(last, hi)):
+                if draw() < share:
+                    endpoint_ids[i - lo] = endpoint_id
+        for first, last, endpoint_id, method, user_id, share in plan.abusers:
+            for i in range(max(first, lo), min(last, hi)):
+                if draw() < share:
+                    endpoint_ids[i - lo] = endpoint_id
+                    users[i - lo] = user_id
+                    methods[i - lo] = method
+
+        timestamps = []
+        for i in range(lo, hi):
+            second, micros = divmod(i * span_micros // records, 1000000)
+            if second != last_second:
+                last_second = second
+                second_text = datetime.fromtimestamp(start_epoch + second, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+            timestamps.append(f"{second_text}.{micros:06d}Z" if micros else f"{second_text}Z")
+
+        method_draws = [draw() for _ in range(n)]
+        for i, endpoint_id in enumerate(endpoint_ids):
+            if methods[i] is None:
+                table = plan.methods[endpoint_id]
+                methods[i] = table[int(method_draws[i] * len(table))]
+
+        hot_share = plan.hot_share
+        hot_users = plan.hot_users
+        cold_users = plan.cold_users
+        width = plan.user_width
+        for i, u in enumerate([draw() for _ in range(n)]):
+            if users[i] is None:
+                if u < hot_share:
+                    number = int(u / hot_share * hot_users)
                 else:
-                    status_code = 200
-        
-        # Create rate limit violations
-        # user_002 makes 150+ requests in one minute (minute 45)
-        if 45 <= minutes_offset <= 46 and random.random() < 0.3:
-            user_id = "user_002"
-            endpoint = "/api/products"
-            method = "GET"
-        
-        # Request and response sizes
-        if endpoint == "/api/reports":
-            request_size = random.randint(256, 1024)
-            response_size = random.randint(12288, 20480)  # 12-20KB (large)
-        elif endpoint == "/api/users":
-            request_size = random.randint(256, 512)
-            response_size = random.randint(512, 2048)  # 0.5-2KB
-        elif endpoint == "/api/products":
-            request_size = random.randint(256, 512)
-            response_size = random.randint(1024, 4096)  # 1-4KB
-        elif endpoint == "/api/payments":
-            request_size = random.randint(1024, 3072)
-            response_size = random.randint(256, 1024)
-        else:  # search
-            request_size = random.randint(512, 2048)
-            response_size = random.randint(4096, 12288)  # 4-12KB
-        
-        log = {
-            "timestamp": timestamp.isoformat() + "Z",
-            "endpoint": endpoint,
-            "method": method,
-            "response_time_ms": response_time,
-            "status_code": status_code,
-            "user_id": user_id,
-            "request_size_bytes": request_size,
-            "response_size_bytes": response_size
-        }
-        
-        logs.append(log)
-    
-    # Add extra logs to trigger rate limits more clearly
-    # Add 120 more requests from user_002 at minute 45 (rate limit violation)
-    spike_time = base_time + timedelta(minutes=45)
-    for j in range(120):
-        logs.append({
-            "timestamp": (spike_time + timedelta(seconds=j * 0.5)).isoformat() + "Z",
-            "endpoint": "/api/products",
-            "method": "GET",
-            "response_time_ms": random.randint(100, 250),
-            "status_code": 200,
-            "user_id": "user_002",
-            "request_size_bytes": 256,
-            "response_size_bytes": random.randint(1024, 2048)
-        })
-    
-    # Sort by timestamp
-    logs.sort(key=lambda x: x["timestamp"])
-    
-    return logs
-
-# Generate and save
-logs = generate_dataset()
-
-
-with open('test_data/sample_large.json', 'w') as f:
-    json.dump(logs, f, indent=2)
+                    number = hot_users + int((u - hot_share) / (1 - hot_share) * cold_users)
+                users[i] = f"user_{number + 1:0{width}d}"
+
+        columns = []
+        for field in range(3):
+            values = [draw() for _ in range(n)]
+            ranges = plan.ranges
+            columns.append([ranges[e][field][0] + int(r * ranges[e][field][1]) for e, r in zip(endpoint_ids, values)])
+        response_times, request_sizes, response_sizes = columns
+
+        error_rates = [plan.error_rates[e] for e in endpoint_ids]
+        error_codes: List[List[int]] = [plan.error_codes] * n
+        for first, last, endpoint_id, rate, codes in plan.clusters:
+            for i in range(max(first, lo), min(last, hi)):
+                if endpoint_ids[i - lo] == endpoint_id:
+                    error_rates[i - lo] = rate
+                    error_codes[i - lo] = codes
+        statuses = []
+        success = plan.success
+        for e, method, rate, codes, r in zip(endpoint_ids, methods, error_rates, error_codes, [draw() for _ in range(n)]):
+            if r < rate:
+                statuses.append(codes[int(r / rate * len(codes))])
+            else:
+                statuses.append(success[e].get(method, 200))
+
+        if plan.paths_per_endpoint > 1:
+            variants = plan.paths_per_endpoint
+            endpoints = [f"{plan.paths[e]}/{int(r * variants)}" for e, r in zip(endpoint_ids, [draw() for _ in range(n)])]
+        else:
+            endpoints = [plan.paths[e] for e in endpoint_ids]
+
+        yield timestamps, endpoints, methods, response_times, statuses, users, request_sizes, response_sizes
+
+
+def iter_logs(
+    records: int,
+    scenario: Optional[Dict[str, Any]] = None,
+    seed: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """Yield records as dicts, in timestamp order."""
+    plan = _Plan(load_scenario(scenario), records)
+    for columns in _iter_columns(plan, random.Random(seed)):
+        for values in zip(*columns):
+            yield dict(zip(_FIELDS, values))
+
+
+def iter_lines(
+    records: int,
+    scenario: Optional[Dict[str, Any]] = None,
+    seed: Optional[int] = None
+) -> Iterator[str]:
+    """Yield blocks of JSONL text, one batch per block; each line is what json.dumps would write."""
+    plan = _Plan(load_scenario(scenario), records)
+    # Values are formatted straight into the line; only strings that could need escaping go through json.dumps
+    quoted: Dict[str, str] = {}
+    # Generated user ids never need escaping, the ones named in the scenario might
+    named_users = {abuser[4]: json.dumps(abuser[4]) for abuser in plan.abusers}
+    for columns in _iter_columns(plan, random.Random(seed)):
+        lines = []
+        for ts, endpoint, method, response_time, status, user, request_size, response_size in zip(*columns):
+            endpoint_text = quoted.get(endpoint)
+            if endpoint_text is None:
+                endpoint_text = quoted[endpoint] = json.dumps(endpoint)
+            method_text = quoted.get(method)
+            if method_text is None:
+                method_text = quoted[method] = json.dumps(method)
+            user_text = named_users.get(user) or '"' + user + '"'
+            lines.append(
+                f'{{"timestamp": "{ts}", "endpoint": {endpoint_text}, "method": {method_text}, '
+                f'"response_time_ms": {response_time}, "status_code": {status}, "user_id": {user_text}, '
+                f'"request_size_bytes": {request_size}, "response_size_bytes": {response_size}}}\n'
+            )
+        if len(quoted) > 100000:
+            quoted.clear()
+        yield "".join(lines)
+
+
+def _write_text(out: TextIO, output_format: str, records: int, scenario: Optional[Dict[str, Any]], seed: Optional[int]) -> None:
+    if output_format == "jsonl":
+        for block in iter_lines(records, scenario, seed):
+            out.write(block)
+        return
+    out.write("[")
+    first = True
+    for block in iter_lines(records, scenario, seed):
+        text = ",\n".join(block.splitlines())
+        out.write(text if first else ",\n" + text)
+        first = False
+    out.write("]\n")
+
+
+def write_dataset(
+    output: str,
+    records: int,
+    scenario: Optional[Dict[str, Any]] = None,
+    seed: Optional[int] = None,
+    output_format: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Write records to output ("-" for stdout) and return {records, bytes, seconds}.
+
+    output_format defaults from the extension: .db/.sqlite is an SQLite log
+    store, .json a JSON array, anything else JSONL.
+    """
+    if output_format is None:
+        stem, ext = os.path.splitext(output)
+        if ext in WRITE_OPENERS:
+            ext = os.path.splitext(stem)[1]
+        output_format = {".db": "sqlite", ".sqlite": "sqlite", ".json": "json"}.get(ext, "jsonl")
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown format {output_format!r}; choose from {FORMATS}")
+
+    started = time.perf_counter()
+    if output_format == "sqlite":
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        from storage import SQLiteLogStore
+        with SQLiteLogStore(output) as store:
+            store.ingest(iter_logs(records, scenario, seed))
+    elif output == "-":
+        _write_text(sys.stdout, output_format, records, scenario, seed)
+    else:
+        opener = WRITE_OPENERS.get(os.path.splitext(output)[1], open)
+        with opener(output, "wt", encoding="utf-8") as out:
+            _write_text(out, output_format, records, scenario, seed)
+    seconds = time.perf_counter() - started
+    return {
+        "records": records,
+        "bytes": 0 if output == "-" else os.path.getsize(output),
+        "seconds": round(seconds, 3)
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate synthetic API logs.")
+    parser.add_argument("output", help="output file, '-' for stdout; .gz/.bz2/.xz are compressed")
+    parser.add_argument("--records", type=int, default=10000, help="number of records (default: 10000)")
+    parser.add_argument("--seed", type=int, help="random seed; the same seed gives the same output")
+    parser.add_argument("--scenario", help="JSON file whose keys replace those of DEFAULT_SCENARIO")
+    parser.add_argument("--duration", type=float, help="seconds the timestamps span (overrides the scenario)")
+    parser.add_argument("--format", dest="output_format", choices=FORMATS, help="default: from the extension")
+    args = parser.parse_args(argv)
+    if args.records < 1:
+        parser.error("--records must be at least 1")
+
+    overrides: Dict[str, Any] = {}
+    if args.scenario:
+        with open(args.scenario) as f:
+            overrides = json.load(f)
+    if args.duration is not None:
+        overrides["duration_seconds"] = args.duration
+    try:
+        stats = write_dataset(args.output, args.records, overrides, args.seed, args.output_format)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.output != "-":
+        rate = int(stats["records"] / stats["seconds"]) if stats["seconds"] else 0
+        print(f"{stats['records']:,} records, {stats['bytes']:,} bytes in {stats['seconds']}s ({rate:,} records/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Tests for record filters and their pushdown into the loaders
+Run: pytest test_filters.py -v
+"""
+import gzip
+import json
+import os
+import pickle
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cli
+import ingestion
+from filters import RecordFilter
+from main import analyze_api_logs
+from storage import SQLiteLogStore
+
+SECTIONS = ["summary", "endpoint_stats", "top_users_by_requests", "status_codes"]
+
+
+def _make_logs(count):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    endpoints = ["/api/users", "/api/users/search", "/api/products", "/api/payments"]
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * 7)).isoformat() + "Z",
+            "endpoint": endpoints[i % 4],
+            "method": "GET" if i % 3 else "POST",
+            "response_time_ms": 40 + (i * 37) % 900,
+            "status_code": [200, 201, 404, 500, 503][i % 5] if i % 6 == 0 else 200,
+            "user_id": f"user_{i % 17:03d}",
+            "request_size_bytes": 256,
+            "response_size_bytes": (i * 131) % 15000
+        }
+        for i in range(count)
+    ]
+
+
+def _write_jsonl(path, logs, extra=()):
+    with gzip.open(path, "wt") as f:
+        for log in logs:
+            f.write(json.dumps(log) + "\n")
+        for line in extra:
+            f.write(line + "\n")
+
+
+SPEC = {
+    "starttime": "2025-01-15T10:05:00Z",
+    "endpoint_prefixes": ["/api/users"],
+    "methods": ["GET"],
+    "status_classes": ["2xx", "5xx"],
+    "users": ["user_001", "user_002", "user_003", "user_005", "user_008"]
+}
+
+
+def _expected(logs, spec=SPEC):
+    record_filter = RecordFilter.from_dict(spec)
+    return [log for log in logs if record_filter.matches(log)]
+
+
+def test_predicate_matches_each_field():
+    record_filter = RecordFilter.from_dict(SPEC)
+    log = _make_logs(1)[0] | {
+        "timestamp": "2025-01-15T10:06:00Z", "endpoint": "/api/users/search", "method": "GET", "user_id": "user_003"
+    }
+    assert record_filter.matches(log)
+    assert not record_filter.matches(log | {"method": "POST"})
+    assert not record_filter.matches(log | {"status_code": 404})
+    assert not record_filter.matches(log | {"user_id": "user_004"})
+    assert not record_filter.matches(log | {"endpoint": "/api/products"})
+    assert not record_filter.matches(log | {"timestamp": "2025-01-15T10:04:59Z"})
+    # Naive timestamps are taken as UTC rather than slipping through
+    assert record_filter.matches(log | {"timestamp": "2025-01-15T10:06:00"})
+    assert not record_filter.matches(log | {"timestamp": "2025-01-15T10:04:00"})
+    assert not record_filter.matches(log | {"timestamp": "garbage"})
+    assert RecordFilter().is_empty and RecordFilter().matches({})
+
+    with pytest.raises(ValueError):
+        RecordFilter(status_classes=["6xx"])
+    with pytest.raises(ValueError):
+        RecordFilter("2025-01-15T11:00:00Z", "2025-01-15T10:00:00Z")
+
+
+def test_line_prefilter_never_drops_a_match():
+    record_filter = RecordFilter(endpoints=["/api/payments"], users=["user_004", "user_010"])
+    for log in _make_logs(500):
+        for line in (json.dumps(log), json.dumps(log).replace("/", "\\/"), json.dumps(log, indent=1)):
+            if record_filter.matches(log):
+                assert record_filter.matches_line(line)
+    assert not record_filter.matches_line(json.dumps({"endpoint": "/api/users", "user_id": "user_004"}))
+
+
+def test_line_prefilter_checks_the_time_range():
+    record_filter = RecordFilter("2025-01-15T10:05:00Z", "2025-01-15T10:10:00Z")
+    for log in _make_logs(500):
+        line = json.dumps(log)
+        assert record_filter.matches_line(line) == record_filter.matches(log)
+    # Lines whose timestamp cannot be read off the raw text are left to the decoded check
+    nested = {"timestamp": "2025-01-15T09:00:00Z", "extra": {"timestamp": "2025-01-15T10:06:00Z"}}
+    assert record_filter.matches_line(json.dumps(nested))
+    assert record_filter.matches_line(json.dumps({"timestamp": "garbage"}))
+
+
+def test_analyze_api_logs_filters():
+    logs = _make_logs(900)
+    assert analyze_api_logs(logs, sections=SECTIONS, filters=SPEC) == analyze_api_logs(_expected(logs), sections=SECTIONS)
+
+
+def test_open_ended_window():
+    logs = _make_logs(300)
+    start = "2025-01-15T10:20:00Z"
+    kept = [log for log in logs if log["timestamp"] >= start]
+    assert analyze_api_logs(logs, starttime=start, sections=SECTIONS) == analyze_api_logs(kept, sections=SECTIONS)
+    # A naive bound is UTC, not silently ignored
+    naive = analyze_api_logs(logs, starttime=start.rstrip("Z"), sections=SECTIONS)
+    assert naive["summary"]["total_requests"] == len(kept)
+
+
+def test_iter_records_drops_before_decoding(tmp_path):
+    logs = _make_logs(600)
+    path = str(tmp_path / "logs.jsonl.gz")
+    _write_jsonl(path, logs, extra=["not json"])
+    record_filter = RecordFilter(endpoints=["/api/payments"], methods=["POST"])
+
+    stats = {}
+    records = list(ingestion.iter_records(path, stats, record_filter))
+    assert records == _expected(logs, record_filter.to_dict())
+    assert stats["records"] + stats["decode_errors"] == 601
+    # The undecodable line holds no accepted endpoint, so it is dropped without decoding
+    assert stats["decode_errors"] == 0
+    assert stats["filtered"] == 601 - len(records)
+
+
+@pytest.mark.parametrize("mode", [None, "thread", "process"])
+def test_run_batch_pushdown_matches_prefiltered_input(tmp_path, mode):
+    logs = _make_logs(3000)
+    paths = [str(tmp_path / "a.jsonl.gz"), str(tmp_path / "b.jsonl.gz")]
+    _write_jsonl(paths[0], logs[:1500])
+    _write_jsonl(paths[1], logs[1500:])
+    expected_path = str(tmp_path / "expected.jsonl.gz")
+    _write_jsonl(expected_path, _expected(logs))
+
+    report, run_stats = cli.run_batch(paths, sections=SECTIONS, pipeline_mode=mode, record_filter=RecordFilter.from_dict(SPEC))
+    expected, _ = cli.run_batch([expected_path], sections=SECTIONS)
+    assert report == expected
+    assert run_stats["records_read"] == 3000
+    assert run_stats["records_filtered"] == 3000 - len(_expected(logs))
+
+
+def test_filter_pickles():
+    record_filter = RecordFilter.from_dict(SPEC)
+    clone = pickle.loads(pickle.dumps(record_filter))
+    assert clone.to_dict() == record_filter.to_dict()
+    logs = _make_logs(200)
+    assert [clone.matches(log) for log in logs] == [record_filter.matches(log) for log in logs]
+
+
+def test_storage_filter_sql():
+    logs = _make_logs(1200)
+    record_filter = RecordFilter.from_dict(SPEC | {"endpoints": ["/api/payments"]})
+    with SQLiteLogStore() as store:
+        store.ingest(logs)
+        report = store.report(sections=SECTIONS, record_filter=record_filter)
+    assert report == analyze_api_logs(_expected(logs, record_filter.to_dict()), sections=SECTIONS)
+
+
+def test_cli_flags(tmp_path, capsys):
+    logs = _make_logs(400)
+    path = str(tmp_path / "logs.jsonl.gz")
+    _write_jsonl(path, logs)
+    output = str(tmp_path / "report.json")
+
+    assert cli.main_cli([path, "--endpoint-prefix", "/api/users", "--status-class", "5xx", "--sections", "summary", "-o", output]) == 0
+    with open(output) as f:
+        report = json.load(f)
+    spec = {"endpoint_prefixes": ["/api/users"], "status_classes": ["5xx"]}
+    assert report == json.loads(json.dumps(analyze_api_logs(_expected(logs, spec), sections=["summary"])))
+    assert "filtered" in capsys.readouterr().err
@@ -0,0 +1,166 @@
+"""
+Tests for follow mode over appended, rotated and truncated files
+Run: pytest test_follow.py -v
+"""
+import json
+import marshal
+import os
+import shutil
+import sys
+import zlib
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cli
+from follow import FileFollower
+from main import analyze_api_logs
+
+SECTIONS = ["summary", "endpoint_stats", "top_users_by_requests", "status_codes"]
+
+
+def _make_logs(count, start=0):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    endpoints = ["/api/users", "/api/products", "/api/payments"]
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * 3)).isoformat() + "Z",
+            "endpoint": endpoints[i % 3],
+            "method": "GET",
+            "response_time_ms": 80 + (i * 31) % 700,
+            "status_code": 500 if i % 13 == 0 else 200,
+            "user_id": f"user_{i % 19:03d}",
+            "request_size_bytes": 100,
+            "response_size_bytes": 500
+        }
+        for i in range(start, start + count)
+    ]
+
+
+def _append(path, logs, tail=""):
+    with open(path, "a") as f:
+        f.write("".join(json.dumps(log) + "\n" for log in logs) + tail)
+
+
+def test_appends_are_read_incrementally(tmp_path):
+    path = str(tmp_path / "access.log")
+    logs = _make_logs(300)
+    with FileFollower([path], sections=SECTIONS) as follower:
+        # Not created yet
+        assert follower.poll() == 0
+
+        _append(path, logs[:100])
+        assert follower.poll() == 100
+        assert follower.poll() == 0
+
+        # A half-written line waits for its newline
+        line = json.dumps(logs[100])
+        _append(path, [], line[:20])
+        assert follower.poll() == 0
+        with open(path, "a") as f:
+            f.write(line[20:] + "\n")
+        _append(path, logs[101:], "not json\n")
+        assert follower.poll() == 200
+
+        assert follower.stats["decode_errors"] == 1
+        assert follower.report() == analyze_api_logs(logs, sections=SECTIONS)
+
+
+def test_rotation_reads_old_file_to_the_end(tmp_path):
+    path = str(tmp_path / "access.log")
+    logs = _make_logs(300)
+    with FileFollower([path], sections=SECTIONS) as follower:
+        _append(path, logs[:100])
+        follower.poll()
+        # Written after the last poll, then rotated away
+        _append(path, logs[100:150])
+        os.rename(path, path + ".1")
+        assert follower.poll() == 50
+        _append(path, logs[150:])
+        assert follower.poll() == 150
+
+        assert follower.stats["rotations"] == 1
+        assert follower.report() == analyze_api_logs(logs, sections=SECTIONS)
+
+
+def test_truncation_restarts_from_the_top(tmp_path):
+    path = str(tmp_path / "access.log")
+    logs = _make_logs(200)
+    with FileFollower([path], sections=SECTIONS) as follower:
+        _append(path, logs[:150])
+        follower.poll()
+        # copytruncate
+        shutil.copy(path, path + ".1")
+        with open(path, "w"):
+            pass
+        _append(path, logs[150:])
+        assert follower.poll() == 50
+        assert follower.stats["truncations"] == 1
+        assert follower.report() == analyze_api_logs(logs, sections=SECTIONS)
+
+
+def test_checkpoint_resumes_without_rereading(tmp_path):
+    paths = [str(tmp_path / "a.log"), str(tmp_path / "b.log")]
+    checkpoint = str(tmp_path / "follow.ckpt")
+    logs = _make_logs(400)
+
+    _append(paths[0], logs[:100])
+    _append(paths[1], logs[100:200])
+    with FileFollower(paths, checkpoint, sections=SECTIONS) as follower:
+        follower.poll()
+        follower.checkpoint()
+    assert sorted(os.listdir(tmp_path)) == ["a.log", "b.log", "follow.ckpt"]
+
+    _append(paths[0], logs[200:300])
+    _append(paths[1], logs[300:])
+    with FileFollower(paths, checkpoint, sections=SECTIONS) as restarted:
+        assert restarted.poll() == 200
+        assert restarted.stats["records"] == 400
+        expected = analyze_api_logs(logs[:100] + logs[200:300] + logs[100:200] + logs[300:], sections=SECTIONS)
+        assert restarted.report()["summary"] == expected["summary"]
+        assert restarted.report()["status_codes"] == expected["status_codes"]
+        restarted.checkpoint()
+
+    # A checkpoint holds only the trackers of its own sections
+    with pytest.raises(ValueError, match="sections"):
+        FileFollower(paths, checkpoint, sections=SECTIONS + ["rate_limit_violations"])
+    with pytest.raises(ValueError, match="sections"):
+        FileFollower(paths, checkpoint)
+    with open(checkpoint, "rb") as f:
+        assert b"LogAggregator" in zlib.decompress(marshal.load(f)["state"])
+
+
+def test_report_leaves_detectors_running(tmp_path):
+    path = str(tmp_path / "access.log")
+    _append(path, _make_logs(100))
+    with FileFollower([path]) as follower:
+        follower.poll()
+        follower.report()
+        _append(path, _make_logs(100, start=100))
+        follower.poll()
+        assert follower.report()["summary"]["total_requests"] == 200
+
+
+def test_from_end_skips_existing_content(tmp_path):
+    path = str(tmp_path / "access.log")
+    _append(path, _make_logs(50))
+    with FileFollower([path], from_end=True) as follower:
+        assert follower.poll() == 0
+        _append(path, _make_logs(10, start=50))
+        assert follower.poll() == 10
+
+
+def test_cli_follow_writes_report(tmp_path):
+    path = str(tmp_path / "access.log")
+    output = str(tmp_path / "report.json")
+    logs = _make_logs(120)
+    _append(path, logs)
+
+    stats = cli.run_follow([path], SECTIONS, str(tmp_path / "ckpt"), output, poll_seconds=0.01, duration=0.05)
+    assert stats["records"] == 120
+    with open(output) as f:
+        assert json.load(f) == json.loads(json.dumps(analyze_api_logs(logs, sections=SECTIONS)))
+
+    with pytest.raises(SystemExit):
+        cli.main_cli([path, "--follow", "--workers", "2"])
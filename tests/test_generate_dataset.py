@@ -0,0 +1,80 @@
+"""
+Tests for the synthetic dataset generator
+Run: pytest test_generate_dataset.py -v
+"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data"))
+import generate_dataset
+import ingestion
+import utils
+from main import analyze_api_logs
+from storage import SQLiteLogStore
+
+
+def test_lines_match_records_and_seed_reproduces():
+    lines = "".join(generate_dataset.iter_lines(5000, seed=3)).splitlines()
+    logs = list(generate_dataset.iter_logs(5000, seed=3))
+    assert [json.loads(line) for line in lines] == logs
+    assert lines == [json.dumps(log) for log in logs]
+    assert list(generate_dataset.iter_logs(5000, seed=4)) != logs
+
+    assert all(utils.validate_log_entry(log) for log in logs)
+    times = [utils.parse_timestamp(log["timestamp"]) for log in logs]
+    assert times == sorted(times)
+    assert (times[-1] - times[0]).total_seconds() < 3600
+
+
+def test_default_scenario_incidents():
+    logs = list(generate_dataset.iter_logs(60000, seed=1))
+    report = analyze_api_logs(logs, sections=["anomalies", "rate_limit_violations", "top_users_by_requests"])
+    assert report["top_users_by_requests"][0]["user_id"] == "user_001"
+    assert any(v["user_id"] == "user_002" for v in report["rate_limit_violations"])
+    assert {a["endpoint"] for a in report["anomalies"]} >= {"/api/search", "/api/payments"}
+
+
+def test_scenario_overrides():
+    scenario = {
+        "users": 5000,
+        "hot_users": 0,
+        "paths_per_endpoint": 50,
+        "spikes": [],
+        "error_clusters": [],
+        "abusers": [{"user_id": 'bad "bot"', "endpoint": "/api/search", "start": 0, "end": 60, "requests_per_minute": 1e9}]
+    }
+    lines = "".join(generate_dataset.iter_lines(20000, scenario, seed=5)).splitlines()
+    logs = [json.loads(line) for line in lines]
+    assert logs == list(generate_dataset.iter_logs(20000, scenario, seed=5))
+    assert len({log["user_id"] for log in logs}) > 2000
+    assert len({log["endpoint"] for log in logs}) > 200
+    # Every request in the abuser's minute is theirs
+    minute = utils.parse_timestamp("2025-01-15T10:01:00Z")
+    first_minute = [log for log in logs if utils.parse_timestamp(log["timestamp"]) <= minute]
+    assert {log["user_id"] for log in first_minute} == {'bad "bot"'}
+
+    with pytest.raises(ValueError):
+        generate_dataset.load_scenario({"usres": 10})
+    with pytest.raises(ValueError):
+        generate_dataset.load_scenario({"spikes": [{"endpoint": "/nope", "start": 0, "end": 1, "share": 1}]})
+
+
+@pytest.mark.parametrize("name", ["logs.jsonl", "logs.jsonl.gz", "logs.json.xz"])
+def test_written_files_read_back(tmp_path, name):
+    path = str(tmp_path / name)
+    stats = generate_dataset.write_dataset(path, 3000, seed=9)
+    assert stats["records"] == 3000 and stats["bytes"] == os.path.getsize(path)
+    assert list(ingestion.iter_records(path)) == list(generate_dataset.iter_logs(3000, seed=9))
+
+
+def test_sqlite_output_and_cli(tmp_path):
+    path = str(tmp_path / "logs.db")
+    assert generate_dataset.main([path, "--records", "2000", "--seed", "2", "--duration", "600"]) == 0
+    logs = list(generate_dataset.iter_logs(2000, {"duration_seconds": 600}, seed=2))
+    with SQLiteLogStore(path) as store:
+        assert store.count() == 2000
+        assert store.report(sections=["summary"]) == analyze_api_logs(logs, sections=["summary"])
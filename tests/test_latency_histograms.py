@@ -0,0 +1,120 @@
+"""
+Tests for log-linear latency histograms
+Run: pytest test_latency_histograms.py -v
+"""
+import json
+import math
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import analyze_api_logs
+from aggregator import LogAggregator
+from advanced_features.latency_histograms import LatencyHistogram, LatencyRecorder, _slot, _slot_bounds
+
+
+def _make_logs(count):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    endpoints = ["/api/users", "/api/products", "/api/payments"]
+    rng = random.Random(5)
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * 9)).isoformat() + "Z",
+            "endpoint": endpoints[i % 3],
+            "method": "GET",
+            "response_time_ms": round(rng.lognormvariate(5, 1), 2),
+            "status_code": 200,
+            "user_id": f"user_{i % 17:03d}",
+            "request_size_bytes": 100,
+            "response_size_bytes": 500
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("bits", [4, 6, 9])
+def test_slots_are_contiguous_and_cover_their_values(bits):
+    previous = -1
+    for units in range(0, 1 << 16):
+        slot = _slot(units, bits)
+        assert slot in (previous, previous + 1)
+        lower, width = _slot_bounds(slot, bits)
+        assert lower <= units < lower + width
+        # Width relative to the values in the slot is bounded
+        assert width == 1 or width / lower <= 2.0 ** (1 - bits)
+        previous = slot
+
+
+def test_percentiles_within_relative_error():
+    rng = random.Random(1)
+    values = [rng.lognormvariate(6, 1.5) for _ in range(20000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.add(value)
+
+    values.sort()
+    for percent in (50, 90, 99, 99.9):
+        exact = values[math.ceil(percent / 100 * len(values)) - 1]
+        assert abs(histogram.percentile(percent) - exact) <= exact * histogram.relative_error + histogram.unit_ms
+    assert histogram.percentile(100) == values[-1]
+
+
+def test_merged_shards_equal_single_pass():
+    logs = _make_logs(1500)
+    single = LogAggregator(sections=["latency_histograms"]).add_many(logs)
+    merged = LogAggregator(sections=["latency_histograms"]).add_many(logs[:500])
+    merged.merge(LogAggregator(sections=["latency_histograms"]).add_many(logs[500:]))
+
+    assert merged.latency.cells.keys() == single.latency.cells.keys()
+    for key, histogram in single.latency.cells.items():
+        assert merged.latency.cells[key].counts == histogram.counts
+    with pytest.raises(ValueError):
+        LatencyHistogram(6).merge(LatencyHistogram(7))
+
+
+def test_checkpoint_round_trip():
+    recorder = LatencyRecorder()
+    for i, log in enumerate(_make_logs(400)):
+        recorder.add(log["endpoint"], 1736935200 + i * 30, log["response_time_ms"])
+
+    data = json.loads(json.dumps(recorder.to_dict()))
+    restored = LatencyRecorder.from_dict(data)
+    for key, histogram in recorder.cells.items():
+        assert restored.cells[key].counts == histogram.counts
+        assert restored.cells[key].total == histogram.total
+    # Thousands of slots, stored as the few that are non-empty
+    assert len(json.dumps(data["cells"][0]["histogram"])) < 400
+
+    for target in (restored, recorder):
+        target.add("/api/users", 1736935200, 123.4)
+    assert restored.to_dict() == recorder.to_dict()
+
+
+def test_extreme_values_land_in_top_slot():
+    histogram = LatencyHistogram(max_ms=1000)
+    for value in (0, 0.05, 500, 5000, float("inf")):
+        histogram.add(value)
+    assert histogram.total == 5
+    assert histogram.counts[-1] == 2
+    assert histogram.percentile(1) == 0
+
+
+def test_report_section():
+    logs = _make_logs(600)
+    report = analyze_api_logs(logs, sections=["latency_histograms"])["latency_histograms"]
+
+    endpoints = {row["endpoint"]: row for row in report["by_endpoint"]}
+    assert set(endpoints) == {"/api/users", "/api/products", "/api/payments"}
+    users = endpoints["/api/users"]
+    assert users["request_count"] == 200
+    assert users["percentiles_ms"]["p50"] <= users["percentiles_ms"]["p99"]
+    assert LatencyHistogram.from_dict(users["histogram"]).total == 200
+
+    # 600 records 9s apart span two hourly buckets
+    assert len(report["heatmap"]) == 6
+    assert sum(cell["request_count"] for cell in report["heatmap"]) == 600
+    assert "latency_histograms" not in analyze_api_logs(logs)
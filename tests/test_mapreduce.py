@@ -0,0 +1,182 @@
+"""
+Tests for map/reduce fan-out over shards
+Run: pytest test_mapreduce.py -v
+"""
+import json
+import marshal
+import os
+import sys
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mapreduce
+from aggregator import LogAggregator
+from main import REPORT_SECTIONS, _build_report, analyze_api_logs
+
+EXACT_SECTIONS = ("summary", "endpoint_stats", "hourly_distribution", "top_users_by_requests", "status_codes")
+
+
+def _make_logs(count):
+    base = datetime(2025, 1, 15, 0, 0, 0)
+    endpoints = ["/api/users", "/api/products", "/api/payments"]
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * 20)).isoformat() + "Z",
+            "endpoint": endpoints[i % 3],
+            "method": "GET" if i % 4 else "POST",
+            "response_time_ms": 40 + (i * 53) % 1500,
+            "status_code": 503 if i % 17 == 0 else 200,
+            "user_id": f"user_{i % 23:03d}",
+            "request_size_bytes": 100,
+            "response_size_bytes": 500 + i % 2000
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def job(tmp_path):
+    logs = _make_logs(3000)
+    paths = []
+    for i in range(6):
+        path = tmp_path / f"part-{i}.json"
+        path.write_text(json.dumps(logs[i * 500:(i + 1) * 500]))
+        paths.append(str(path))
+    return logs, paths
+
+
+class FlakyExecutor:
+    """Fails the first attempts of some shards, then delegates to a thread pool."""
+
+    def __init__(self, failures):
+        self.failures = dict(failures)
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        self.submitted = []
+
+    def submit(self, fn, payload):
+        shard_id = payload["shard_id"]
+        self.submitted.append(shard_id)
+        if self.failures.get(shard_id):
+            self.failures[shard_id] -= 1
+            future = Future()
+            future.set_exception(TimeoutError("invocation timed out"))
+            return future
+        return self.pool.submit(fn, payload)
+
+
+def test_file_shards_equal_single_pass(job):
+    logs, paths = job
+    tasks = mapreduce.plan_file_shards(paths, 3)
+    assert [len(task.paths) for task in tasks] == [2, 2, 2]
+
+    stats = {}
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        report = mapreduce.run_job(tasks, pool, stats=stats)
+    expected = analyze_api_logs(logs)
+    for section in EXACT_SECTIONS:
+        assert report[section] == expected[section]
+    assert stats["shards"] == 3
+    assert stats["records_read"] == 3000
+    assert stats["retries"] == 0
+
+
+def test_time_shards_split_records_exactly_once(job):
+    logs, paths = job
+    start, end = "2025-01-15T00:00:00Z", "2025-01-15T16:39:40Z"
+    tasks = mapreduce.plan_time_shards(paths, start, end, 4)
+    assert len(tasks) == 4
+    assert tasks[0].starttime == start and tasks[-1].endtime == end
+    # Shards end just before the next one starts
+    assert tasks[0].endtime == "2025-01-15T04:09:54.999999Z"
+    assert tasks[1].starttime == "2025-01-15T04:09:55Z"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        report = mapreduce.run_job(tasks, pool)
+    expected = analyze_api_logs(logs, start, end)
+    assert report["summary"]["total_requests"] == 3000
+    for section in EXACT_SECTIONS:
+        assert report[section] == expected[section]
+
+
+def test_time_shards_skip_lines_outside_their_range(tmp_path):
+    logs = _make_logs(1200)
+    path = tmp_path / "logs.jsonl"
+    path.write_text("".join(json.dumps(log) + "\n" for log in logs))
+    start, end = logs[0]["timestamp"], logs[-1]["timestamp"]
+    tasks = mapreduce.plan_time_shards([str(path)], start, end, 3)
+
+    partials = [mapreduce.run_shard(task.to_dict()) for task in tasks]
+    # Each shard decodes only its own third of the lines
+    assert [p["read_stats"]["records"] for p in partials] == [1200] * 3
+    assert sum(p["read_stats"]["filtered"] for p in partials) == 2400
+    state = mapreduce.reduce_partials(partials)
+    assert state.records_seen == 1200
+
+
+def test_partials_are_data_only(job):
+    logs, paths = job
+    sections = list(REPORT_SECTIONS)
+    tasks = mapreduce.plan_file_shards(paths, 2, sections=sections)
+    assert [len(task.paths) for task in tasks] == [3, 3]
+    report = mapreduce.run_job(tasks, ThreadPoolExecutor(max_workers=2))
+    # Every tracker survives the trip: same report as merging the shards in memory
+    merged = LogAggregator(sections=sections)
+    for part in (logs[:1500], logs[1500:]):
+        merged.merge(LogAggregator(sections=sections).add_many(part))
+    assert report == _build_report(merged, sections)
+
+    # Only aggregation classes are rebuilt
+    forged = zlib.compress(marshal.dumps((1, ("o", 0, "os", "system", ("d", 1, [])))))
+    with pytest.raises(ValueError, match="not aggregation state"):
+        mapreduce.load_state(forged)
+
+
+def test_failed_shards_are_retried(job):
+    logs, paths = job
+    tasks = mapreduce.plan_file_shards(paths, 3, sections=["summary", "endpoint_stats"])
+    executor = FlakyExecutor({1: 2})
+    stats = {}
+    report = mapreduce.run_job(tasks, executor, max_retries=2, stats=stats)
+
+    assert sorted(executor.submitted) == [0, 1, 1, 1, 2]
+    assert stats["retries"] == 2
+    assert len(stats["errors"]) == 2
+    assert report == analyze_api_logs(logs, sections=["summary", "endpoint_stats"])
+
+
+def test_shard_fails_after_retries(job):
+    _, paths = job
+    tasks = mapreduce.plan_file_shards(paths, 2)
+    with pytest.raises(RuntimeError, match="Shard 0 failed after 2 attempts"):
+        mapreduce.run_job(tasks, FlakyExecutor({0: 5}), max_retries=1)
+
+
+def test_reduce_ignores_completion_order_and_duplicates(job):
+    _, paths = job
+    tasks = mapreduce.plan_file_shards(paths, 3)
+    partials = [mapreduce.run_shard(task.to_dict()) for task in tasks]
+    forward = mapreduce.reduce_partials(partials)
+    backward = mapreduce.reduce_partials(partials[::-1])
+    assert list(forward.rollups.rows(("endpoint",))) == list(backward.rollups.rows(("endpoint",)))
+
+
+def test_task_payload_round_trip():
+    task = mapreduce.ShardTask(3, ["a.json"], "2025-01-15T00:00:00Z", None, ["summary"])
+    restored = mapreduce.ShardTask.from_dict(json.loads(json.dumps(task.to_dict())))
+    assert restored.to_dict() == task.to_dict()
+
+    with pytest.raises(ValueError):
+        mapreduce.run_job([task, task])
+    with pytest.raises(ValueError):
+        mapreduce.plan_time_shards(["a.json"], None, "2025-01-15T00:00:00Z")
+
+
+def test_local_executor(job):
+    logs, paths = job
+    with mapreduce.LocalExecutor(max_workers=2) as executor:
+        report = mapreduce.run_job(mapreduce.plan_file_shards(paths, 2), executor)
+    assert report["summary"] == analyze_api_logs(logs)["summary"]
@@ -0,0 +1,142 @@
+"""
+Tests for the analyzer's self-observability metrics
+Run: pytest test_metrics.py -v
+"""
+import json
+import os
+import sys
+import urllib.request
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cli
+import config
+import metrics
+from aggregator import LogAggregator
+
+
+def _make_logs(count):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i)).isoformat() + "Z",
+            "endpoint": ["/api/users", "/api/products"][i % 2],
+            "method": "GET",
+            "response_time_ms": 100 + i % 400,
+            "status_code": 200,
+            "user_id": f"user_{i % 40:03d}",
+            "request_size_bytes": 100,
+            "response_size_bytes": 500
+        }
+        for i in range(count)
+    ]
+
+
+def test_prometheus_text_format():
+    registry = metrics.MetricsRegistry(prefix="t_")
+    registry.counter("requests_total", "Requests", route='/a"b').inc(3)
+    registry.gauge("temperature", "Degrees").set(21.5)
+    histogram = registry.histogram("latency_seconds", "Latency", bounds=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 7):
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE t_requests_total counter" in lines
+    assert 't_requests_total{route="/a\\"b"} 3' in lines
+    assert "t_temperature 21.5" in lines
+    # Buckets are cumulative and inclusive of their upper bound
+    assert 't_latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 't_latency_seconds_bucket{le="1"} 3' in lines
+    assert 't_latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "t_latency_seconds_count 4" in lines
+
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total")
+
+
+def test_watch_aggregator_reads_state_on_scrape():
+    registry = metrics.MetricsRegistry()
+    state = LogAggregator()
+    metrics.watch_aggregator(registry, state)
+    state.add_many(_make_logs(300) + [{"timestamp": "bad"}])
+
+    snapshot = registry.snapshot()
+    prefix = config.METRICS["prefix"]
+    assert snapshot[prefix + "records_seen_total"] == 301
+    assert snapshot[prefix + "records_rejected_total"] == 1
+    assert snapshot[prefix + "reject_ratio"] == pytest.approx(1 / 301)
+    assert snapshot[prefix + "state_bytes"] > 0
+    ratios = {row["labels"]["dimension"]: row["value"] for row in snapshot[prefix + "encoder_hit_ratio"]}
+    # 40 distinct users in 300 lookups
+    assert ratios["user_id"] == round(1 - 40 / 300, 4)
+
+
+def test_window_rejects_and_encoder_counts_survive_spills(monkeypatch):
+    monkeypatch.setitem(config.SPILL, "check_every", 10)
+    logs = _make_logs(300)
+    registry = metrics.MetricsRegistry()
+    state = LogAggregator(starttime=logs[0]["timestamp"], max_groups=5)
+    metrics.watch_aggregator(registry, state)
+    state.add_many([dict(logs[0], timestamp="2000-01-01T00:00:00Z")] + logs)
+
+    snapshot = registry.snapshot()
+    prefix = config.METRICS["prefix"]
+    assert snapshot[prefix + "records_outside_window_total"] == 1
+    assert snapshot[prefix + "records_rejected_total"] == 0
+    assert state.rollups.spill_stats()["spills"] > 0
+    lookups = {row["labels"]["dimension"]: row["value"] for row in snapshot[prefix + "encoder_lookups_total"]}
+    misses = {row["labels"]["dimension"]: row["value"] for row in snapshot[prefix + "encoder_misses_total"]}
+    assert lookups["user_id"] == 300
+    # Each spill forgets the codes, so users come back as misses
+    assert misses["user_id"] > 40
+    ratios = {row["labels"]["dimension"]: row["value"] for row in snapshot[prefix + "encoder_hit_ratio"]}
+    assert ratios["user_id"] == round(1 - misses["user_id"] / 300, 4)
+
+
+def test_parallel_run_is_watched_while_workers_run(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"part{i}.json"
+        path.write_text(json.dumps(_make_logs(200)))
+        paths.append(str(path))
+    registry = metrics.MetricsRegistry()
+    cli.run_batch(paths, workers=2, registry=registry)
+
+    snapshot = registry.snapshot()
+    prefix = config.METRICS["prefix"]
+    assert snapshot[prefix + "shards_total"] == 3
+    assert snapshot[prefix + "shards_merged_total"] == 3
+    assert snapshot[prefix + "records_seen_total"] == 600
+
+
+def test_run_records_pipeline_stage_latency(tmp_path):
+    path = tmp_path / "logs.json"
+    path.write_text(json.dumps(_make_logs(2000)))
+    registry = metrics.MetricsRegistry()
+    _, run_stats = cli.run_batch([str(path)], pipeline_mode="thread", registry=registry)
+
+    snapshot = registry.snapshot()
+    prefix = config.METRICS["prefix"]
+    assert snapshot[prefix + "records_read_total"] == 2000
+    assert snapshot[prefix + "records_seen_total"] == 2000
+    stages = {row["labels"]["stage"]: row["value"] for row in snapshot[prefix + "stage_batch_seconds"]}
+    assert set(stages) == {"read", "decode", "validate", "aggregate"}
+    assert stages["aggregate"]["count"] == run_stats["pipeline"]["stages"]["aggregate"]["batches"]
+
+
+def test_http_endpoint():
+    registry = metrics.MetricsRegistry()
+    registry.counter("pings_total").inc()
+    server = metrics.serve(registry, port=0)
+    try:
+        host, port = server.server_address[:2]
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert f"{config.METRICS['prefix']}pings_total 1" in response.read().decode()
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics.json") as response:
+            assert json.loads(response.read()) == registry.snapshot()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,122 @@
+"""
+Tests for the online latency moments and size regressions
+Run: pytest test_moments.py -v
+"""
+import math
+import os
+import random
+import statistics
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from advanced_features.moments import Moments
+from aggregator import LogAggregator
+from main import analyze_api_logs
+from storage import SQLiteLogStore
+
+
+def _points(count, seed=0, offset=0.0):
+    rng = random.Random(seed)
+    points = []
+    for _ in range(count):
+        request_size = rng.randint(100, 5000)
+        response_size = rng.randint(200, 200000)
+        # Latency grows with the response size, not with the request size
+        points.append((offset + 40 + response_size / 1000 + rng.gauss(0, 5), request_size, response_size))
+    return points
+
+
+def _check(moments, points):
+    times = [p[0] for p in points]
+    sizes = [p[2] for p in points]
+    assert moments.n == len(points)
+    assert moments.mean_t == pytest.approx(statistics.fmean(times))
+    assert moments.variance() == pytest.approx(statistics.variance(times))
+    fit = moments.regression("response")
+    assert fit["covariance"] == pytest.approx(statistics.covariance(sizes, times))
+    assert fit["correlation"] == pytest.approx(statistics.correlation(sizes, times))
+    slope, intercept = statistics.linear_regression(sizes, times)
+    assert fit["slope"] == pytest.approx(slope) and fit["intercept"] == pytest.approx(intercept)
+
+
+def test_matches_two_pass_statistics():
+    points = _points(5000)
+    moments = Moments()
+    for point in points:
+        moments.add(*point)
+    _check(moments, points)
+    assert moments.regression("response")["correlation"] > 0.9
+    assert abs(moments.regression("request")["correlation"]) < 0.1
+
+
+def test_merge_equals_single_pass():
+    points = _points(6000, seed=1)
+    merged = Moments()
+    for shard in (points[:1], points[1:2500], [], points[2500:]):
+        part = Moments()
+        for point in shard:
+            part.add(*point)
+        merged.merge(part)
+    _check(merged, points)
+
+
+def test_large_offset_keeps_precision():
+    # Sum-of-squares arithmetic loses every digit of the variance here
+    points = _points(2000, seed=2, offset=1e9)
+    moments = Moments()
+    for point in points:
+        moments.add(*point)
+    assert moments.variance() == pytest.approx(statistics.variance([p[0] for p in points]), rel=1e-6)
+
+
+def test_degenerate_inputs():
+    moments = Moments()
+    assert moments.variance() == 0.0
+    moments.add(100, 500, 800)
+    moments.add(100, 500, 900)
+    fit = moments.regression("request")
+    assert fit["slope"] is None and fit["correlation"] is None
+    fit = moments.regression("response")
+    assert fit["slope"] == 0.0 and fit["correlation"] is None
+
+
+def _logs(count):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i)).isoformat() + "Z",
+            "endpoint": "/api/users" if i % 3 else "/api/rare" if i < 15 else "/api/orders",
+            "method": "GET",
+            "response_time_ms": round(t, 1),
+            "status_code": 200,
+            "user_id": f"user_{i % 7}",
+            "request_size_bytes": q,
+            "response_size_bytes": p
+        }
+        for i, (t, q, p) in enumerate(_points(count, seed=3))
+    ]
+
+
+def test_report_section_and_storage():
+    logs = _logs(1200)
+    report = analyze_api_logs(logs, sections=["latency_moments"])["latency_moments"]
+    users = report["by_endpoint"][0]
+    times = [log["response_time_ms"] for log in logs if log["endpoint"] == "/api/users"]
+    assert users["endpoint"] == "/api/users" and users["request_count"] == len(times)
+    assert users["stddev_ms"] == round(statistics.stdev(times), 2)
+    assert users["vs_response_size"]["slope_ms_per_kb"] == pytest.approx(1.024, rel=0.05)
+    # Too few requests for a regression
+    rare = next(e for e in report["by_endpoint"] if e["endpoint"] == "/api/rare")
+    assert "vs_request_size" not in rare and math.isfinite(rare["variance_ms2"])
+
+    halves = LogAggregator(sections=["latency_moments"]).add_many(logs[:600])
+    halves.merge(LogAggregator(sections=["latency_moments"]).add_many(logs[600:]))
+    merged = halves.moments.by_endpoint["/api/users"]
+    assert merged.variance() == pytest.approx(statistics.variance(times))
+
+    with SQLiteLogStore() as store:
+        store.ingest(logs)
+        assert store.report(sections=["latency_moments"]) == analyze_api_logs(logs, sections=["latency_moments"])
@@ -0,0 +1,104 @@
+"""
+Tests for the staged batch pipeline
+Run: pytest test_pipeline.py -v
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cli
+import pipeline
+
+
+def _make_logs(count):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    endpoints = ["/api/users", "/api/products", "/api/payments"]
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * 5)).isoformat() + "Z",
+            "endpoint": endpoints[i % 3],
+            "method": "GET" if i % 3 else "POST",
+            "response_time_ms": 20 + (i * 61) % 1500,
+            "status_code": 503 if i % 23 == 0 else 200,
+            "user_id": f"user_{i % 7:03d}",
+            "request_size_bytes": 128,
+            "response_size_bytes": (i * 211) % 30000
+        }
+        for i in range(count)
+    ]
+
+
+def _write_inputs(tmp_path, logs):
+    with open(tmp_path / "a.jsonl", "w") as f:
+        for log in logs[:400]:
+            f.write(json.dumps(log) + "\n")
+        f.write("{broken\n")
+    bad = dict(logs[0], status_code=999)
+    with open(tmp_path / "b.json", "w") as f:
+        json.dump(logs[400:] + [bad], f)
+    return [str(tmp_path / "a.jsonl"), str(tmp_path / "b.json")]
+
+
+@pytest.mark.parametrize("mode", pipeline.MODES)
+def test_pipeline_report_matches_sequential(tmp_path, mode):
+    paths = _write_inputs(tmp_path, _make_logs(700))
+
+    sequential, seq_stats = cli.run_batch(paths)
+    pipelined, run_stats = cli.run_batch(paths, pipeline_mode=mode)
+
+    assert pipelined == sequential
+    for key in ("records_read", "records_accepted", "records_rejected", "decode_errors", "input_bytes"):
+        assert run_stats[key] == seq_stats[key]
+    assert run_stats["decode_errors"] == 1
+    assert run_stats["records_rejected"] == 1
+    stages = run_stats["pipeline"]["stages"]
+    assert list(stages) == ["read", "decode", "validate", "aggregate"]
+    assert stages["aggregate"]["items_in"] == 700
+
+
+def _explode(batch):
+    if any(item == 13 for item in batch):
+        raise ValueError("bad item")
+    return batch
+
+
+@pytest.mark.parametrize("mode", pipeline.MODES)
+def test_stage_failure_stops_pipeline_and_propagates(mode):
+    received = []
+    source = ([i, i + 1] for i in range(0, 10000, 2))
+    runner = pipeline.Pipeline([("explode", _explode)], mode=mode, queue_size=1)
+
+    with pytest.raises(RuntimeError, match="explode.*bad item"):
+        runner.run(source, received.extend)
+    # Backpressure: the source was not drained past the failure
+    assert next(source, None) is not None
+    assert 13 not in received
+
+
+def test_bounded_queues_apply_backpressure():
+    produced = []
+
+    def source():
+        for i in range(20):
+            produced.append(i)
+            yield [i]
+
+    def slow_sink(batch):
+        time.sleep(0.01)
+        # Never more than the queues plus one batch in each stage ahead of the sink
+        assert len(produced) - batch[0] <= 2 * 2 + 3
+
+    stats = pipeline.Pipeline([("noop", list)], queue_size=2).run(source(), slow_sink)
+
+    assert stats["bottleneck"] == "aggregate"
+    assert stats["stages"]["aggregate"]["batches"] == 20
+
+
+def test_invalid_mode_rejected():
+    with pytest.raises(ValueError):
+        pipeline.Pipeline([], mode="fiber")
@@ -0,0 +1,174 @@
+"""
+Tests for per-user rate-limit violation detection
+Run: pytest test_rate_limiting.py -v
+"""
+import json
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import analyze_api_logs
+from advanced_features.rate_limiting import CountMinSketch, RateLimitDetector
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data")
+
+SETTINGS = {
+    "window_seconds": 60,
+    "max_requests": 10,
+    "slots_per_window": 6,
+    "prefilter_fraction": 0.0,
+    "max_tracked_users": 100,
+    "sketch_width": 64,
+    "sketch_depth": 3
+}
+
+
+def test_burst_over_limit_reported():
+    detector = RateLimitDetector(SETTINGS)
+    for i in range(15):
+        detector.add("user_abuser", 1000.0 + i)
+    for i in range(5):
+        detector.add("user_normal", 1000.0 + i * 10)
+
+    violations = detector.finalize()
+
+    assert len(violations) == 1
+    violation = violations[0]
+    assert violation["user_id"] == "user_abuser"
+    assert violation["peak_requests"] == 15
+    assert violation["peak_rate_per_second"] == 0.25
+    assert violation["limit"] == 10
+
+
+def test_steady_rate_under_limit_not_reported():
+    detector = RateLimitDetector(SETTINGS)
+    # 10 per minute for an hour, never more than 10 in any 60s window
+    for i in range(600):
+        detector.add("user_steady", 1000.0 + i * 6.5)
+
+    assert detector.finalize() == []
+
+
+def test_idle_users_evicted():
+    detector = RateLimitDetector(SETTINGS)
+    for i in range(50):
+        detector.add(f"user_{i}", 1000.0 + i * 120)
+
+    assert len(detector._tracked) == 1
+
+
+def test_prefilter_skips_light_users():
+    settings = dict(SETTINGS, prefilter_fraction=0.5, sketch_width=4096)
+    detector = RateLimitDetector(settings)
+    for i in range(1000):
+        detector.add(f"user_{i}", 1000.0 + i * 0.01)
+    for i in range(20):
+        detector.add("user_heavy", 1010.0 + i)
+
+    assert list(detector._tracked) == ["user_heavy"]
+    assert detector.finalize()[0]["user_id"] == "user_heavy"
+
+
+def test_promoted_user_keeps_earlier_requests():
+    settings = dict(SETTINGS, prefilter_fraction=0.5, sketch_width=4096)
+    detector = RateLimitDetector(settings)
+    # Promoted at the 5th request; the first four still count toward the window
+    for i in range(11):
+        detector.add("user_edge", 1000.0 + i * 3)
+    for i in range(200):
+        detector.add(f"user_{i}", 1000.0 + i * 0.1)
+
+    violations = detector.finalize()
+    assert [v["user_id"] for v in violations] == ["user_edge"]
+    assert violations[0]["peak_requests"] == 11
+    assert violations[0]["window_start"] == "1970-01-01T00:16:40Z"
+
+
+def test_sketch_forgets_slots_that_slide_out():
+    detector = RateLimitDetector(dict(SETTINGS, prefilter_fraction=0.5))
+    for minute in range(5):
+        for i in range(4):
+            detector.add("user_regular", 1000.0 + minute * 120 + i)
+    # Four requests every two minutes never reach the promotion estimate of 5
+    assert not detector._tracked
+    assert len(detector._slots) <= SETTINGS["slots_per_window"]
+
+
+def _detector(requests):
+    detector = RateLimitDetector(SETTINGS)
+    for user_id, ts in requests:
+        detector.add(user_id, ts)
+    return detector
+
+
+def test_merged_shards_match_single_pass():
+    requests = [("user_steady", 1000.0 + i * 7) for i in range(60)]
+    # Bursts straddling the cut at 1200s and well inside each shard
+    requests += [("user_boundary", 1185.0 + i * 2) for i in range(14)]
+    requests += [("user_early", 1050.0 + i) for i in range(12)]
+    requests += [("user_late", 1300.0 + i) for i in range(13)]
+    requests.sort(key=lambda request: request[1])
+    cut = next(i for i, (_, ts) in enumerate(requests) if ts >= 1200)
+
+    expected = _detector(requests).finalize()
+    # Merge order must not matter
+    merged = _detector(requests[cut:]).merge(_detector(requests[:cut])).finalize()
+
+    assert sorted(v["user_id"] for v in expected) == ["user_boundary", "user_early", "user_late"]
+    assert merged == expected
+
+
+def test_merged_episodes_match_single_pass():
+    # Episodes that end and start again right after the cut are where replaying slot totals would go wrong
+    rng = random.Random(3)
+    for _ in range(100):
+        users = [f"user_{i}" for i in range(rng.randint(1, 6))]
+        requests = [(rng.choice(users), ts) for ts in sorted(rng.uniform(0, 300) for _ in range(rng.randint(50, 300)))]
+        cut = rng.randrange(1, len(requests))
+        expected = _detector(requests).finalize()
+        for first, second in ((requests[:cut], requests[cut:]), (requests[cut:], requests[:cut])):
+            merged = _detector(first).merge(_detector(second)).finalize()
+            assert sorted(merged, key=lambda v: (v["user_id"], v["window_start"])) == \
+                sorted(expected, key=lambda v: (v["user_id"], v["window_start"]))
+
+
+def test_replay_state_is_capped():
+    detector = RateLimitDetector(dict(SETTINGS, max_tracked_users=5))
+    for i in range(50):
+        detector.add(f"user_{i}", 1000.0 + i)
+
+    assert len(detector._head_users) == 5
+    assert sum(len(users) for users in detector._head.values()) == 5
+
+
+def test_finalize_leaves_detector_running():
+    detector = _detector([("user_abuser", 1000.0 + i) for i in range(12)])
+    assert detector.finalize()[0]["peak_requests"] == 12
+
+    detector.add("user_abuser", 1012.0)
+    assert detector.finalize()[0]["peak_requests"] == 13
+
+
+def test_count_min_sketch_never_undercounts():
+    sketch = CountMinSketch(16, 3)
+    for i in range(200):
+        sketch.add(f"user_{i % 40}")
+
+    assert all(sketch.estimate(f"user_{i}") >= 5 for i in range(40))
+
+
+def test_dataset_abuser_detected():
+    file_path = os.path.join(DATA_DIR, "sample_medium.json")
+    if not os.path.exists(file_path):
+        pytest.skip(f"Sample dataset not found: {file_path}")
+
+    with open(file_path, "r") as f:
+        logs = json.load(f)
+
+    violations = analyze_api_logs(logs, sections=["rate_limit_violations"])["rate_limit_violations"]
+
+    assert [v["user_id"] for v in violations] == ["user_002"]
+    assert violations[0]["window_start"].startswith("2025-01-15T10:45")
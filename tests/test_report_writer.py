@@ -0,0 +1,89 @@
+"""
+Tests for the streaming report serializer
+Run: pytest test_report_writer.py -v
+"""
+import io
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+import report_writer
+from aggregator import LogAggregator
+
+
+def _make_logs(count):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * 5)).isoformat() + "Z",
+            "endpoint": f"/api/items/{i % 40}",
+            "method": "GET" if i % 4 else "POST",
+            "response_time_ms": 30 + (i * 53) % 1500 + (0.25 if i % 3 else 0),
+            "status_code": 503 if i % 23 == 0 else 200,
+            "user_id": f"usér_{i % 70:03d}",
+            "request_size_bytes": 128,
+            "response_size_bytes": (i * 211) % 20000
+        }
+        for i in range(count)
+    ]
+
+
+class _CountingStream(io.StringIO):
+
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+@pytest.mark.parametrize("sections", [None, ["summary", "cost_analysis"]])
+def test_json_matches_json_dump(sections):
+    state = LogAggregator().add_many(_make_logs(3000))
+    out = _CountingStream()
+    report_writer.write_report(state, out, sections=sections)
+
+    expected = json.dumps(main._build_report(state, sections), indent=2) + "\n"
+    assert out.getvalue() == expected
+    # Written section by section, not as one string at the end
+    assert out.writes > 2
+
+
+def test_ndjson_one_line_per_section():
+    state = LogAggregator().add_many(_make_logs(500))
+    out = io.StringIO()
+    report_writer.write_report(state, out, "ndjson")
+
+    lines = out.getvalue().splitlines()
+    report = main._build_report(state)
+    assert [json.loads(line)["section"] for line in lines] == list(report)
+    assert json.loads(lines[0])["data"] == report["summary"]
+
+
+def test_empty_and_unusual_values():
+    out = io.StringIO()
+    report_writer.write_report(LogAggregator(), out)
+    assert json.loads(out.getvalue()) == main._build_report(LogAggregator())
+
+    data = {
+        "floats": [0.1, -0.0, 1e21, 2.5e-7, float("nan"), float("inf")],
+        "text": "line\nbreak ☃ \"quoted\"",
+        "keys": {1: "a", 2.5: "b", None: "c", True: "d"},
+        "empty": [{}, [], ()],
+        "flags": [True, False, None]
+    }
+    out = io.StringIO()
+    report_writer.write_sections(data.items(), out)
+    assert out.getvalue() == json.dumps(data, indent=2) + "\n"
+
+    with pytest.raises(TypeError):
+        report_writer.write_sections([("bad", object())], io.StringIO())
+    with pytest.raises(ValueError):
+        report_writer.write_sections([], io.StringIO(), "xml")
@@ -0,0 +1,117 @@
+"""
+Tests for the multi-dimensional rollup engine
+Run: pytest test_rollups.py -v
+"""
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aggregator import LogAggregator
+from rollups import RollupEngine
+
+# Opt-in rollup the slice queries below are answered from
+SLICES = [["endpoint", "method", "status_class", "time_bucket"]]
+
+
+def _make_logs(count):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    endpoints = ["/api/users", "/api/products", "/api/payments"]
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * 13)).isoformat() + "Z",
+            "endpoint": endpoints[i % 3],
+            "method": "GET" if i % 5 else "POST",
+            "response_time_ms": 40 + (i * 53) % 700,
+            "status_code": [200, 200, 201, 404, 500][i % 5] if i % 7 == 0 else 200,
+            "user_id": f"user_{i % 17:03d}",
+            "request_size_bytes": 300,
+            "response_size_bytes": 2048
+        }
+        for i in range(count)
+    ]
+
+
+def test_error_rate_per_method_endpoint_and_bucket():
+    logs = _make_logs(500)
+    state = LogAggregator(dimension_sets=SLICES).add_many(logs)
+
+    rows = state.query(["endpoint", "method", "time_bucket"])
+
+    expected = defaultdict(lambda: [0, 0])
+    for log in logs:
+        ts = datetime.fromisoformat(log["timestamp"][:-1])
+        bucket = ts.replace(minute=ts.minute - ts.minute % 5, second=0).isoformat() + "Z"
+        key = (log["endpoint"], log["method"], bucket)
+        expected[key][0] += 1
+        expected[key][1] += log["status_code"] >= 400
+
+    assert len(rows) == len(expected)
+    for row in rows:
+        total, errors = expected[(row["endpoint"], row["method"], row["time_bucket"])]
+        assert row["request_count"] == total
+        assert row["error_count"] == errors
+        assert row["error_rate_percentage"] == round(errors * 100 / total, 1)
+
+
+def test_query_filters_and_projection():
+    logs = _make_logs(300)
+    state = LogAggregator(dimension_sets=SLICES).add_many(logs)
+
+    rows = state.query(["status_class"], where={"endpoint": ["/api/users", "/api/payments"], "method": "GET"})
+    selected = [l for l in logs if l["endpoint"] in ("/api/users", "/api/payments") and l["method"] == "GET"]
+
+    by_class = {row["status_class"]: row for row in rows}
+    assert sum(row["request_count"] for row in rows) == len(selected)
+    assert by_class["2xx"]["max_response_time_ms"] == max(
+        l["response_time_ms"] for l in selected if l["status_code"] < 300
+    )
+
+
+def test_uncovered_query_raises():
+    state = LogAggregator().add_many(_make_logs(10))
+
+    with pytest.raises(ValueError):
+        state.query(["user_id", "method"])
+
+
+def test_extra_rollups_are_opt_in():
+    state = LogAggregator().add_many(_make_logs(10))
+    assert set(state.rollups.rollups) == {(), ("endpoint",), ("hour",), ("user_id",)}
+
+    with pytest.raises(ValueError):
+        state.query(["endpoint", "time_bucket"])
+
+
+def test_unknown_dimension_rejected():
+    with pytest.raises(ValueError):
+        RollupEngine(extra_dimension_sets=[["endpoint", "region"]])
+
+
+def test_merged_shards_match_single_scan():
+    logs = _make_logs(400)
+    single = LogAggregator(dimension_sets=SLICES).add_many(logs)
+    left = LogAggregator(dimension_sets=SLICES).add_many(logs[:150])
+    right = LogAggregator(dimension_sets=SLICES).add_many(logs[150:])
+    # Shards see dimension values in a different order, so codes differ
+    merged = right.merge(left)
+
+    query = ["endpoint", "status_class"]
+    key = lambda row: (row["endpoint"], row["status_class"])
+    assert sorted(merged.query(query), key=key) == sorted(single.query(query), key=key)
+    assert merged.rollups.totals()["request_count"] == 400
+
+
+def test_byte_columns_only_for_the_bandwidth_section():
+    logs = _make_logs(200)
+    plain = LogAggregator().add_many(logs).rollups
+    assert not any(rollup.payload_bytes for rollup in plain.rollups.values())
+    assert "request_bytes" not in plain.totals()
+
+    engine = LogAggregator(sections=["bandwidth"]).add_many(logs).rollups
+    keeping = {dimensions for dimensions, rollup in engine.rollups.items() if rollup.payload_bytes}
+    assert ("hour",) not in keeping and {(), ("endpoint",), ("user_id",)} <= keeping
+    assert engine.totals()["response_bytes"] == 200 * 2048
@@ -0,0 +1,98 @@
+"""
+Tests for sampled approximate reports
+Run: pytest test_sampling.py -v
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import analyze_api_logs, analyze_sampled
+
+
+def _make_logs(count, rare_every=None):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    endpoints = ["/api/users", "/api/products", "/api/payments"]
+    logs = []
+    for i in range(count):
+        endpoint = endpoints[i % 3]
+        if rare_every and i % rare_every == 0:
+            endpoint = "/api/admin"
+        logs.append({
+            "timestamp": (base + timedelta(seconds=i * 2)).isoformat() + "Z",
+            "endpoint": endpoint,
+            "method": "GET" if i % 5 else "POST",
+            "response_time_ms": 50 + (i * 37) % 900,
+            "status_code": 500 if (i * 13) % 29 == 0 else 200,
+            "user_id": f"user_{i % 50:03d}",
+            "request_size_bytes": 300,
+            "response_size_bytes": (i * 97) % 15000
+        })
+    return logs
+
+
+def test_intervals_cover_exact_values():
+    logs = _make_logs(20000)
+    exact = analyze_api_logs(logs)
+    sampled = analyze_sampled(logs, sample_rate=0.1, seed=3)
+
+    summary = sampled["summary"]["confidence_intervals"]
+    low, high = summary["avg_response_time_ms"]
+    assert low <= exact["summary"]["avg_response_time_ms"] <= high
+    low, high = summary["error_rate_percentage"]
+    assert low <= exact["summary"]["error_rate_percentage"] <= high
+
+    low, high = sampled["cost_analysis"]["confidence_intervals"]["total_cost_usd"]
+    assert low <= exact["cost_analysis"]["total_cost_usd"] <= high
+
+    # Each endpoint rounds its share up
+    assert 2000 <= sampled["sampling"]["sampled_records"] <= 2003
+    assert not sampled["sampling"]["stopped_early"]
+
+
+def test_full_sample_is_exact():
+    logs = _make_logs(900)
+    exact = analyze_api_logs(logs, sections=["summary", "endpoint_stats"])
+    sampled = analyze_sampled(logs, sample_rate=1.0, method="uniform", sections=["summary", "endpoint_stats"])
+
+    intervals = sampled["summary"].pop("confidence_intervals")
+    assert sampled["summary"] == exact["summary"]
+    assert intervals["avg_response_time_ms"] == [exact["summary"]["avg_response_time_ms"]] * 2
+
+    by_endpoint = {stats["endpoint"]: stats for stats in exact["endpoint_stats"]}
+    for stats in sampled["endpoint_stats"]:
+        stats.pop("confidence_intervals")
+        assert stats == by_endpoint[stats["endpoint"]]
+
+
+def test_stratified_keeps_rare_endpoints():
+    logs = _make_logs(20000, rare_every=1000)
+    sampled = analyze_sampled(logs, sample_rate=0.01, seed=1)
+
+    rare = next(s for s in sampled["endpoint_stats"] if s["endpoint"] == "/api/admin")
+    # Fewer records than min_per_stratum, so every one of them is kept
+    assert rare["request_count"] == 20
+    assert rare["confidence_intervals"]["request_count"] == [20, 20]
+
+
+def test_stops_early_at_target_precision():
+    logs = _make_logs(20000)
+    sampled = analyze_sampled(logs, sample_rate=0.5, seed=2, target_relative_error=0.1)
+
+    assert sampled["sampling"]["stopped_early"]
+    assert sampled["sampling"]["sampled_records"] < sampled["sampling"]["planned_records"]
+    low, high = sampled["summary"]["confidence_intervals"]["avg_response_time_ms"]
+    assert (high - low) / 2 <= 0.1 * sampled["summary"]["avg_response_time_ms"] + 0.1
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"sections": ["summary", "anomalies"]},
+    {"sample_rate": 0},
+    {"method": "systematic"},
+    {"confidence": 1.5}
+])
+def test_invalid_arguments_rejected(kwargs):
+    with pytest.raises(ValueError):
+        analyze_sampled(_make_logs(10), **kwargs)
@@ -0,0 +1,151 @@
+"""
+Tests for streaming user sessionization
+Run: pytest test_sessions.py -v
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from advanced_features.sessions import SessionTracker
+from aggregator import LogAggregator
+from main import analyze_api_logs, _build_report
+from storage import SQLiteLogStore
+
+GAP = 600
+
+
+def _events(count, users=40, seed=0):
+    rng = random.Random(seed)
+    t = 0.0
+    events = []
+    for _ in range(count):
+        # Mostly short pauses, sometimes long enough to end sessions
+        t += rng.choice([1, 2, 5, 30, 90]) if rng.random() < 0.98 else rng.uniform(GAP, 3 * GAP)
+        events.append((f"user_{rng.randrange(users):03d}", rng.choice(["/a", "/b", "/c", "/d"]), t))
+    return events
+
+
+def _reference(events, gap):
+    """Sessions by brute force: per user, split the time-sorted requests at gaps over the limit."""
+    by_user = {}
+    for user_id, endpoint, t in events:
+        by_user.setdefault(user_id, []).append((t, endpoint))
+    sessions = []
+    for requests in by_user.values():
+        current = [requests[0]]
+        for request in requests[1:]:
+            if request[0] - current[-1][0] > gap:
+                sessions.append(current)
+                current = []
+            current.append(request)
+        sessions.append(current)
+    return sorted((s[-1][0] - s[0][0], len(s), len({e for _, e in s})) for s in sessions)
+
+
+def _closed(tracker):
+    done = tracker.snapshot()
+    return done.closed, done.duration_sum, done.requests_sum, done.endpoints_sum
+
+
+def _sums(reference):
+    return len(reference), sum(r[0] for r in reference), sum(r[1] for r in reference), sum(r[2] for r in reference)
+
+
+def test_matches_brute_force_and_holds_only_open_sessions():
+    events = _events(5000)
+    tracker = SessionTracker(GAP, 0)
+    peak = 0
+    for event in events:
+        tracker.add(*event)
+        peak = max(peak, len(tracker.open))
+        # Nothing idle for longer than the gap stays open
+        assert all(event[2] - s.last <= GAP for s in tracker.open.values())
+    assert _closed(tracker) == pytest.approx(_sums(_reference(events, GAP)))
+    assert tracker.evicted == 0 and peak <= 40
+
+
+def test_open_table_is_bounded():
+    events = _events(3000, users=500, seed=1)
+    tracker = SessionTracker(10 * GAP, 50)
+    for event in events:
+        tracker.add(*event)
+        assert len(tracker.open) <= 50
+    assert tracker.evicted > 0
+    done = tracker.snapshot()
+    assert done.requests_sum == 3000
+    # Evictions can only split sessions
+    assert done.closed >= len(_reference(events, 10 * GAP))
+
+
+def test_leading_sessions_share_the_cap():
+    # Every user's only session starts near the first record and is held back for a merge
+    tracker = SessionTracker(GAP, 100)
+    for i in range(5000):
+        tracker.add(f"user_{i}", "/api/a", 1000.0 + i * 0.01)
+        assert len(tracker.open) + len(tracker.leading) <= 100
+    assert tracker.snapshot().closed == 5000
+
+
+def test_merge_joins_sessions_across_time_shards():
+    events = _events(6000, seed=2)
+    whole = SessionTracker(GAP, 0)
+    for event in events:
+        whole.add(*event)
+
+    merged = SessionTracker(GAP, 0)
+    for shard in (events[:2000], events[2000:4100], events[4100:]):
+        part = SessionTracker(GAP, 0)
+        for event in shard:
+            part.add(*event)
+        merged.merge(part)
+    assert _closed(merged) == pytest.approx(_closed(whole))
+    assert set(merged.open) == set(whole.open)
+
+    with pytest.raises(ValueError):
+        merged.merge(SessionTracker(GAP + 1, 0))
+
+
+def _logs(count):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=t)).isoformat() + "Z",
+            "endpoint": endpoint,
+            "method": "GET",
+            "response_time_ms": 120,
+            "status_code": 200,
+            "user_id": user_id,
+            "request_size_bytes": 100,
+            "response_size_bytes": 800
+        }
+        for user_id, endpoint, t in _events(count, seed=3)
+    ]
+
+
+def test_report_section():
+    logs = _logs(3000)
+    report = analyze_api_logs(logs, sections=["sessions"])["sessions"]
+    reference = _reference(_events(3000, seed=3), 1800)
+    assert report["session_count"] == len(reference)
+    assert report["requests_per_session"]["avg"] == round(3000 / len(reference), 2)
+    assert report["duration_seconds"]["max"] == pytest.approx(max(r[0] for r in reference))
+    assert report["endpoints_per_session"]["max"] == max(r[2] for r in reference)
+    assert report["evicted_sessions"] == 0
+
+    # Reporting does not close the sessions that are still open
+    state = LogAggregator(sections=["sessions"])
+    state.add_many(logs)
+    before = len(state.sessions.open)
+    _build_report(state, ["sessions"])
+    assert len(state.sessions.open) == before > 0
+
+
+def test_storage_replays_sessions():
+    logs = _logs(1500)
+    with SQLiteLogStore() as store:
+        store.ingest(logs)
+        assert store.report(sections=["sessions"]) == analyze_api_logs(logs, sections=["sessions"])
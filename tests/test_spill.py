@@ -0,0 +1,115 @@
+"""
+Tests for spilling rollup groups to disk under a memory budget
+Run: pytest test_spill.py -v
+"""
+import os
+import pickle
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+import main
+from aggregator import LogAggregator
+from rollups import RollupEngine
+
+
+def _make_logs(count, users=400):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    endpoints = ["/api/users", "/api/products", "/api/payments", "/api/orders"]
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * 7)).isoformat() + "Z",
+            "endpoint": endpoints[(i * 3) % 4],
+            "method": "GET" if i % 5 else "POST",
+            "response_time_ms": 50 + (i * 37) % 900,
+            "status_code": 500 if i % 11 == 0 else 200,
+            "user_id": f"user_{(i * 7919) % users:04d}",
+            "request_size_bytes": 100,
+            "response_size_bytes": 500 + i % 3000
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def check_often(monkeypatch):
+    monkeypatch.setitem(config.SPILL, "check_every", 16)
+
+
+def test_spilled_report_equals_in_memory_report(check_often):
+    logs = _make_logs(4000)
+    expected = main._build_report(LogAggregator().add_many(logs), None)
+
+    state = LogAggregator(max_groups=50).add_many(logs)
+    stats = state.rollups.spill_stats()
+    assert stats["spills"] > 0
+    assert stats["spilled_groups"] > 0
+    assert stats["spill_bytes"] > 0
+    assert state.rollups.group_count() <= 50 + config.SPILL["check_every"] * len(state.rollups.rollups)
+
+    assert main._build_report(state, None) == expected
+
+
+def test_top_streams_partitions(check_often):
+    logs = _make_logs(3000)
+    engine = LogAggregator(max_groups=40).add_many(logs).rollups
+    expected = sorted(
+        LogAggregator().add_many(logs).rollups.rows(("user_id",)),
+        key=lambda row: row[1]["request_count"],
+        reverse=True
+    )[:7]
+
+    assert engine.top(("user_id",), 7) == expected
+    # top() leaves the spill files alone; rows() merges them back in
+    assert engine._spill.has(engine._index(("user_id",)))
+    assert len(list(engine.rows(("user_id",)))) == 400
+    assert not engine._spill.has(engine._index(("user_id",)))
+
+
+def test_query_and_lookup_see_spilled_groups(check_often):
+    logs = _make_logs(2000)
+    unspilled = LogAggregator().add_many(logs)
+    spilled = LogAggregator(max_groups=30).add_many(logs)
+
+    assert spilled.query(["user_id"]) == unspilled.query(["user_id"])
+    assert spilled.rollups.lookup(("user_id",), ("user_0007",)) == unspilled.rollups.lookup(("user_id",), ("user_0007",))
+
+
+def test_merge_and_pickle(check_often):
+    logs = _make_logs(3000)
+    expected = LogAggregator().add_many(logs[:1500])
+    expected.merge(LogAggregator().add_many(logs[1500:]))
+
+    merged = LogAggregator(max_groups=40).add_many(logs[:1500])
+    merged.merge(LogAggregator(max_groups=40).add_many(logs[1500:]))
+    rows = list(merged.rollups.rows(("user_id",)))
+    expected_rows = list(expected.rollups.rows(("user_id",)))
+    assert [values for values, _ in rows] == [values for values, _ in expected_rows]
+    for (_, measures), (_, expected_measures) in zip(rows, expected_rows):
+        # Spilled partial sums are added in a different order
+        assert measures == pytest.approx(expected_measures)
+
+    restored = pickle.loads(pickle.dumps(LogAggregator(max_groups=40).add_many(logs)))
+    assert restored.rollups._spill is None
+    assert main._build_report(restored, ["top_users"]) == main._build_report(LogAggregator().add_many(logs), ["top_users"])
+
+
+def test_spill_files_removed(check_often, tmp_path):
+    engine = RollupEngine(max_groups=20, spill_directory=str(tmp_path))
+    state = LogAggregator()
+    state.rollups = engine
+    state.add_many(_make_logs(1000))
+
+    assert engine.spill_stats()["spills"] > 0
+    assert os.listdir(tmp_path)
+    engine.close()
+    assert not os.listdir(tmp_path)
+
+
+def test_disabled_by_default():
+    engine = LogAggregator().add_many(_make_logs(500)).rollups
+    assert engine.max_groups == 0
+    assert engine.spill_stats()["spills"] == 0
@@ -0,0 +1,66 @@
+"""
+Cold-start import budget for serverless use
+Run: pytest test_startup.py -v
+     python test_startup.py   (prints the slowest imports)
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative `import main` time, about twice the ~6-10 ms it takes today
+STARTUP_BUDGET_MS = 20
+
+DETECTOR_MODULES = {"advanced_features.anomaly_detection", "advanced_features.rate_limiting"}
+# Only needed once rollups spill to disk
+SPILL_MODULES = {"shutil", "tempfile"}
+
+
+def _import_times(code="import main"):
+    """Run code in a fresh interpreter under -X importtime; return {module: cumulative microseconds}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_import_main_within_budget():
+    # Best of three runs to keep a noisy machine from failing the budget
+    best = min(_import_times()["main"] for _ in range(3))
+    assert best / 1000 < STARTUP_BUDGET_MS, f"import main took {best / 1000:.1f} ms (budget {STARTUP_BUDGET_MS} ms)"
+
+
+def test_heavy_modules_not_imported_on_cold_start():
+    modules = _import_times()
+
+    assert "typing" not in modules
+    assert not DETECTOR_MODULES & set(modules)
+    assert not SPILL_MODULES & set(modules)
+
+
+def test_summary_only_report_skips_optional_sections():
+    code = (
+        "import main\n"
+        "log = {'timestamp': '2025-01-15T10:00:00Z', 'endpoint': '/a', 'method': 'GET', 'response_time_ms': 5,"
+        " 'status_code': 200, 'user_id': 'u', 'request_size_bytes': 1, 'response_size_bytes': 1}\n"
+        "assert main.analyze_api_logs([log], sections=['summary'])['summary']['total_requests'] == 1\n"
+    )
+    modules = _import_times(code)
+
+    assert "typing" not in modules
+    assert not (DETECTOR_MODULES | SPILL_MODULES) & set(modules)
+
+
+if __name__ == "__main__":
+    times = _import_times()
+    print(f"import main: {times['main'] / 1000:.1f} ms (budget {STARTUP_BUDGET_MS} ms)")
+    for module, micros in sorted(times.items(), key=lambda item: -item[1])[:15]:
+        print(f"{micros / 1000:8.1f} ms  {module}")
@@ -0,0 +1,80 @@
+"""
+Tests for per-endpoint status-code distributions
+Run: pytest test_status_codes.py -v
+"""
+import os
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+import utils
+from main import analyze_api_logs
+from aggregator import LogAggregator
+from rollups import StatusCodeHistogram
+
+CODES = [200, 200, 201, 204, 301, 304, 400, 404, 429, 500, 503, 101]
+
+
+def _make_logs(count):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    endpoints = ["/api/users", "/api/products", "/api/payments"]
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * 4)).isoformat() + "Z",
+            "endpoint": endpoints[i % 3],
+            "method": "GET",
+            "response_time_ms": 100 + i % 50,
+            "status_code": CODES[(i * 7) % len(CODES)] if i % 3 else 200,
+            "user_id": f"user_{i % 13:03d}",
+            "request_size_bytes": 100,
+            "response_size_bytes": 500
+        }
+        for i in range(count)
+    ]
+
+
+def test_distribution_matches_brute_force():
+    logs = _make_logs(1200)
+    report = analyze_api_logs(logs)["status_codes"]
+
+    expected = Counter(str(log["status_code"]) for log in logs)
+    assert report["by_code"] == dict(sorted(expected.items()))
+    assert report["by_class"] == {
+        f"{c}xx": sum(1 for log in logs if log["status_code"] // 100 == c) for c in range(1, 6)
+    }
+
+    users = next(row for row in report["by_endpoint"] if row["endpoint"] == "/api/users")
+    user_logs = [log for log in logs if log["endpoint"] == "/api/users"]
+    assert users["request_count"] == len(user_logs)
+    assert users["by_code"] == dict(sorted(Counter(str(log["status_code"]) for log in user_logs).items()))
+
+
+def test_merged_shards_equal_single_pass():
+    logs = _make_logs(900)
+    single = LogAggregator().add_many(logs)
+    merged = LogAggregator().add_many(logs[:300])
+    merged.merge(LogAggregator().add_many(logs[300:]))
+
+    for endpoint, histogram in single.status_codes.items():
+        assert merged.status_codes[endpoint].counts == histogram.counts
+
+
+def test_most_common_and_integral_floats():
+    histogram = StatusCodeHistogram()
+    for code in (503, 404, 404.0, 503):
+        histogram.add(code)
+    histogram.add(200, 0)
+
+    # Tie between 404 and 503: lowest code wins
+    assert histogram.most_common() == 404
+    assert histogram.codes() == {"404": 2, "503": 2}
+    assert StatusCodeHistogram().most_common() is None
+
+
+def test_error_lookup_table_matches_config():
+    for code in range(-5, 700):
+        assert utils.is_error_status(code) == (code in config.ERROR_STATUS_CODES)
+    assert utils.is_error_status(500.0)
+    assert not utils.is_error_status(500.5)
@@ -0,0 +1,95 @@
+"""
+Tests for the SQLite log store
+Run: pytest test_storage.py -v
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import analyze_api_logs
+from storage import SQLiteLogStore
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data")
+
+
+def _make_logs(count):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    endpoints = ["/api/users", "/api/products", "/api/payments"]
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * 11)).isoformat() + "Z",
+            "endpoint": endpoints[i % 3],
+            "method": "GET" if i % 4 else "POST",
+            "response_time_ms": 30 + (i * 41) % 1200,
+            "status_code": [200, 404, 500, 503][i % 4] if i % 9 == 0 else 200,
+            "user_id": f"user_{i % 13:03d}",
+            "request_size_bytes": 512,
+            "response_size_bytes": (i * 97) % 20000
+        }
+        for i in range(count)
+    ]
+
+
+def test_report_matches_in_memory_analysis():
+    logs = _make_logs(800)
+    with SQLiteLogStore() as store:
+        store.ingest(logs, batch_size=100)
+        assert store.report() == analyze_api_logs(logs)
+
+
+def test_window_and_sections_pushed_down():
+    with open(os.path.join(DATA_DIR, "sample_medium.json")) as f:
+        logs = json.load(f)
+    start, end = "2025-01-15T10:15:00Z", "2025-01-15T10:45:00Z"
+
+    with SQLiteLogStore() as store:
+        store.ingest(logs)
+        report = store.report(start, end, sections=["summary", "endpoint_stats", "cost_analysis"])
+
+    expected = analyze_api_logs(logs, start, end)
+    assert sorted(report) == ["cost_analysis", "endpoint_stats", "summary"]
+    for section in report:
+        assert report[section] == expected[section]
+
+
+def test_invalid_records_rejected_and_file_persists(tmp_path):
+    logs = _make_logs(50)
+    logs[3] = {"endpoint": "/api/users"}
+    path = str(tmp_path / "logs.db")
+
+    with SQLiteLogStore(path) as store:
+        assert store.ingest(logs) == {"inserted": 49, "rejected": 1}
+    with SQLiteLogStore(path) as store:
+        assert store.count() == 49
+        assert store.report(sections=["summary"])["summary"]["total_requests"] == 49
+
+
+def test_empty_store_returns_empty_report():
+    with SQLiteLogStore() as store:
+        assert store.report() == analyze_api_logs([])
+
+
+def test_naive_timestamps_are_utc_in_any_local_zone(monkeypatch):
+    if not hasattr(time, "tzset"):
+        return
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        logs = _make_logs(400)
+        for log in logs:
+            log["timestamp"] = log["timestamp"].rstrip("Z")
+        start, end = datetime(2025, 1, 15, 10, 20), datetime(2025, 1, 15, 11, 0)
+
+        with SQLiteLogStore() as store:
+            store.ingest(logs)
+            report = store.report(start, end, sections=["summary", "endpoint_stats"])
+
+        expected = analyze_api_logs(logs, start, end, sections=["summary", "endpoint_stats"])
+        assert report == expected
+        assert report["summary"]["total_requests"] == 218
+    finally:
+        monkeypatch.delenv("TZ")
+        time.tzset()
@@ -0,0 +1,114 @@
+"""
+Tests for HyperLogLog distinct-user counts
+Run: pytest test_unique_users.py -v
+"""
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import analyze_api_logs
+from aggregator import LogAggregator
+from advanced_features.unique_users import HyperLogLog, UniqueUserCounter
+
+
+def _make_logs(count, users):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    endpoints = ["/api/users", "/api/products", "/api/payments"]
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * 3)).isoformat() + "Z",
+            "endpoint": endpoints[i % 3],
+            "method": "GET",
+            "response_time_ms": 100,
+            "status_code": 200,
+            "user_id": f"user_{(i * 7919) % users:06d}",
+            "request_size_bytes": 100,
+            "response_size_bytes": 100
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("precision", [10, 12, 14])
+def test_estimate_within_error_bound(precision):
+    sketch = HyperLogLog(precision)
+    for i in range(50000):
+        sketch.add(f"user_{i}")
+        sketch.add(f"user_{i // 2}")
+
+    # Four standard errors
+    assert abs(sketch.estimate() - 50000) <= 4 * sketch.relative_error * 50000
+
+
+def test_small_counts_use_linear_counting():
+    sketch = HyperLogLog()
+    for i in range(200):
+        sketch.add(f"user_{i % 37}")
+    # Only a register collision can lose a user at this size
+    assert 35 <= sketch.estimate() <= 37
+
+
+def test_merged_shards_equal_single_pass():
+    logs = _make_logs(3000, users=700)
+    single = LogAggregator(sections=["unique_users"]).add_many(logs)
+    merged = LogAggregator(sections=["unique_users"]).add_many(logs[:1000])
+    merged.merge(LogAggregator(sections=["unique_users"]).add_many(logs[1000:]))
+
+    assert merged.unique_users.overall.registers == single.unique_users.overall.registers
+    for endpoint, sketch in single.unique_users.by_endpoint.items():
+        assert merged.unique_users.by_endpoint[endpoint].registers == sketch.registers
+
+
+def test_trackers_built_only_for_their_sections():
+    logs = _make_logs(300, users=50)
+    plain = LogAggregator().add_many(logs)
+    assert plain.unique_users is None and plain.rate_limit_detector is None
+    # The default report reads the anomaly detector
+    assert plain.anomaly_detector is not None
+    assert LogAggregator(sections=["summary"]).anomaly_detector is None
+
+    # A merge target without the tracker takes it over from the shard
+    plain.merge(LogAggregator(sections=["unique_users"]).add_many(logs))
+    assert plain.unique_users.overall.registers == LogAggregator(sections=["unique_users"]).add_many(logs).unique_users.overall.registers
+
+
+def test_checkpoint_round_trip_is_compact():
+    counter = UniqueUserCounter()
+    for i in range(50):
+        counter.add(f"user_{i}", "/api/users", 1736935200 + i * 60)
+
+    data = json.loads(json.dumps(counter.to_dict()))
+    restored = UniqueUserCounter.from_dict(data)
+
+    assert restored.overall.registers == counter.overall.registers
+    assert list(restored.by_bucket) == list(counter.by_bucket)
+    # 4 KiB of registers as a few hundred characters
+    assert len(data["overall"]["registers"]) < 300
+
+    # Resuming from a checkpoint is the same as never stopping
+    for target in (restored, counter):
+        for i in range(40, 90):
+            target.add(f"user_{i}", "/api/products", 1736935200 + i * 60)
+    assert restored.to_dict() == counter.to_dict()
+
+
+def test_mismatched_precision_rejected():
+    with pytest.raises(ValueError):
+        HyperLogLog(10).merge(HyperLogLog(12))
+    with pytest.raises(ValueError):
+        HyperLogLog(3)
+
+
+def test_report_section():
+    logs = _make_logs(1200, users=120)
+    report = analyze_api_logs(logs, sections=["unique_users"])["unique_users"]
+
+    assert abs(report["total"] - 120) <= 3
+    assert report["relative_error_percentage"] == 1.6
+    assert {row["endpoint"] for row in report["by_endpoint"]} == {"/api/users", "/api/products", "/api/payments"}
+    assert [row["bucket_start"] for row in report["by_time_bucket"]] == ["2025-01-15T10:00:00Z"]
+    assert "unique_users" not in analyze_api_logs(logs)
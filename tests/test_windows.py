@@ -0,0 +1,99 @@
+"""
+Tests for single-pass multi-window analysis
+Run: pytest test_windows.py -v
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import analyze_api_logs, analyze_windows
+from windows import WindowIndex
+
+
+def _make_logs(count):
+    base = datetime(2025, 1, 15, 10, 0, 0)
+    endpoints = ["/api/users", "/api/products", "/api/payments"]
+    return [
+        {
+            "timestamp": (base + timedelta(seconds=i * 20)).isoformat() + "Z",
+            "endpoint": endpoints[i % 3] if i < count // 2 else endpoints[i % 3] + "/v2",
+            "method": "GET" if i % 4 else "PUT",
+            "response_time_ms": 40 + (i * 29) % 800 + (300 if i > count // 2 else 0),
+            "status_code": 500 if i % 17 == 0 else 200,
+            "user_id": f"user_{i % 9:03d}",
+            "request_size_bytes": 200,
+            "response_size_bytes": (i * 83) % 12000
+        }
+        for i in range(count)
+    ]
+
+
+def test_each_window_matches_separate_analysis():
+    logs = _make_logs(900)
+    windows = [
+        ("2025-01-15T10:00:00Z", "2025-01-15T12:00:00Z"),
+        ("2025-01-15T11:00:00Z", "2025-01-15T13:00:00Z"),
+        # Shares a bound with the first window; bounds are inclusive
+        ("2025-01-15T12:00:00Z", "2025-01-15T12:00:00Z"),
+        ("2025-01-16T00:00:00Z", "2025-01-16T01:00:00Z")
+    ]
+
+    result = analyze_windows(logs, windows)
+
+    assert len(result["windows"]) == 4
+    for (start, end), window in zip(windows, result["windows"]):
+        assert window["start"] == start
+        assert window["report"] == analyze_api_logs(logs, start, end)
+    assert result["windows"][2]["report"]["summary"]["total_requests"] == 1
+
+
+def test_window_index_matches_brute_force():
+    rng = random.Random(7)
+    base = datetime(2025, 1, 15, tzinfo=timezone.utc)
+    windows = []
+    for _ in range(200):
+        start = base + timedelta(minutes=rng.randint(0, 1000))
+        windows.append((start, start + timedelta(minutes=rng.randint(0, 120))))
+    index = WindowIndex(windows)
+
+    probes = [base + timedelta(minutes=m) for m in range(-5, 1200)]
+    probes += [start for start, _ in windows] + [end for _, end in windows]
+    for t in probes:
+        expected = tuple(i for i, (start, end) in enumerate(windows) if start <= t <= end)
+        assert index.lookup(t) == expected
+
+
+def test_diff_between_consecutive_windows():
+    logs = _make_logs(600)
+    result = analyze_windows(logs, [
+        ("2025-01-15T10:00:00Z", "2025-01-15T10:59:59Z"),
+        ("2025-01-15T11:40:00Z", "2025-01-15T12:39:59Z")
+    ], sections=["summary"])
+
+    (diff,) = result["diff"]
+    before = result["windows"][0]["report"]["summary"]
+    after = result["windows"][1]["report"]["summary"]
+    overall = diff["overall"]
+    assert overall["request_count"]["before"] == before["total_requests"]
+    assert overall["avg_response_time_ms"]["after"] == after["avg_response_time_ms"]
+    assert overall["avg_response_time_ms"]["change"] > 0
+
+    # Only the second window saw the /v2 endpoints
+    new_endpoint = diff["endpoints"]["/api/users/v2"]
+    assert new_endpoint["request_count"]["before"] == 0
+    assert new_endpoint["request_count"]["change_percentage"] is None
+    assert diff["endpoints"]["/api/users"]["request_count"]["after"] == 0
+
+
+@pytest.mark.parametrize("windows", [
+    [("2025-01-15T12:00:00Z",)],
+    [("2025-01-15T12:00:00Z", "2025-01-15T10:00:00Z")],
+    [("yesterday", "today")]
+])
+def test_malformed_windows_rejected(windows):
+    with pytest.raises(ValueError):
+        analyze_windows(_make_logs(10), windows)
@@ -1,9 +1,24 @@
-from datetime import datetime
-from typing import Any, Dict, List
+from __future__ import annotations
+from datetime import datetime, timezone
 import config
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, List
+
+
+# One flag per status code up to 599, so the per-record error check is a single index
+_ERROR_STATUS_TABLE = tuple(
+    code in config.ERROR_STATUS_CODES for code in range(config.STATUS_CODE_BASE + config.STATUS_CODE_SLOTS)
+)
 
 
 def is_error_status(status_code: int) -> bool:
+    try:
+        if status_code >= 0:
+            return _ERROR_STATUS_TABLE[status_code]
+    except (IndexError, TypeError):
+        # Out of range or not an int (e.g. 404.0): fall back to the set
+        pass
     return status_code in config.ERROR_STATUS_CODES
 
 
@@ -28,6 +43,20 @@ def parse_timestamp(timestamp_str: str) -> datetime:
         raise ValueError(f"Invalid timestamp format: {timestamp_str}") from e
 
 
+def as_utc(value: Any) -> datetime:
+    """Parse an ISO timestamp (or take a datetime) as an aware datetime; naive values are taken as UTC."""
+    if not isinstance(value, datetime):
+        value = parse_timestamp(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def format_timestamp(epoch_seconds: float) -> str:
+    """Format epoch seconds as an ISO UTC timestamp with a trailing 'Z'."""
+    return datetime.fromtimestamp(epoch_seconds, tz=timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
 def get_hour_key(timestamp_str: str) -> str:
   
     dt = parse_timestamp(timestamp_str)
@@ -68,15 +97,11 @@ def validate_log_entry(log: Dict[str, Any]) -> bool:
 
 
 def calculate_severity(value: float, thresholds: Dict[str, float]) -> str:
-    
-    if value > thresholds.get("critical", float('inf')):
-        return "critical"
-    elif value > thresholds.get("high", float('inf')):
-        return "high"
-    elif value > thresholds.get("medium", float('inf')):
-        return "medium"
-    else:
-        return "low"
+
+    for level in config.SEVERITY_LEVELS:
+        if level in thresholds and value > thresholds[level]:
+            return level
+    return "low"
 
 
 def safe_divide(numerator: float, denominator: float, default: float = 0.0) -> float:
@@ -0,0 +1,132 @@
+from __future__ import annotations
+from bisect import bisect_left
+from datetime import datetime
+import config
+import utils
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional, Sequence, Tuple
+    from aggregator import LogAggregator
+
+# Metrics compared between consecutive windows
+DIFF_METRICS = ("request_count", "avg_response_time_ms", "error_rate_percentage", "total_cost_usd")
+
+
+def parse_windows(windows: Sequence[Tuple[Any, Any]]) -> List[Tuple[datetime, datetime]]:
+    """
+    Parse (start, end) pairs, raising ValueError for malformed or inverted windows.
+    """
+    parsed = []
+    for window in windows:
+        try:
+            start, end = window
+        except (TypeError, ValueError):
+            raise ValueError(f"Window must be a (start, end) pair: {window!r}") from None
+        start = start if isinstance(start, datetime) else utils.parse_timestamp(start)
+        end = end if isinstance(end, datetime) else utils.parse_timestamp(end)
+        if start > end:
+            raise ValueError(f"Window starts after it ends: {window!r}")
+        parsed.append((start, end))
+    return parsed
+
+
+class WindowIndex:
+    """
+    Maps a timestamp to every window containing it with one bisect.
+
+    The window bounds split the timeline into elementary pieces: each bound
+    itself and the open gap between two consecutive bounds. A sweep over the
+    sorted bounds records which windows cover each piece, so the cost of a
+    lookup does not grow with the number of windows. Bounds are inclusive,
+    as in analyze_api_logs.
+    """
+
+    def __init__(self, windows: Sequence[Tuple[datetime, datetime]]):
+        starts: Dict[datetime, List[int]] = {}
+        ends: Dict[datetime, List[int]] = {}
+        for i, (start, end) in enumerate(windows):
+            starts.setdefault(start, []).append(i)
+            ends.setdefault(end, []).append(i)
+
+        self.windows = list(windows)
+        self.points = sorted(set(starts) | set(ends))
+        self.at_point: List[Tuple[int, ...]] = []
+        self.in_gap: List[Tuple[int, ...]] = [()]
+        active = set()
+        for point in self.points:
+            active.update(starts.get(point, ()))
+            self.at_point.append(tuple(sorted(active)))
+            active.difference_update(ends.get(point, ()))
+            self.in_gap.append(tuple(sorted(active)))
+
+    def lookup(self, timestamp: datetime) -> Tuple[int, ...]:
+        """Indexes of the windows containing timestamp, in window order."""
+        try:
+            i = bisect_left(self.points, timestamp)
+        except TypeError:
+            # Naive vs aware timestamps: analyze_api_logs keeps such records
+            return tuple(range(len(self.windows)))
+        if i < len(self.points) and self.points[i] == timestamp:
+            return self.at_point[i]
+        return self.in_gap[i]
+
+
+def _window_metrics(measures: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    if measures is None or not measures["request_count"]:
+        return {metric: 0 for metric in DIFF_METRICS}
+    count = measures["request_count"]
+    return {
+        "request_count": count,
+        "avg_response_time_ms": round(measures["response_time_sum"] / count, 1),
+        "error_rate_percentage": round(measures["error_count"] * 100 / count, 1),
+        "total_cost_usd": round(
+            count * config.COST_STRUCTURE["per_request"] + measures["execution_cost"] + measures["memory_cost"], 4
+        )
+    }
+
+
+def _metric_changes(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, Dict[str, Any]]:
+    changes = {}
+    for metric in DIFF_METRICS:
+        old, new = before[metric], after[metric]
+        changes[metric] = {
+            "before": old,
+            "after": new,
+            "change": round(new - old, 4),
+            "change_percentage": round((new - old) * 100 / old, 1) if old else None
+        }
+    return changes
+
+
+def compare_windows(states: Sequence[LogAggregator]) -> List[Dict[str, Any]]:
+    """
+    Compact diff of key metrics between each window and the one before it.
+
+    Returns:
+        One entry per consecutive pair with overall and per-endpoint changes
+        in request count, average response time, error rate and cost
+    """
+    diffs = []
+    for i in range(1, len(states)):
+        before, after = states[i - 1], states[i]
+        endpoints = [values[0] for values, _ in before.rollups.rows(("endpoint",))]
+        endpoints += [
+            values[0] for values, _ in after.rollups.rows(("endpoint",))
+            if before.rollups.lookup(("endpoint",), values) is None
+        ]
+        diffs.append({
+            "from_window": i - 1,
+            "to_window": i,
+            "overall": _metric_changes(
+                _window_metrics(before.rollups.totals()),
+                _window_metrics(after.rollups.totals())
+            ),
+            "endpoints": {
+                endpoint: _metric_changes(
+                    _window_metrics(before.rollups.lookup(("endpoint",), (endpoint,))),
+                    _window_metrics(after.rollups.lookup(("endpoint",), (endpoint,)))
+                )
+                for endpoint in endpoints
+            }
+        })
+    return diffs